@@ -42,14 +42,123 @@ GHBEARER = os.environ.get("GHBEARER", '')
 GENURL = os.environ.get("GENURL", '')
 GHBRANCH = os.environ.get("GHBRANCH",'master')
 ZIP_PASSWORD = os.environ.get("ZIP_PASSWORD",'insecure')
+# compression inside the encrypted secrets zip: stored, deflate or lzma
+SECRETS_ZIP_COMPRESSION = os.environ.get("SECRETS_ZIP_COMPRESSION", "deflate")
 PROTOCOL = os.environ.get("PROTOCOL", 'https')
 REPONAME = os.environ.get("REPONAME", 'dce')
+# GitHub Enterprise, or the stub "manage.py bench_load" starts
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
 
 LOCAL_BUILD = os.environ.get("LOCAL_BUILD", "false").lower() in ("1", "true", "yes")
 LOCAL_BUILD_PLATFORM = os.environ.get("LOCAL_BUILD_PLATFORM", "windows")
 LOCAL_BUILD_RUSTDESK_SRC = os.environ.get("RUSTDESK_SRC", "")
 LOCAL_BUILD_WORKTREE_ROOT = os.environ.get("LOCAL_BUILD_WORKTREE_ROOT", "")
 LOCAL_BUILD_LOG_DIR = os.environ.get("LOCAL_BUILD_LOG_DIR", "")
+# "manage.py localbuildd" runs at most LOCAL_BUILD_WORKERS builds at once and
+# kills builds that run longer than LOCAL_BUILD_TIMEOUT seconds
+LOCAL_BUILD_WORKERS = int(os.environ.get("LOCAL_BUILD_WORKERS", "1"))
+LOCAL_BUILD_TIMEOUT = int(os.environ.get("LOCAL_BUILD_TIMEOUT", str(2 * 3600)))
+# reuse per-version worktrees (local_builds/warm/<version>-<slot>) so cargo and
+# flutter rebuild incrementally; keep at least LOCAL_BUILD_WORKERS slots
+LOCAL_BUILD_WARM = os.environ.get("LOCAL_BUILD_WARM", "true").lower() in ("1", "true", "yes")
+LOCAL_BUILD_WARM_SLOTS = int(os.environ.get("LOCAL_BUILD_WARM_SLOTS", str(LOCAL_BUILD_WORKERS)))
+# compiled base builds kept in local_builds/base, keyed by version and the
+# options that change the binary; branding-only changes reuse them
+LOCAL_BUILD_BASE_CACHE_SIZE = int(os.environ.get("LOCAL_BUILD_BASE_CACHE_SIZE", "10"))
+# venvs for libs/portable (local_builds/cache/pip) and pub caches
+# (local_builds/cache/pub) kept per requirements.txt / pubspec.lock hash
+LOCAL_BUILD_DEP_CACHE_SIZE = int(os.environ.get("LOCAL_BUILD_DEP_CACHE_SIZE", "3"))
+# "manage.py localbuildd" keeps a bare mirror of RUSTDESK_SRC's upstream in
+# local_builds/mirror.git, fetched every LOCAL_BUILD_MIRROR_INTERVAL seconds,
+# and builds resolve versions from its ref index; 0 builds from RUSTDESK_SRC
+LOCAL_BUILD_MIRROR_INTERVAL = int(os.environ.get("LOCAL_BUILD_MIRROR_INTERVAL", "600"))
+# seconds between host CPU / RSS samples of each build subprocess (needs psutil
+# on the build host, 0 turns sampling off); see "manage.py phase_report"
+LOCAL_BUILD_SAMPLE_INTERVAL = float(os.environ.get("LOCAL_BUILD_SAMPLE_INTERVAL", "5"))
+
+# backend new builds go to: github, local (LOCAL_BUILD) or simulated, which
+# plays a workflow run in-process against this server for load tests
+BUILD_BACKEND = os.environ.get("BUILD_BACKEND", "local" if LOCAL_BUILD else "github")
+SIMULATED_BUILD_SECONDS = float(os.environ.get("SIMULATED_BUILD_SECONDS", "30"))
+SIMULATED_BUILD_JITTER = float(os.environ.get("SIMULATED_BUILD_JITTER", "0.2"))
+SIMULATED_FAILURE_RATE = float(os.environ.get("SIMULATED_FAILURE_RATE", "0"))
+SIMULATED_ARTIFACT_BYTES = int(os.environ.get("SIMULATED_ARTIFACT_BYTES", str(1024 * 1024)))
+# where simulated runs call back to, defaults to the url the build was submitted on
+SIMULATED_CALLBACK_URL = os.environ.get("SIMULATED_CALLBACK_URL", "")
+
+BUILD_CACHE_ENABLED = os.environ.get("BUILD_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+BUILD_CACHE_DIR = os.environ.get("BUILD_CACHE_DIR", str(BASE_DIR / "build_cache"))
+BUILD_CACHE_MAX_BYTES = int(os.environ.get("BUILD_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+BUILD_CACHE_MAX_ENTRIES = int(os.environ.get("BUILD_CACHE_MAX_ENTRIES", "500"))
+BUILD_CACHE_MASTER_MAX_AGE = int(os.environ.get("BUILD_CACHE_MASTER_MAX_AGE", "86400"))
+
+# icon sets rendered at upload time, one folder per source image hash
+ICON_ASSETS_DIR = os.environ.get("ICON_ASSETS_DIR", str(BASE_DIR / "icon_assets"))
+
+# hand artifact downloads to the reverse proxy, e.g. DOWNLOAD_ACCEL_REDIRECT=/protected
+# for an nginx "internal" location aliased to BASE_DIR, or DOWNLOAD_X_SENDFILE=true
+DOWNLOAD_ACCEL_REDIRECT = os.environ.get("DOWNLOAD_ACCEL_REDIRECT", "")
+DOWNLOAD_X_SENDFILE = os.environ.get("DOWNLOAD_X_SENDFILE", "false").lower() in ("1", "true", "yes")
+
+# /build_status holds each request up to the timeout, keep it below the gunicorn timeout
+STATUS_LONGPOLL_TIMEOUT = float(os.environ.get("STATUS_LONGPOLL_TIMEOUT", "20"))
+STATUS_LONGPOLL_INTERVAL = float(os.environ.get("STATUS_LONGPOLL_INTERVAL", "1"))
+
+# status cache in front of the GithubRun polls (rdgenerator/statuscache.py).
+# "file" is shared by the gunicorn workers; "locmem" is per process, so other
+# workers see an update only after STATUS_CACHE_TTL; "redis" needs the redis
+# package and CACHE_LOCATION=redis://host:6379
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "file")
+_CACHE_BACKENDS = {
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", str(BASE_DIR / "status_cache")),
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "dce-status"),
+    "redis": ("django.core.cache.backends.redis.RedisCache", "redis://127.0.0.1:6379"),
+}
+CACHES = {
+    "default": {
+        "BACKEND": _CACHE_BACKENDS[CACHE_BACKEND][0],
+        "LOCATION": os.environ.get("CACHE_LOCATION", _CACHE_BACKENDS[CACHE_BACKEND][1]),
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", "10000"))} if CACHE_BACKEND != "redis" else {},
+    }
+}
+STATUS_CACHE_ALIAS = "default"
+STATUS_CACHE_TTL = int(os.environ.get("STATUS_CACHE_TTL", "30"))
+STATUS_CACHE_TERMINAL_TTL = int(os.environ.get("STATUS_CACHE_TERMINAL_TTL", "3600"))
+STATUS_CACHE_LOCK_TTL = float(os.environ.get("STATUS_CACHE_LOCK_TTL", "2"))
+
+# GitHub workflow dispatches are queued in GithubRun and sent by a background
+# thread in each web process, or by "manage.py run_dispatcher" when
+# DISPATCH_WORKER_THREAD is off
+DISPATCH_WORKER_THREAD = os.environ.get("DISPATCH_WORKER_THREAD", "true").lower() in ("1", "true", "yes")
+DISPATCH_POLL_INTERVAL = float(os.environ.get("DISPATCH_POLL_INTERVAL", "5"))
+DISPATCH_CONNECT_TIMEOUT = float(os.environ.get("DISPATCH_CONNECT_TIMEOUT", "5"))
+DISPATCH_READ_TIMEOUT = float(os.environ.get("DISPATCH_READ_TIMEOUT", "30"))
+DISPATCH_MAX_ATTEMPTS = int(os.environ.get("DISPATCH_MAX_ATTEMPTS", "8"))
+DISPATCH_BACKOFF_BASE = float(os.environ.get("DISPATCH_BACKOFF_BASE", "2"))
+DISPATCH_BACKOFF_MAX = float(os.environ.get("DISPATCH_BACKOFF_MAX", "300"))
+DISPATCH_LEASE = int(os.environ.get("DISPATCH_LEASE", "120"))
+
+def _parse_slots(value):
+    slots = {}
+    for item in value.split(","):
+        name, sep, count = item.partition("=")
+        if sep and count.strip().isdigit():
+            slots[name.strip()] = int(count)
+    return slots
+
+# concurrent builds per backend, and optional per-platform caps e.g.
+# BUILD_PLATFORM_SLOTS="windows=2,macos=1"; queued builds wait for a free slot
+BUILD_SLOTS = {
+    "github": int(os.environ.get("BUILD_SLOTS_GITHUB", "4")),
+    "local": int(os.environ.get("BUILD_SLOTS_LOCAL", str(LOCAL_BUILD_WORKERS))),
+    "simulated": int(os.environ.get("BUILD_SLOTS_SIMULATED", "50")),
+}
+BUILD_PLATFORM_SLOTS = _parse_slots(os.environ.get("BUILD_PLATFORM_SLOTS", ""))
+# a started build that never reports a terminal status gives its slot back after this
+BUILD_SLOT_TIMEOUT = int(os.environ.get("BUILD_SLOT_TIMEOUT", str(3 * 3600)))
+SCHEDULER_SCAN = int(os.environ.get("SCHEDULER_SCAN", "200"))
+# upper bound on clients per /batch submission
+BATCH_MAX_MEMBERS = int(os.environ.get("BATCH_MAX_MEMBERS", "500"))
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -76,6 +185,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rdgenerator.middleware.UploadLimitMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -109,12 +219,59 @@ WSGI_APPLICATION = 'dce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default. WAL lets the status polls read while a gunicorn worker
+# writes, and IMMEDIATE transactions take the write lock up front so busy
+# writers wait out DB_TIMEOUT instead of failing with "database is locked".
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite").lower()
+DB_TIMEOUT = int(os.environ.get("DB_TIMEOUT", "20"))
+
+if DB_ENGINE in ("postgres", "postgresql"):
+    # needs psycopg installed
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get("DB_NAME", "dce"),
+            'USER': os.environ.get("DB_USER", ""),
+            'PASSWORD': os.environ.get("DB_PASSWORD", ""),
+            'HOST': os.environ.get("DB_HOST", ""),
+            'PORT': os.environ.get("DB_PORT", ""),
+            'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+            'OPTIONS': {
+                'connect_timeout': DB_TIMEOUT,
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get("DB_NAME", BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'timeout': DB_TIMEOUT,
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA busy_timeout=%d;' % (DB_TIMEOUT * 1000),
+            },
+        }
+    }
+
+# finished runs older than this are removed by `manage.py purge_runs`
+RUN_RETENTION_DAYS = int(os.environ.get("RUN_RETENTION_DAYS", "30"))
+
+# retention applied by "manage.py janitor", or every JANITOR_INTERVAL seconds by a
+# thread in the web processes (0 keeps the thread off). Ages are in days and
+# quotas in bytes, 0 disables a limit.
+JANITOR_INTERVAL = int(os.environ.get("JANITOR_INTERVAL", "0"))
+JANITOR_EXE_MAX_AGE_DAYS = float(os.environ.get("JANITOR_EXE_MAX_AGE_DAYS", "7"))
+JANITOR_EXE_MAX_BYTES = int(os.environ.get("JANITOR_EXE_MAX_BYTES", "0"))
+JANITOR_PNG_MAX_AGE_DAYS = float(os.environ.get("JANITOR_PNG_MAX_AGE_DAYS", "7"))
+# rendered icon sets no submission has used for this long
+JANITOR_ICON_ASSETS_MAX_AGE_DAYS = float(os.environ.get("JANITOR_ICON_ASSETS_MAX_AGE_DAYS", "30"))
+JANITOR_LOG_MAX_AGE_DAYS = float(os.environ.get("JANITOR_LOG_MAX_AGE_DAYS", "14"))
+# warm worktrees no build has claimed for this long
+JANITOR_WORKTREE_MAX_AGE_DAYS = float(os.environ.get("JANITOR_WORKTREE_MAX_AGE_DAYS", "14"))
+# seconds before an unreferenced secrets zip or an abandoned upload is removed
+JANITOR_ZIP_GRACE = int(os.environ.get("JANITOR_ZIP_GRACE", "3600"))
+JANITOR_UPLOAD_MAX_AGE = int(os.environ.get("JANITOR_UPLOAD_MAX_AGE", "86400"))
 
 
 # Password validation
@@ -158,4 +315,17 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-DATA_UPLOAD_MAX_MEMORY_SIZE = None
+# non-file form data (this includes iconbase64/logobase64) held in memory per request
+DATA_UPLOAD_MAX_MEMORY_SIZE = int(os.environ.get("DATA_UPLOAD_MAX_MEMORY_SIZE", str(16 * 1024 ** 2)))
+# request bodies above these are refused with 413 before they are read, see
+# rdgenerator.middleware.UploadLimitMiddleware
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(32 * 1024 ** 2)))
+# workflows upload the built clients here
+ARTIFACT_UPLOAD_MAX_BYTES = int(os.environ.get("ARTIFACT_UPLOAD_MAX_BYTES", str(4 * 1024 ** 3)))
+ARTIFACT_UPLOAD_PATHS = ("/save_custom_client", "/upload_chunk")
+# largest single PUT of a resumable upload
+UPLOAD_CHUNK_MAX_BYTES = int(os.environ.get("UPLOAD_CHUNK_MAX_BYTES", str(64 * 1024 ** 2)))
+
+# icon/logo uploads, checked from the image header before decoding
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(5 * 1024 ** 2)))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", str(4096 * 4096)))
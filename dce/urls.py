@@ -26,12 +26,24 @@ urlpatterns = [
     url(r'^$',views.generator_view),
     url(r'^generator',views.generator_view),
     url(r'^check_for_file',views.check_for_file),
+    url(r'^build_status',views.build_status),
     url(r'^download',views.download),
     url(r'^creategh',views.create_github_run),
     url(r'^updategh',views.update_github_run),
     url(r'^startgh',views.startgh),
     url(r'^get_png',views.get_png),
+    url(r'^icon_bundle',views.icon_bundle),
     url(r'^save_custom_client',views.save_custom_client),
+    url(r'^upload_start',views.upload_start),
+    url(r'^upload_status',views.upload_status),
+    url(r'^upload_chunk',views.upload_chunk),
+    url(r'^upload_commit',views.upload_commit),
     url(r'^get_zip',views.get_zip),
     url(r'^cleanzip',views.cleanup_secrets),
+    url(r'^cache_stats',views.cache_stats),
+    url(r'^build_phases',views.build_phases),
+    url(r'^cancel_build',views.cancel_build),
+    url(r'^batch_status',views.batch_status),
+    url(r'^matrix',views.matrix_view),
+    url(r'^batch',views.batch_generate),
 ]
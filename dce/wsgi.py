@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dce.settings')
 
 application = get_wsgi_application()
+
+# pick up dispatches queued before this worker process started
+from rdgenerator import dispatch, janitor  # noqa: E402
+dispatch.ensure_worker()
+janitor.ensure_worker()
@@ -3,6 +3,8 @@ import os
 # Adjust these values as needed
 bind = "0.0.0.0:8000"  # Host and port for Gunicorn to listen on
 workers = 3  # The number of worker processes for concurrency (adjust based on system resources)
+worker_class = "gthread"  # threaded workers so /build_status long-polls and downloads don't pin a whole process
+threads = 8  # Threads per worker process
 activate_base = True  # Activate your virtual environment if applicable
 
 # Path to your Django project's main WSGI application file (usually manage.py)
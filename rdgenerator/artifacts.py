@@ -0,0 +1,98 @@
+import os
+import threading
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.db import connection
+
+from .buildcache import file_digest
+from .models import Artifact
+
+OUTPUT_DIR = "exe"
+
+
+def _mtime(stat):
+    return datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc)
+
+
+def record(myuuid, path, sha256=None):
+    """Add exe/<uuid>/<name> to the manifest once it is completely written."""
+    path = Path(path)
+    stat = path.stat()
+    Artifact.objects.update_or_create(
+        run_uuid=myuuid,
+        name=path.name,
+        defaults={
+            "size": stat.st_size,
+            "sha256": sha256 if sha256 is not None else file_digest(path),
+            "mtime": _mtime(stat),
+        },
+    )
+
+
+def _fill_digests(myuuid, paths):
+    try:
+        for path in paths:
+            try:
+                digest = file_digest(path)
+            except FileNotFoundError:
+                continue
+            Artifact.objects.filter(run_uuid=myuuid, name=path.name, sha256="").update(sha256=digest)
+    except Exception as exc:
+        print(f"artifact digest error for {myuuid}: {exc}")
+    finally:
+        connection.close()
+
+
+def _hash_later(myuuid, paths):
+    threading.Thread(target=_fill_digests, args=(myuuid, paths), name=f"digest-{myuuid}", daemon=True).start()
+
+
+def record_dir(myuuid, digests=None):
+    """Scan one run's output dir and record files the manifest doesn't know yet.
+
+    Used for files that don't come through save_custom_client: cache restores and
+    local builds. digests maps names to known sha256s (a cache entry's manifest);
+    other new files are recorded right away and hashed in a background thread, so
+    a request never reads a few hundred MB. Files already recorded with the same
+    size and mtime are skipped. Returns the number of rows added or updated.
+    """
+    output_dir = Path(OUTPUT_DIR) / myuuid
+    if not output_dir.is_dir():
+        return 0
+    known = {
+        row["name"]: (row["size"], row["mtime"])
+        for row in Artifact.objects.filter(run_uuid=myuuid).values("name", "size", "mtime")
+    }
+    digests = digests or {}
+    changed = 0
+    unhashed = []
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if known.get(entry.name) == (stat.st_size, _mtime(stat)):
+                continue
+            record(myuuid, entry.path, digests.get(entry.name, ""))
+            if entry.name not in digests:
+                unhashed.append(Path(entry.path))
+            changed += 1
+    if unhashed:
+        _hash_later(myuuid, unhashed)
+    return changed
+
+
+def names(myuuid):
+    return sorted(Artifact.objects.filter(run_uuid=myuuid).values_list("name", flat=True))
+
+
+def exists(myuuid):
+    return Artifact.objects.filter(run_uuid=myuuid).exists()
+
+
+def forget(myuuid, name=None):
+    rows = Artifact.objects.filter(run_uuid=myuuid)
+    if name is not None:
+        rows = rows.filter(name=name)
+    rows.delete()
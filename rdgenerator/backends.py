@@ -0,0 +1,252 @@
+"""Build backends the scheduler in dispatch.py hands runs to.
+
+Each backend turns a submission into the (url, payload) stored on the queued
+run, starts the build once the run gets a slot, and can cancel it or report
+on it. BUILD_BACKEND picks the one new submissions use:
+
+- github: dispatches the generator workflows through the GitHub API
+- local: hands the run to "manage.py localbuildd" (Windows only)
+- simulated: a thread in this process that behaves like a workflow run, for
+  load tests without GitHub
+"""
+import io
+import json
+import os
+import random
+import signal
+import subprocess
+import threading
+
+import pyzipper
+import requests
+from django.conf import settings as _settings
+
+from . import artifacts, dispatch, secretszip, statuscache
+from .models import GithubRun, set_run_status
+
+CANCELLED_STATUS = "生成已取消，请重试"
+
+
+class DispatchError(Exception):
+    def __init__(self, message, retryable=False, response=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.response = response
+
+
+class BuildBackend:
+    name = ""
+
+    def request(self, zip_filename, platform, version, filename, full_url, bundle_platform=None):
+        """Returns the (url, payload) to queue for a submission."""
+        raise NotImplementedError
+
+    def dispatch(self, run):
+        """Start the build of a run that got a slot, raises DispatchError when it can't."""
+        raise NotImplementedError
+
+    def cancel(self, run):
+        """Stop a started build, returns False when the backend can't."""
+        return False
+
+    def status(self, run):
+        row = statuscache.get(run.uuid)
+        return row["status"] if row else run.status
+
+    def artifacts(self, run):
+        return artifacts.names(run.uuid)
+
+
+def _is_retryable(response):
+    if response.status_code >= 500 or response.status_code == 429:
+        return True
+    # GitHub reports primary and secondary rate limits as 403
+    if response.status_code == 403:
+        return response.headers.get("X-RateLimit-Remaining") == "0" or "rate limit" in response.text.lower()
+    return False
+
+
+class GithubBackend(BuildBackend):
+    name = "github"
+
+    WORKFLOWS = {
+        "windows-x86": "generator-windows-x86.yml",
+        "linux": "generator-linux.yml",
+        "android": "generator-android.yml",
+        "macos": "generator-macos.yml",
+    }
+
+    def workflow_url(self, platform):
+        return dispatch.workflow_url(self.WORKFLOWS.get(platform, "generator-windows.yml"))
+
+    def request(self, zip_filename, platform, version, filename, full_url, bundle_platform=None):
+        zipJson = {}
+        zipJson['url'] = full_url
+        zipJson['file'] = zip_filename
+        if bundle_platform is not None:
+            # tells the workflow which entry of the shared bundle is its own
+            zipJson['platform'] = bundle_platform
+        data = {
+            "ref": _settings.GHBRANCH,
+            "inputs": {
+                "version": version,
+                "zip_url": json.dumps(zipJson)
+            }
+        }
+        return self.workflow_url(platform), data
+
+    def dispatch(self, run):
+        try:
+            response = dispatch._get_session().post(
+                run.dispatch_url,
+                json=json.loads(run.dispatch_payload),
+                timeout=(_settings.DISPATCH_CONNECT_TIMEOUT, _settings.DISPATCH_READ_TIMEOUT),
+            )
+        except requests.RequestException as exc:
+            raise DispatchError(f"dispatch failed: {exc.__class__.__name__}", retryable=True)
+        print(response)
+        if 200 <= response.status_code < 300:
+            return
+        error = f"dispatch failed: HTTP {response.status_code}"
+        if _settings.DEBUG_API_RESPONSE:
+            error = f"{error} {response.text}"
+        raise DispatchError(error, retryable=_is_retryable(response), response=response)
+
+    # a dispatch returns no workflow run id, so a started workflow can't be cancelled from here
+
+
+class LocalBackend(BuildBackend):
+    name = "local"
+
+    def request(self, zip_filename, platform, version, filename, full_url, bundle_platform=None):
+        return "", {
+            "zip_path": "%s/%s" % (secretszip.ZIP_DIR, zip_filename),
+            "filename": filename,
+            "platform": platform,
+            "full_url": full_url,
+            "version": version,
+        }
+
+    def dispatch(self, run):
+        # the slot is taken here, "manage.py localbuildd" claims the run and builds it
+        set_run_status(run.uuid, "waiting for local builder")
+
+    def cancel(self, run):
+        pid = GithubRun.objects.filter(pk=run.pk).values_list("build_pid", flat=True).first()
+        if not pid:
+            return False
+        # the pool started the script in its own process group
+        try:
+            if os.name == "nt":
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True)
+            else:
+                os.killpg(pid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            return False
+        # the dying build and the pool report failures, updategh and the pool
+        # leave runs in this state alone
+        GithubRun.objects.filter(pk=run.pk).update(dispatch_state="cancelled")
+        set_run_status(run.uuid, CANCELLED_STATUS)
+        return True
+
+
+class SimulatedBackend(GithubBackend):
+    """Plays a generator workflow run against this server without building anything.
+
+    Like the real workflows it fetches and decrypts the secrets zip, calls
+    /cleanzip, posts the same progress statuses to /updategh, uploads a dummy
+    artifact to /save_custom_client and reports success or failure.
+    """
+    name = "simulated"
+
+    PROGRESS = ("5%", "10%", "15%", "20%", "25%", "50%", "70%", "85%")
+    EXTENSIONS = {
+        "windows": (".exe", ".msi"),
+        "windows-x86": (".exe",),
+        "linux": ("-x86_64.deb",),
+        "android": ("-aarch64.apk",),
+        "macos": ("-aarch64.dmg",),
+    }
+
+    _cancelled = {}
+    _lock = threading.Lock()
+
+    def request(self, zip_filename, platform, version, filename, full_url, bundle_platform=None):
+        _, data = super().request(zip_filename, platform, version, filename, full_url, bundle_platform)
+        return "", data
+
+    def dispatch(self, run):
+        event = threading.Event()
+        with self._lock:
+            self._cancelled[run.uuid] = event
+        thread = threading.Thread(target=self._play, args=(run, event), name=f"simulated-{run.uuid}", daemon=True)
+        thread.start()
+
+    def cancel(self, run):
+        with self._lock:
+            event = self._cancelled.get(run.uuid)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+    def _play(self, run, cancelled):
+        try:
+            self._run_workflow(run, cancelled)
+        except Exception as exc:
+            print(f"simulated build {run.uuid} error: {exc}")
+        finally:
+            with self._lock:
+                self._cancelled.pop(run.uuid, None)
+
+    def _run_workflow(self, run, cancelled):
+        inputs = json.loads(run.dispatch_payload)["inputs"]
+        zip_url = json.loads(inputs["zip_url"])
+        base_url = _settings.SIMULATED_CALLBACK_URL or zip_url["url"]
+        http = requests.Session()
+
+        def post_status(status):
+            http.post(f"{base_url}/updategh", json={"uuid": myuuid, "status": status}, timeout=30)
+
+        response = http.get(f"{base_url}/get_zip", params={"filename": zip_url["file"]}, timeout=30)
+        response.raise_for_status()
+        with pyzipper.AESZipFile(io.BytesIO(response.content)) as zf:
+            zf.setpassword(_settings.ZIP_PASSWORD.encode())
+            secrets = json.loads(zf.read("secrets.json"))
+        secrets.update(secrets.pop("platforms", {}).get(zip_url.get("platform"), {}))
+        myuuid = secrets["uuid"]
+        http.post(f"{base_url}/cleanzip", json={"uuid": myuuid}, timeout=30)
+
+        duration = _settings.SIMULATED_BUILD_SECONDS * random.uniform(
+            1 - _settings.SIMULATED_BUILD_JITTER, 1 + _settings.SIMULATED_BUILD_JITTER
+        )
+        step = duration / (len(self.PROGRESS) + 1)
+        for progress in self.PROGRESS:
+            if cancelled.wait(step):
+                post_status(CANCELLED_STATUS)
+                return
+            post_status(f"{progress} 已完成，坐和放宽")
+        if cancelled.wait(step):
+            post_status(CANCELLED_STATUS)
+            return
+        if random.random() < _settings.SIMULATED_FAILURE_RATE:
+            post_status("生成失败，请重试")
+            return
+        payload = os.urandom(min(_settings.SIMULATED_ARTIFACT_BYTES, 1024 * 1024))
+        for extension in self.EXTENSIONS.get(run.platform, (".exe",)):
+            name = f"{secrets['filename']}{extension}"
+            body = payload * max(1, _settings.SIMULATED_ARTIFACT_BYTES // len(payload))
+            http.post(
+                f"{base_url}/save_custom_client",
+                data={"uuid": myuuid},
+                files={"file": (name, body)},
+                timeout=300,
+            )
+        post_status("成功！")
+
+
+BACKENDS = {backend.name: backend for backend in (GithubBackend(), LocalBackend(), SimulatedBackend())}
+
+
+def get_backend(name=None):
+    return BACKENDS[name or _settings.BUILD_BACKEND]
@@ -0,0 +1,221 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings as _settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Artifact, BuildCacheEntry
+
+# inputs that change on every submission without changing the built client
+VOLATILE_INPUTS = (
+    "uuid",
+    "iconlink_url",
+    "iconlink_uuid",
+    "logolink_url",
+    "logolink_uuid",
+    "genurl",
+)
+
+
+# inputs compiled into the binary, clients that only differ elsewhere can
+# share one compiled base; the local build script keys its bases by the same
+# fields (CODE_FIELDS in scripts/build_windows_local.py, tests check they match)
+CODE_INPUTS = (
+    "server",
+    "key",
+    "apiServer",
+    "appname",
+    "urlLink",
+    "downloadLink",
+    "delayFix",
+    "cycleMonitor",
+    "xOffline",
+    "removeNewVersionNotif",
+    "compname",
+    "androidappid",
+)
+
+
+def _entry_dir(fingerprint):
+    return Path(_settings.BUILD_CACHE_DIR) / fingerprint
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compute_fingerprint(platform, version, inputs_raw, icon_path=None, logo_path=None):
+    normalized = {k: v for k, v in inputs_raw.items() if k not in VOLATILE_INPUTS}
+    # custom is base64 json built from form fields, decode it so key order
+    # (e.g. from defaultManual/overrideManual) doesn't change the fingerprint
+    try:
+        normalized["custom"] = json.loads(base64.b64decode(normalized.get("custom", "")))
+    except ValueError:
+        pass
+    canonical = json.dumps(
+        {"platform": platform, "version": version, "inputs": normalized},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    digest = hashlib.sha256(canonical.encode("utf-8"))
+    for label, path in (("icon", icon_path), ("logo", logo_path)):
+        if path and os.path.isfile(path):
+            digest.update(f"{label}:{file_digest(path)}".encode("ascii"))
+        else:
+            digest.update(f"{label}:none".encode("ascii"))
+    return digest.hexdigest()
+
+
+def base_fingerprint(platform, version, inputs_raw, icon_path=None):
+    """Fingerprint of what gets compiled, ignoring branding applied after the build."""
+    normalized = {k: inputs_raw.get(k, "") for k in CODE_INPUTS}
+    if normalized["appname"].lower() != "rustdesk":
+        # the exe name ends up in Runner.rc once the app is renamed
+        normalized["filename"] = inputs_raw.get("filename", "")
+    canonical = json.dumps(
+        {"platform": platform, "version": version, "inputs": normalized},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    digest = hashlib.sha256(canonical.encode("utf-8"))
+    if icon_path and os.path.isfile(icon_path):
+        digest.update(f"icon:{file_digest(icon_path)}".encode("ascii"))
+    return digest.hexdigest()
+
+
+def _is_stale(entry):
+    # nightly builds move with the master branch, don't serve them forever
+    if entry.version != "master":
+        return False
+    max_age = timedelta(seconds=_settings.BUILD_CACHE_MASTER_MAX_AGE)
+    return timezone.now() - entry.created > max_age
+
+
+def _link_or_copy(src, dst):
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def restore(fingerprint, myuuid):
+    """Link a cached build into exe/<uuid>, returns the file names or None on a miss."""
+    if not _settings.BUILD_CACHE_ENABLED:
+        return None
+    entry = BuildCacheEntry.objects.filter(fingerprint=fingerprint, complete=True).first()
+    if not entry:
+        return None
+    source_dir = _entry_dir(fingerprint)
+    if _is_stale(entry) or not source_dir.is_dir():
+        discard(fingerprint)
+        return None
+    output_dir = Path("exe") / myuuid
+    output_dir.mkdir(parents=True, exist_ok=True)
+    names = []
+    for item in source_dir.iterdir():
+        if item.is_file():
+            _link_or_copy(item, output_dir / item.name)
+            names.append(item.name)
+    if not names:
+        discard(fingerprint)
+        return None
+    BuildCacheEntry.objects.filter(pk=entry.pk).update(hits=F("hits") + 1, last_used=timezone.now())
+    return names
+
+
+def digests(fingerprint):
+    """{file name: sha256} of a cached build, as recorded when it was finalized."""
+    manifest = BuildCacheEntry.objects.filter(fingerprint=fingerprint).values_list("manifest", flat=True).first()
+    return json.loads(manifest) if manifest else {}
+
+
+def record_miss(fingerprint, platform, version):
+    if not _settings.BUILD_CACHE_ENABLED:
+        return
+    entry, created = BuildCacheEntry.objects.get_or_create(
+        fingerprint=fingerprint,
+        defaults={"platform": platform, "version": version, "misses": 1},
+    )
+    if not created:
+        BuildCacheEntry.objects.filter(pk=entry.pk).update(misses=F("misses") + 1)
+
+
+def add_artifact(fingerprint, path):
+    """Stage an uploaded artifact in the cache entry, it is served once the run succeeds."""
+    if not _settings.BUILD_CACHE_ENABLED or not fingerprint:
+        return
+    entry_dir = _entry_dir(fingerprint)
+    entry_dir.mkdir(parents=True, exist_ok=True)
+    _link_or_copy(Path(path), entry_dir / Path(path).name)
+
+
+def finalize(fingerprint, myuuid):
+    """Mark the entry complete after a successful run and apply eviction."""
+    if not _settings.BUILD_CACHE_ENABLED or not fingerprint:
+        return
+    output_dir = Path("exe") / myuuid
+    if not output_dir.is_dir():
+        return
+    entry_dir = _entry_dir(fingerprint)
+    entry_dir.mkdir(parents=True, exist_ok=True)
+    # exe/<uuid> is the source of truth: local builds write there without
+    # save_custom_client, and a failed earlier run may have staged extra files
+    produced = {item.name for item in output_dir.iterdir() if item.is_file()}
+    for item in entry_dir.iterdir():
+        if item.name not in produced:
+            item.unlink()
+    for name in produced:
+        if not (entry_dir / name).exists():
+            _link_or_copy(output_dir / name, entry_dir / name)
+    size = sum(item.stat().st_size for item in entry_dir.iterdir() if item.is_file())
+    # digests the run already has, files still being hashed are left out
+    manifest = dict(
+        Artifact.objects.filter(run_uuid=myuuid, name__in=produced).exclude(sha256="").values_list("name", "sha256")
+    )
+    now = timezone.now()
+    BuildCacheEntry.objects.filter(fingerprint=fingerprint).update(
+        complete=True, size=size, created=now, last_used=now, manifest=json.dumps(manifest)
+    )
+    evict()
+
+
+def discard(fingerprint):
+    shutil.rmtree(_entry_dir(fingerprint), ignore_errors=True)
+    BuildCacheEntry.objects.filter(fingerprint=fingerprint).update(complete=False, size=0)
+
+
+def evict():
+    """Drop least recently used entries until the cache fits its size and count limits."""
+    complete = BuildCacheEntry.objects.filter(complete=True)
+    total = complete.aggregate(total=Sum("size"))["total"] or 0
+    count = complete.count()
+    for entry in complete.order_by("last_used"):
+        if total <= _settings.BUILD_CACHE_MAX_BYTES and count <= _settings.BUILD_CACHE_MAX_ENTRIES:
+            break
+        discard(entry.fingerprint)
+        total -= entry.size
+        count -= 1
+
+
+def stats():
+    entries = BuildCacheEntry.objects.all()
+    totals = entries.aggregate(hits=Sum("hits"), misses=Sum("misses"), size=Sum("size"))
+    return {
+        "enabled": _settings.BUILD_CACHE_ENABLED,
+        "entries": entries.filter(complete=True).count(),
+        "bytes": totals["size"] or 0,
+        "hits": totals["hits"] or 0,
+        "misses": totals["misses"] or 0,
+    }
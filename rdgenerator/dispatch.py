@@ -0,0 +1,272 @@
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings as _settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from . import backends, secretszip
+from .models import GithubRun, set_run_status
+
+_session = None
+_session_lock = threading.Lock()
+_worker = None
+_worker_lock = threading.Lock()
+_wake = threading.Event()
+
+
+def github_headers():
+    return {
+        'Accept':  'application/vnd.github+json',
+        'Content-Type': 'application/json',
+        'Authorization': 'Bearer '+_settings.GHBEARER,
+        'X-GitHub-Api-Version': '2022-11-28'
+    }
+
+
+def workflow_url(workflow):
+    return _settings.GITHUB_API_URL+'/repos/'+_settings.GHUSER+'/'+_settings.REPONAME+'/actions/workflows/'+workflow+'/dispatches'
+
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(github_headers())
+            _session = session
+        return _session
+
+
+def enqueue(myuuid, url, payload, backend="github", platform="", requester="", depends_on=""):
+    """Queue a build for the run, the scheduler starts it once a slot is free
+    and the run it depends on (if any) has finished."""
+    GithubRun.objects.filter(Q(uuid=myuuid)).update(
+        dispatch_state="queued",
+        dispatch_url=url,
+        dispatch_payload=json.dumps(payload),
+        dispatch_attempts=0,
+        dispatch_after=timezone.now(),
+        backend=backend,
+        platform=platform,
+        requester=requester,
+        depends_on=depends_on,
+    )
+    ensure_worker()
+    _wake.set()
+
+
+def wake():
+    _wake.set()
+
+
+def slot_limit(backend, platform):
+    backend_limit = _settings.BUILD_SLOTS.get(backend, 1)
+    return backend_limit, min(_settings.BUILD_PLATFORM_SLOTS.get(platform, backend_limit), backend_limit)
+
+
+def _running():
+    now = timezone.now()
+    # builds that never report a terminal status stop holding their slot eventually
+    started_after = now - timedelta(seconds=_settings.BUILD_SLOT_TIMEOUT)
+    return GithubRun.objects.filter(
+        Q(dispatch_state="sending") | Q(dispatch_state="sent", dispatch_after__gt=started_after)
+    )
+
+
+def _has_free_slot(run, by_backend, by_platform):
+    backend_limit, platform_limit = slot_limit(run.backend, run.platform)
+    return (
+        by_backend.get(run.backend, 0) < backend_limit
+        and by_platform.get((run.backend, run.platform), 0) < platform_limit
+    )
+
+
+def _pick(candidates, by_backend, by_platform, by_requester):
+    # fewest running builds for the requester first, then submission order
+    best = None
+    for run in candidates:
+        if run.dispatch_state == "queued" and not _has_free_slot(run, by_backend, by_platform):
+            continue
+        key = (by_requester.get(run.requester, 0), run.id)
+        if best is None or key < best[0]:
+            best = (key, run)
+    return best[1] if best else None
+
+
+def _ready(candidates):
+    # batch members wait for the build that warms their shared base
+    waiting_on = {run.depends_on for run in candidates if run.depends_on}
+    if not waiting_on:
+        return candidates
+    unfinished = set(
+        GithubRun.objects.filter(uuid__in=waiting_on, dispatch_state="queued").values_list("uuid", flat=True)
+    )
+    unfinished.update(_running().filter(uuid__in=waiting_on).values_list("uuid", flat=True))
+    return [run for run in candidates if run.depends_on not in unfinished]
+
+
+def _counts():
+    by_backend, by_platform, by_requester = {}, {}, {}
+    for row in _running().values("backend", "platform", "requester"):
+        by_backend[row["backend"]] = by_backend.get(row["backend"], 0) + 1
+        key = (row["backend"], row["platform"])
+        by_platform[key] = by_platform.get(key, 0) + 1
+        by_requester[row["requester"]] = by_requester.get(row["requester"], 0) + 1
+    return by_backend, by_platform, by_requester
+
+
+def _claim():
+    while True:
+        now = timezone.now()
+        # "sending" rows whose lease expired belong to a worker that died mid-request,
+        # they already own a slot
+        due = GithubRun.objects.filter(
+            Q(dispatch_state="queued") | Q(dispatch_state="sending"),
+            dispatch_after__lte=now,
+            # a terminal status can arrive while a row is still queued or sending
+            completed__isnull=True,
+        ).order_by("id")
+        run = _pick(_ready(list(due[:_settings.SCHEDULER_SCAN])), *_counts())
+        if run is None:
+            return None
+        claimed = GithubRun.objects.filter(
+            pk=run.pk, dispatch_state=run.dispatch_state, dispatch_after=run.dispatch_after, completed__isnull=True
+        ).update(
+            dispatch_state="sending",
+            dispatch_after=now + timedelta(seconds=_settings.DISPATCH_LEASE),
+            dispatch_attempts=F("dispatch_attempts") + 1,
+        )
+        if claimed:
+            break
+        # another worker took it, pick again
+    if run.dispatch_state == "queued":
+        by_backend, by_platform, _ = _counts()
+        backend_limit, platform_limit = slot_limit(run.backend, run.platform)
+        if by_backend.get(run.backend, 0) > backend_limit or by_platform.get((run.backend, run.platform), 0) > platform_limit:
+            # lost a race with another process for the last slot, hand it back
+            GithubRun.objects.filter(pk=run.pk, completed__isnull=True).update(
+                dispatch_state="queued", dispatch_after=now, dispatch_attempts=F("dispatch_attempts") - 1
+            )
+            return None
+    return GithubRun.objects.get(pk=run.pk)
+
+
+def queue_position(myuuid):
+    """1-based position among queued builds of the same backend, 0 once started."""
+    run = GithubRun.objects.filter(Q(uuid=myuuid)).values("id", "dispatch_state", "backend").first()
+    if not run or run["dispatch_state"] != "queued":
+        return 0
+    return GithubRun.objects.filter(
+        dispatch_state="queued", backend=run["backend"], id__lt=run["id"]
+    ).count() + 1
+
+
+def _retry_delay(response, attempts):
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(float(retry_after), 1.0)
+            except ValueError:
+                try:
+                    return max((parsedate_to_datetime(retry_after) - timezone.now()).total_seconds(), 1.0)
+                except (TypeError, ValueError):
+                    pass
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = response.headers.get("X-RateLimit-Reset")
+            if reset and reset.isdigit():
+                return max(int(reset) - time.time(), 1.0)
+    delay = min(_settings.DISPATCH_BACKOFF_BASE * (2 ** (attempts - 1)), _settings.DISPATCH_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _fail(run, message):
+    GithubRun.objects.filter(pk=run.pk).update(dispatch_state="failed")
+    set_run_status(run.uuid, message[:100])
+    # the workflow never ran, so it won't call cleanzip
+    secretszip.release(run.uuid)
+
+
+def _mark_sent(run):
+    # dispatch_after doubles as the start time while the build holds its slot
+    GithubRun.objects.filter(pk=run.pk, completed__isnull=True).update(dispatch_state="sent", dispatch_after=timezone.now())
+    # a simulated build can report its outcome before we get here
+    GithubRun.objects.filter(pk=run.pk, completed__isnull=False).update(dispatch_state="done")
+
+
+def send(run):
+    try:
+        backends.get_backend(run.backend).dispatch(run)
+    except backends.DispatchError as exc:
+        error = str(exc)
+        if exc.retryable and run.dispatch_attempts < _settings.DISPATCH_MAX_ATTEMPTS:
+            delay = _retry_delay(exc.response, run.dispatch_attempts)
+            print(f"{error}, retrying {run.uuid} in {delay:.0f}s")
+            GithubRun.objects.filter(pk=run.pk, completed__isnull=True).update(
+                dispatch_state="queued",
+                dispatch_after=timezone.now() + timedelta(seconds=delay),
+            )
+            return False
+        print(f"{error}, giving up on {run.uuid}")
+        _fail(run, error)
+        return False
+    _mark_sent(run)
+    return True
+
+
+def cancel(myuuid):
+    """Cancel a queued build or ask its backend to stop a started one, returns False if neither worked."""
+    run = GithubRun.objects.filter(Q(uuid=myuuid)).first()
+    if run is None or run.completed is not None:
+        return False
+    if GithubRun.objects.filter(pk=run.pk, dispatch_state="queued").update(dispatch_state="cancelled"):
+        set_run_status(run.uuid, backends.CANCELLED_STATUS)
+        secretszip.release(run.uuid)
+        return True
+    if run.dispatch_state == "sent":
+        return backends.get_backend(run.backend).cancel(run)
+    return False
+
+
+def drain():
+    """Start every build that is due and has a free slot, returns how many were attempted."""
+    count = 0
+    while True:
+        run = _claim()
+        if run is None:
+            return count
+        send(run)
+        count += 1
+
+
+def run_forever():
+    while True:
+        _wake.clear()
+        try:
+            close_old_connections()
+            drain()
+        except Exception as exc:
+            print(f"dispatch worker error: {exc}")
+        _wake.wait(_settings.DISPATCH_POLL_INTERVAL)
+
+
+def ensure_worker():
+    """Start the dispatch thread in this process if it isn't running yet."""
+    global _worker
+    if not _settings.DISPATCH_WORKER_THREAD:
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=run_forever, name="dispatch-worker", daemon=True)
+            _worker.start()
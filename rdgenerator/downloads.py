@@ -0,0 +1,152 @@
+import mimetypes
+import re
+from pathlib import Path
+
+from django.conf import settings as _settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+CHUNK_SIZE = 256 * 1024
+
+CONTENT_TYPES = {
+    ".exe": "application/vnd.microsoft.portable-executable",
+    ".msi": "application/x-msi",
+    ".apk": "application/vnd.android.package-archive",
+    ".dmg": "application/x-apple-diskimage",
+    ".deb": "application/vnd.debian.binary-package",
+    ".rpm": "application/x-rpm",
+    ".zst": "application/zstd",
+    ".appimage": "application/vnd.appimage",
+    ".flatpak": "application/vnd.flatpak",
+    ".png": "image/png",
+    ".zip": "application/zip",
+}
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def content_type_for(filename):
+    suffix = Path(filename).suffix.lower()
+    if suffix in CONTENT_TYPES:
+        return CONTENT_TYPES[suffix]
+    guessed, _ = mimetypes.guess_type(filename)
+    return guessed or "application/octet-stream"
+
+
+def _etag(stat):
+    return '"%x-%x"' % (stat.st_size, stat.st_mtime_ns)
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return since is not None and int(mtime) <= since
+
+
+def _parse_range(request, size, etag, mtime):
+    """Returns (start, end) for a satisfiable single range, None to send the full file
+    or False when the range can't be satisfied."""
+    header = request.headers.get("Range")
+    if not header:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range:
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            if if_range != etag:
+                return None
+        else:
+            since = parse_http_date_safe(if_range)
+            if since is None or int(mtime) > since:
+                return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        # multiple ranges or another unit, the full body is a valid answer
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _range_iter(path, start, end):
+    remaining = end - start + 1
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        while remaining > 0:
+            chunk = handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _offload(response, root, path):
+    if _settings.DOWNLOAD_ACCEL_REDIRECT:
+        relative = path.relative_to(root.parent).as_posix()
+        response["X-Accel-Redirect"] = _settings.DOWNLOAD_ACCEL_REDIRECT.rstrip("/") + "/" + relative
+        return True
+    if _settings.DOWNLOAD_X_SENDFILE:
+        response["X-Sendfile"] = str(path)
+        return True
+    return False
+
+
+def serve_file(request, root, *parts):
+    """Stream root/<parts> as an attachment with conditional and range request support."""
+    root = Path(root).resolve()
+    path = root.joinpath(*parts).resolve()
+    if root not in path.parents or not path.is_file():
+        raise Http404("File not found")
+    stat = path.stat()
+    etag = _etag(stat)
+    headers = {
+        "Content-Type": content_type_for(path.name),
+        "Content-Disposition": content_disposition_header(True, path.name),
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+    }
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        response["Last-Modified"] = headers["Last-Modified"]
+        return response
+
+    # the reverse proxy handles ranges itself once it owns the file
+    offloaded = HttpResponse(headers=headers)
+    if _offload(offloaded, root, path):
+        return offloaded
+
+    byte_range = _parse_range(request, stat.st_size, etag, stat.st_mtime)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = "bytes */%d" % stat.st_size
+        return response
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(_range_iter(path, start, end), status=206, headers=headers)
+        response["Content-Range"] = "bytes %d-%d/%d" % (start, end, stat.st_size)
+        response["Content-Length"] = str(end - start + 1)
+        return response
+
+    response = FileResponse(
+        open(path, "rb"),
+        as_attachment=True,
+        filename=path.name,
+        content_type=headers.pop("Content-Type"),
+        headers=headers,
+    )
+    response.block_size = CHUNK_SIZE
+    return response
@@ -1,9 +1,13 @@
 from django import forms
-from PIL import Image
+from django.conf import settings as _settings
+
+from .icons import LOGO_FORMATS, inspect_data_url, inspect_image
 
 class GenerateForm(forms.Form):
     #Platform
     platform = forms.ChoiceField(choices=[('windows','Windows 64Bit'),('windows-x86','Windows 32Bit'),('linux','Linux'),('android','Android'),('macos','macOS')], initial='windows')
+    #extra platforms built from the same submission
+    platforms = forms.MultipleChoiceField(choices=[('windows','Windows 64Bit'),('windows-x86','Windows 32Bit'),('linux','Linux'),('android','Android'),('macos','macOS')], required=False, widget=forms.CheckboxSelectMultiple)
     version = forms.ChoiceField(choices=[('master','nightly'),('1.4.5','1.4.5'),('1.4.4','1.4.4'),('1.4.3','1.4.3'),('1.4.2','1.4.2'),('1.4.1','1.4.1'),('1.4.0','1.4.0'),('1.3.9','1.3.9'),('1.3.8','1.3.8'),('1.3.7','1.3.7'),('1.3.6','1.3.6'),('1.3.5','1.3.5'),('1.3.4','1.3.4'),('1.3.3','1.3.3')], initial='1.4.5')
     help_text="'master' is the development version (nightly build) with the latest features but may be less stable"
     delayFix = forms.BooleanField(initial=True, required=False)
@@ -87,23 +91,40 @@ class GenerateForm(forms.Form):
         print("checking icon")
         image = self.cleaned_data['iconfile']
         if image:
+            if image.size > _settings.IMAGE_MAX_BYTES:
+                raise forms.ValidationError("Custom App Icon file is too large.")
+            # header only, the pixels are decoded later when the icon set is rendered
             try:
-                # Open the image using Pillow
-                img = Image.open(image)
+                inspect_image(image, square=True)
+            except ValueError as e:
+                raise forms.ValidationError(str(e))
+        return image
 
-                # Check if the image is a PNG (optional, but good practice)
-                if img.format != 'PNG':
-                    raise forms.ValidationError("Only PNG images are allowed.")
+    def clean_logofile(self):
+        image = self.cleaned_data['logofile']
+        if image:
+            if image.size > _settings.IMAGE_MAX_BYTES:
+                raise forms.ValidationError("Custom App Logo file is too large.")
+            try:
+                inspect_image(image, formats=LOGO_FORMATS)
+            except ValueError as e:
+                raise forms.ValidationError(str(e))
+        return image
 
-                # Get image dimensions
-                width, height = img.size
+    def clean_iconbase64(self):
+        value = self.cleaned_data['iconbase64']
+        if value:
+            try:
+                inspect_data_url(value, square=True)
+            except ValueError as e:
+                raise forms.ValidationError(str(e))
+        return value
 
-                # Check for square dimensions
-                if width != height:
-                    raise forms.ValidationError("Custom App Icon dimensions must be square.")
-                
-                return image
-            except OSError:  # Handle cases where the uploaded file is not a valid image
-                raise forms.ValidationError("Invalid icon file.")
-            except Exception as e: # Catch any other image processing errors
-                raise forms.ValidationError(f"Error processing icon: {e}")
+    def clean_logobase64(self):
+        value = self.cleaned_data['logobase64']
+        if value:
+            try:
+                inspect_data_url(value, formats=LOGO_FORMATS)
+            except ValueError as e:
+                raise forms.ValidationError(str(e))
+        return value
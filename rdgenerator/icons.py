@@ -0,0 +1,172 @@
+import base64
+import binascii
+import io
+import os
+import re
+import shutil
+import uuid
+import zipfile
+from pathlib import Path
+
+from django.conf import settings as _settings
+from PIL import Image
+
+from .buildcache import file_digest
+
+# what ImageMagick and flutter_launcher_icons used to produce on every build,
+# paths are relative to the rustdesk checkout
+ICO_SIZES = (256, 64, 48, 32, 16)
+APP_ICON_SIZES = (256, 128, 64, 48, 32, 16)
+PNG_LADDER = {
+    "res/32x32.png": 32,
+    "res/64x64.png": 64,
+    "res/128x128.png": 128,
+    "res/128x128@2x.png": 256,
+}
+BUNDLE_NAME = "bundle.zip"
+# the logo is only copied into flutter_assets as logo.png, so anything
+# Flutter's image codecs decode will do; icons go through the PNG pipeline
+LOGO_FORMATS = ("PNG", "JPEG", "GIF", "WEBP", "BMP")
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+# base64 is decoded in slices of this many characters (a multiple of 4)
+B64_CHUNK = 64 * 1024
+
+
+def inspect_image(fileobj, square=False, formats=("PNG",)):
+    """Check an uploaded image from its header only, before any pixel data is decoded.
+
+    Returns (width, height) or raises ValueError with a message for the user.
+    """
+    try:
+        with Image.open(fileobj) as img:
+            fmt = img.format
+            width, height = img.size
+    except Image.DecompressionBombError:
+        raise ValueError("Image dimensions are too large.")
+    except (OSError, SyntaxError):
+        raise ValueError("Invalid image file.")
+    finally:
+        if hasattr(fileobj, "seek"):
+            fileobj.seek(0)
+    if fmt not in formats:
+        raise ValueError("Only PNG images are allowed." if formats == ("PNG",) else "Unsupported image format.")
+    if width * height > _settings.IMAGE_MAX_PIXELS:
+        raise ValueError("Image dimensions are too large.")
+    if square and width != height:
+        raise ValueError("Custom App Icon dimensions must be square.")
+    return width, height
+
+
+def split_data_url(value):
+    """Returns the base64 payload of a data: URL, raises ValueError if there is none."""
+    header, sep, encoded = value.partition(";base64,")
+    if not sep:
+        raise ValueError("Invalid base64 data")
+    # decoded size is known up front, refuse oversized images before decoding
+    if len(encoded) * 3 // 4 > _settings.IMAGE_MAX_BYTES:
+        raise ValueError("Image file is too large.")
+    return encoded
+
+
+def inspect_data_url(value, square=False, formats=("PNG",)):
+    encoded = split_data_url(value)
+    # the png signature and IHDR chunk (or another format's header) are in the first few bytes
+    prefix = encoded[:B64_CHUNK]
+    prefix = prefix[:len(prefix) - len(prefix) % 4]
+    try:
+        head = base64.b64decode(prefix, validate=True)
+    except binascii.Error:
+        raise ValueError("Invalid base64 data")
+    return inspect_image(io.BytesIO(head), square=square, formats=formats)
+
+
+def write_data_url(value, path):
+    """Decode a base64 data: URL into path slice by slice instead of in one piece."""
+    encoded = split_data_url(value)
+    with open(path, "wb") as handle:
+        for start in range(0, len(encoded), B64_CHUNK):
+            try:
+                handle.write(base64.b64decode(encoded[start:start + B64_CHUNK], validate=True))
+            except binascii.Error:
+                raise ValueError("Invalid base64 data")
+
+
+def assets_dir(icon_hash):
+    if not _HASH_RE.match(icon_hash or ""):
+        return None
+    return Path(_settings.ICON_ASSETS_DIR) / icon_hash
+
+
+def _save_ico(img, path, sizes):
+    # Pillow drops sizes above the source, scale up so every entry exists
+    largest = max(sizes)
+    if img.size[0] < largest:
+        img = img.resize((largest, largest), Image.Resampling.LANCZOS)
+    img.save(path, format="ICO", sizes=[(size, size) for size in sizes])
+
+
+def _svg_wrapper(png_bytes, size):
+    # same result as `magick icon.png icon.svg`: the raster embedded in an svg
+    encoded = base64.b64encode(png_bytes).decode("ascii")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'width="{size[0]}" height="{size[1]}" viewBox="0 0 {size[0]} {size[1]}">'
+        f'<image width="{size[0]}" height="{size[1]}" xlink:href="data:image/png;base64,{encoded}"/></svg>'
+    )
+
+
+def _render(source_path, target):
+    with Image.open(source_path) as img:
+        img = img.convert("RGBA")
+    source_bytes = Path(source_path).read_bytes()
+
+    res_dir = target / "res"
+    res_dir.mkdir(parents=True)
+    (res_dir / "icon.png").write_bytes(source_bytes)
+    for name, size in PNG_LADDER.items():
+        img.resize((size, size), Image.Resampling.LANCZOS).save(target / name, format="PNG", optimize=True)
+    _save_ico(img, res_dir / "icon.ico", ICO_SIZES)
+    shutil.copyfile(res_dir / "icon.ico", res_dir / "tray-icon.ico")
+
+    app_icon = target / "flutter" / "windows" / "runner" / "resources" / "app_icon.ico"
+    app_icon.parent.mkdir(parents=True)
+    _save_ico(img, app_icon, APP_ICON_SIZES)
+
+    # copied into rustdesk/data/flutter_assets/assets after the build
+    extra_dir = target / "dce_assets"
+    extra_dir.mkdir()
+    (extra_dir / "icon.svg").write_text(_svg_wrapper(source_bytes, img.size), encoding="ascii")
+
+    with zipfile.ZipFile(target / BUNDLE_NAME, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        for path in sorted(target.rglob("*")):
+            if path.is_file() and path.name != BUNDLE_NAME:
+                bundle.write(path, path.relative_to(target).as_posix())
+
+
+def render_icon(source_path):
+    """Render every icon file a build needs from the uploaded png, once per distinct image.
+
+    Returns the source's sha256, which names the asset folder and its bundle.zip.
+    """
+    icon_hash = file_digest(source_path)
+    target = assets_dir(icon_hash)
+    if (target / BUNDLE_NAME).is_file():
+        # the janitor prunes icon sets by age
+        os.utime(target)
+        return icon_hash
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = target.parent / f".{icon_hash}.{uuid.uuid4().hex}"
+    try:
+        _render(source_path, staging)
+        try:
+            os.replace(staging, target)
+        except OSError:
+            # another request rendered the same icon first
+            pass
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return icon_hash
+
@@ -0,0 +1,253 @@
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings as _settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import artifacts, localbuild, secretszip, uploads
+from .models import BuildBatch, GithubRun, UploadSession
+
+DAY = 86400
+# local_builds/ entries that aren't per-run worktrees
+SHARED_BUILD_DIRS = ("warm", "base", "cache", "mirror.git")
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _size(path):
+    if not path.is_dir():
+        return path.stat().st_size
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _busy_runs():
+    # runs that may still write into their directories; ones that never reported
+    # a terminal status stop counting after BUILD_SLOT_TIMEOUT like in the scheduler
+    active_after = timezone.now() - timedelta(seconds=_settings.BUILD_SLOT_TIMEOUT)
+    return set(
+        GithubRun.objects.filter(completed__isnull=True, updated__gt=active_after).values_list("uuid", flat=True)
+    )
+
+
+def _children(root, busy):
+    if not root.is_dir():
+        return []
+    return [entry for entry in root.iterdir() if entry.name not in busy and not entry.name.startswith(".")]
+
+
+def _human(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class Report:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.areas = {}
+
+    def add(self, area, size, count=1):
+        removed, reclaimed = self.areas.get(area, (0, 0))
+        self.areas[area] = (removed + count, reclaimed + size)
+
+    def summary(self):
+        verb = "would reclaim" if self.dry_run else "reclaimed"
+        lines = [
+            f"{area}: {removed} removed, {verb} {_human(reclaimed)}"
+            for area, (removed, reclaimed) in sorted(self.areas.items())
+        ]
+        total = sum(reclaimed for _, reclaimed in self.areas.values())
+        lines.append(f"total: {verb} {_human(total)}")
+        return "\n".join(lines)
+
+
+def _prune(report, area, paths, max_age_days, max_bytes, remove):
+    """Remove paths older than max_age_days, then the oldest ones until the rest fit in max_bytes.
+
+    0 turns either limit off.
+    """
+    now = time.time()
+    items = []
+    for path in paths:
+        try:
+            items.append((path.stat().st_mtime, path, _size(path)))
+        except FileNotFoundError:
+            continue
+    items.sort(key=lambda item: item[0])
+    total = sum(size for _, _, size in items)
+    for mtime, path, size in items:
+        expired = max_age_days and now - mtime > max_age_days * DAY
+        over_quota = max_bytes and total > max_bytes
+        if not expired and not over_quota:
+            # oldest first, nothing newer qualifies either
+            break
+        if not report.dry_run:
+            remove(path)
+        total -= size
+        report.add(area, size)
+
+
+def _remove_output(path):
+    shutil.rmtree(path, ignore_errors=True)
+    artifacts.forget(path.name)
+
+
+def _remove_file(path):
+    path.unlink(missing_ok=True)
+
+
+def _busy_batches(names, busy):
+    # a matrix build saves its icon and logo once, under png/<batch_id>, for all its runs
+    batch_ids = set()
+    for batch_id, members in BuildBatch.objects.filter(batch_id__in=names).values_list("batch_id", "members"):
+        if any(member["uuid"] in busy for member in json.loads(members)):
+            batch_ids.add(batch_id)
+    return batch_ids
+
+
+def _remove_dir(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def clean_outputs(report, busy):
+    _prune(report, "exe", _children(Path(artifacts.OUTPUT_DIR), busy),
+           _settings.JANITOR_EXE_MAX_AGE_DAYS, _settings.JANITOR_EXE_MAX_BYTES, _remove_output)
+    png = _children(Path("png"), busy)
+    shared = _busy_batches([path.name for path in png], busy)
+    _prune(report, "png", [path for path in png if path.name not in shared],
+           _settings.JANITOR_PNG_MAX_AGE_DAYS, 0, _remove_dir)
+    # rendered again from the uploaded png by the next submission that needs them
+    _prune(report, "icon_assets", _children(Path(_settings.ICON_ASSETS_DIR), set()),
+           _settings.JANITOR_ICON_ASSETS_MAX_AGE_DAYS, 0, _remove_dir)
+
+
+def clean_logs(report, busy):
+    log_dir = localbuild._log_dir()
+    if not log_dir.is_dir():
+        return
+    logs = [
+        path for path in log_dir.glob("build_*")
+        if path.is_file() and path.stem[len("build_"):] not in busy
+    ]
+    _prune(report, "logs", logs, _settings.JANITOR_LOG_MAX_AGE_DAYS, 0, _remove_file)
+
+
+def _remove_warm_slot(report, slot):
+    # claim the slot's lock like a build would, so no build starts in it meanwhile
+    lock_path = slot.parent / f"{slot.name}.lock"
+    try:
+        fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return
+    os.close(fd)
+    try:
+        size = _size(slot)
+        if not report.dry_run:
+            localbuild.remove_worktree(slot)
+        report.add("worktrees", size)
+    finally:
+        lock_path.unlink(missing_ok=True)
+
+
+def clean_worktrees(report, busy):
+    root = localbuild._worktree_root()
+    if not root.is_dir():
+        return
+    # per-run worktrees (LOCAL_BUILD_WARM off) are only needed while the build runs
+    for path in _children(root, busy):
+        if path.is_dir() and path.name not in SHARED_BUILD_DIRS:
+            size = _size(path)
+            if not report.dry_run:
+                localbuild.remove_worktree(path)
+            report.add("worktrees", size)
+    # warm slots are touched whenever a build claims them
+    warm_root = root / "warm"
+    max_age = _settings.JANITOR_WORKTREE_MAX_AGE_DAYS
+    if max_age and warm_root.is_dir():
+        cutoff = time.time() - max_age * DAY
+        for slot in warm_root.iterdir():
+            if slot.is_dir() and slot.stat().st_mtime < cutoff:
+                _remove_warm_slot(report, slot)
+    if not report.dry_run:
+        localbuild.prune_worktrees()
+
+
+def clean_secrets(report):
+    # normally released by /cleanzip or the local build pool, unless the workflow died first
+    finished = GithubRun.objects.filter(completed__isnull=False).exclude(secrets_zip="")
+    for myuuid, zip_filename in finished.values_list("uuid", "secrets_zip"):
+        path = Path(secretszip.ZIP_DIR) / zip_filename
+        size = path.stat().st_size if path.is_file() else 0
+        if report.dry_run:
+            report.add("temp_zips", size)
+        elif secretszip.release(myuuid):
+            report.add("temp_zips", size)
+    deleted, reclaimed, _ = secretszip.sweep(_settings.JANITOR_ZIP_GRACE, dry_run=report.dry_run)
+    if deleted:
+        report.add("temp_zips", reclaimed, deleted)
+
+
+def clean_uploads(report):
+    cutoff = timezone.now() - timedelta(seconds=_settings.JANITOR_UPLOAD_MAX_AGE)
+    for session in UploadSession.objects.filter(updated__lt=cutoff):
+        size = uploads.received(session)
+        if not report.dry_run:
+            uploads.discard(session)
+        report.add("upload_tmp", size)
+    # temp files of save_custom_client requests that died mid-upload
+    upload_dir = Path(uploads.UPLOAD_DIR)
+    if upload_dir.is_dir():
+        sessions = set(UploadSession.objects.values_list("upload_id", flat=True))
+        parts = [path for path in upload_dir.glob("*.part") if path.stem not in sessions]
+        _prune(report, "upload_tmp", parts, _settings.JANITOR_UPLOAD_MAX_AGE / DAY, 0, _remove_file)
+
+
+def run(dry_run=False):
+    """Apply the retention policies once, returns a Report of what was removed."""
+    report = Report(dry_run)
+    busy = _busy_runs()
+    clean_outputs(report, busy)
+    clean_logs(report, busy)
+    clean_worktrees(report, busy)
+    clean_secrets(report)
+    clean_uploads(report)
+    return report
+
+
+def run_forever():
+    while True:
+        time.sleep(_settings.JANITOR_INTERVAL)
+        try:
+            close_old_connections()
+            # every web process runs this thread, one of them does the work per interval
+            if cache.add("janitor:lock", 1, _settings.JANITOR_INTERVAL):
+                print(run().summary())
+        except Exception as exc:
+            print(f"janitor error: {exc}")
+
+
+def ensure_worker():
+    """Start the janitor thread in this process when JANITOR_INTERVAL is set."""
+    global _worker
+    if not _settings.JANITOR_INTERVAL:
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=run_forever, name="janitor", daemon=True)
+            _worker.start()
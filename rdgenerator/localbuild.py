@@ -0,0 +1,320 @@
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings as _settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import secretszip
+from .models import GithubRun, is_terminal_status, set_run_status
+
+
+def _log_dir():
+    return Path(_settings.LOCAL_BUILD_LOG_DIR) if _settings.LOCAL_BUILD_LOG_DIR else Path(_settings.BASE_DIR) / "logs"
+
+
+def _worktree_root():
+    if _settings.LOCAL_BUILD_WORKTREE_ROOT:
+        return Path(_settings.LOCAL_BUILD_WORKTREE_ROOT)
+    return Path(_settings.BASE_DIR) / "local_builds"
+
+
+def _mirror_path():
+    return _worktree_root() / "mirror.git"
+
+
+def _source_repos():
+    # worktrees come from the mirror when it's enabled, older ones from RUSTDESK_SRC
+    repos = [_settings.LOCAL_BUILD_RUSTDESK_SRC]
+    if _mirror_path().is_dir():
+        repos.append(str(_mirror_path()))
+    return repos
+
+
+def _script_path():
+    return Path(_settings.BASE_DIR) / "scripts" / "build_windows_local.py"
+
+
+def _script_env():
+    env = os.environ.copy()
+    env["DCE_ROOT"] = str(_settings.BASE_DIR)
+    if _settings.LOCAL_BUILD_RUSTDESK_SRC:
+        env["RUSTDESK_SRC"] = _settings.LOCAL_BUILD_RUSTDESK_SRC
+    if _settings.LOCAL_BUILD_WORKTREE_ROOT:
+        env["LOCAL_BUILD_WORKTREE_ROOT"] = _settings.LOCAL_BUILD_WORKTREE_ROOT
+    env["LOCAL_BUILD_MIRROR"] = "true" if _settings.LOCAL_BUILD_MIRROR_INTERVAL else "false"
+    return env
+
+
+def prime_patch_cache(versions):
+    """Check the local build patches against each version ahead of the builds.
+
+    Returns the script's exit code, 1 when a patch no longer applies somewhere.
+    """
+    if not _settings.LOCAL_BUILD_RUSTDESK_SRC:
+        return 0
+    return subprocess.run(
+        [sys.executable, "-u", str(_script_path()), "--prime-patches", *versions],
+        cwd=str(_settings.BASE_DIR),
+        env=_script_env(),
+    ).returncode
+
+
+def refresh_mirror(versions):
+    """Fetch the RustDesk mirror and rewrite its version -> commit index.
+
+    Returns the script's exit code, 1 when some of versions aren't in the mirror.
+    """
+    if not _settings.LOCAL_BUILD_RUSTDESK_SRC or not _settings.LOCAL_BUILD_MIRROR_INTERVAL:
+        return 0
+    return subprocess.run(
+        [sys.executable, "-u", str(_script_path()), "--refresh-mirror", *versions],
+        cwd=str(_settings.BASE_DIR),
+        env=_script_env(),
+    ).returncode
+
+
+def start_mirror_refresher(versions):
+    """Refresh the mirror every LOCAL_BUILD_MIRROR_INTERVAL seconds in a background thread."""
+
+    def refresh_forever():
+        while True:
+            time.sleep(_settings.LOCAL_BUILD_MIRROR_INTERVAL)
+            try:
+                refresh_mirror(versions)
+            except Exception as exc:
+                print(f"mirror refresh error: {exc}", flush=True)
+
+    if not _settings.LOCAL_BUILD_RUSTDESK_SRC or not _settings.LOCAL_BUILD_MIRROR_INTERVAL:
+        return None
+    thread = threading.Thread(target=refresh_forever, name="mirror-refresh", daemon=True)
+    thread.start()
+    return thread
+
+
+def prepare_local_build(zip_path, myuuid, filename, platform, full_url, version="master"):
+    """Returns (cmd, env, log_path) for scripts/build_windows_local.py, or None if it can't run."""
+    if platform != _settings.LOCAL_BUILD_PLATFORM:
+        set_run_status(myuuid, "local build failed: windows only")
+        return None
+    script_path = _script_path()
+    if not script_path.exists():
+        set_run_status(myuuid, "local build failed: script missing")
+        return None
+    log_dir = _log_dir()
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_path = log_dir / f"build_{myuuid}.log"
+    env = _script_env()
+    env["DCE_ZIP_PATH"] = str(Path(zip_path).resolve())
+    env["DCE_UUID"] = myuuid
+    env["DCE_FILENAME"] = filename
+    env["DCE_PLATFORM"] = platform
+    env["DCE_VERSION"] = version
+    env["DCE_STATUS_URL"] = f"{full_url}/updategh"
+    env["DCE_OUTPUT_DIR"] = str(Path(_settings.BASE_DIR) / "exe" / myuuid)
+    env["DCE_ICON_ASSETS_DIR"] = str(Path(_settings.ICON_ASSETS_DIR).resolve())
+    env["DCE_REPORT_PATH"] = str(log_dir / f"build_{myuuid}.json")
+    env["LOCAL_BUILD_WARM"] = "true" if _settings.LOCAL_BUILD_WARM else "false"
+    env["LOCAL_BUILD_WARM_SLOTS"] = str(_settings.LOCAL_BUILD_WARM_SLOTS)
+    env["LOCAL_BUILD_TIMEOUT"] = str(_settings.LOCAL_BUILD_TIMEOUT)
+    env["LOCAL_BUILD_BASE_CACHE_SIZE"] = str(_settings.LOCAL_BUILD_BASE_CACHE_SIZE)
+    env["LOCAL_BUILD_DEP_CACHE_SIZE"] = str(_settings.LOCAL_BUILD_DEP_CACHE_SIZE)
+    env["LOCAL_BUILD_SAMPLE_INTERVAL"] = str(_settings.LOCAL_BUILD_SAMPLE_INTERVAL)
+    return [sys.executable, "-u", str(script_path)], env, log_path
+
+
+def _popen_group_kwargs():
+    # own process group so a timeout can take down cargo/flutter children too
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def _kill_tree(proc):
+    if proc.poll() is not None:
+        return
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+    else:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def remove_worktree(worktree_dir):
+    # unregister it from the source checkout too, or "worktree add" trips over it later
+    if not worktree_dir.exists():
+        return
+    if _settings.LOCAL_BUILD_RUSTDESK_SRC and shutil.which("git"):
+        # only the repo that owns the worktree accepts this, the other one fails quietly
+        for repo in _source_repos():
+            subprocess.run(
+                ["git", "-C", repo, "worktree", "remove", "--force", str(worktree_dir)],
+                capture_output=True,
+            )
+    shutil.rmtree(worktree_dir, ignore_errors=True)
+
+
+def prune_worktrees():
+    if _settings.LOCAL_BUILD_RUSTDESK_SRC and shutil.which("git"):
+        for repo in _source_repos():
+            subprocess.run(["git", "-C", repo, "worktree", "prune"], capture_output=True)
+
+
+def release_warm_slots(myuuid):
+    # the script drops its slot lock at exit, which a killed or cancelled build never reaches
+    warm_root = _worktree_root() / "warm"
+    if not warm_root.is_dir():
+        return
+    for lock_path in warm_root.glob("*.lock"):
+        try:
+            owner = lock_path.read_text(encoding="utf-8").strip()
+        except OSError:
+            continue
+        if owner == myuuid:
+            lock_path.unlink(missing_ok=True)
+
+
+def cleanup_worktree(myuuid):
+    remove_worktree(_worktree_root() / myuuid)
+    release_warm_slots(myuuid)
+
+
+class LocalBuildPool:
+    """Runs local builds handed over by the scheduler on a fixed number of workers.
+
+    Each worker claims one run at a time, so the build host never runs more than
+    `workers` builds, and every build is killed and cleaned up once it exceeds
+    `timeout` seconds.
+    """
+
+    def __init__(self, workers, timeout, poll_interval=2.0):
+        self.workers = workers
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._procs = {}
+        self._lock = threading.Lock()
+
+    def report(self, event, myuuid, **fields):
+        print(json.dumps({"event": event, "uuid": myuuid, "time": timezone.now().isoformat(), **fields}), flush=True)
+
+    def recover(self):
+        # builds left running by a previous daemon have lost their process
+        orphaned = GithubRun.objects.filter(backend="local", build_started__isnull=False, build_finished__isnull=True)
+        for run in orphaned:
+            GithubRun.objects.filter(pk=run.pk).update(build_finished=timezone.now())
+            if not is_terminal_status(run.status):
+                set_run_status(run.uuid, "failed: local builder restarted")
+            cleanup_worktree(run.uuid)
+            self.report("orphaned", run.uuid)
+
+    def claim(self):
+        candidates = GithubRun.objects.filter(
+            backend="local", dispatch_state="sent", build_started__isnull=True
+        ).order_by("dispatch_after", "id")
+        for run in candidates[:5]:
+            if GithubRun.objects.filter(pk=run.pk, build_started__isnull=True).update(build_started=timezone.now()):
+                return GithubRun.objects.get(pk=run.pk)
+        return None
+
+    def execute(self, run):
+        try:
+            self._execute(run)
+        finally:
+            # matrix runs share the zip, it is removed once the last one is done
+            secretszip.release(run.uuid)
+
+    def _execute(self, run):
+        prepared = prepare_local_build(myuuid=run.uuid, **json.loads(run.dispatch_payload))
+        if prepared is None:
+            GithubRun.objects.filter(pk=run.pk).update(build_finished=timezone.now())
+            return
+        cmd, env, log_path = prepared
+        # before Popen, so it can't overwrite the first status the script posts
+        set_run_status(run.uuid, "local build started")
+        with open(log_path, "wb") as log_handle:
+            proc = subprocess.Popen(
+                cmd,
+                cwd=str(_settings.BASE_DIR),
+                env=env,
+                stdout=log_handle,
+                stderr=log_handle,
+                **_popen_group_kwargs(),
+            )
+        with self._lock:
+            self._procs[run.uuid] = proc
+        GithubRun.objects.filter(pk=run.pk).update(build_pid=proc.pid)
+        self.report("started", run.uuid, pid=proc.pid, log=str(log_path))
+        started = time.monotonic()
+        try:
+            exit_code = proc.wait(timeout=self.timeout)
+            timed_out = False
+        except subprocess.TimeoutExpired:
+            _kill_tree(proc)
+            exit_code = proc.returncode
+            timed_out = True
+        finally:
+            with self._lock:
+                self._procs.pop(run.uuid, None)
+        duration = time.monotonic() - started
+        GithubRun.objects.filter(pk=run.pk).update(build_finished=timezone.now(), build_exit_code=exit_code)
+        status, dispatch_state = GithubRun.objects.filter(pk=run.pk).values_list("status", "dispatch_state").first()
+        # LocalBackend.cancel reports cancelled runs itself
+        cancelled = dispatch_state == "cancelled"
+        if timed_out and not cancelled:
+            set_run_status(run.uuid, f"failed: build timed out after {int(self.timeout)}s")
+        elif exit_code != 0 and not cancelled and not is_terminal_status(status):
+            set_run_status(run.uuid, f"failed: build exited with code {exit_code}")
+        if timed_out or exit_code != 0:
+            cleanup_worktree(run.uuid)
+        self.report("finished", run.uuid, exit_code=exit_code, timed_out=timed_out, seconds=round(duration, 1))
+
+    def worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                close_old_connections()
+                run = self.claim()
+                if run is None:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                self.execute(run)
+            except Exception as exc:
+                print(f"local build worker error: {exc}", flush=True)
+                self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            running = list(self._procs.items())
+        for myuuid, proc in running:
+            _kill_tree(proc)
+            self.report("killed", myuuid)
+
+    def serve(self):
+        self.recover()
+        threads = [
+            threading.Thread(target=self.worker_loop, name=f"local-build-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
@@ -0,0 +1,402 @@
+import io
+import json
+import os
+import queue
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pyzipper
+import requests
+from django.conf import settings as _settings
+from django.core.management.base import BaseCommand, CommandError
+
+FORM = {
+    'platform': 'windows', 'version': '1.4.5', 'direction': 'both', 'installation': 'installationY',
+    'settings': 'settingsY', 'theme': 'system', 'themeDorO': 'default', 'passApproveMode': 'password',
+    'permissionsDorO': 'default', 'permissionsType': 'custom', 'serverIP': 'rd.example.com',
+}
+FAILED_STATUS = "生成失败，请重试"
+PROGRESS = ("5%", "10%", "15%", "20%", "25%", "50%", "70%", "85%")
+ENDPOINTS = ("generator", "check_for_file", "get_zip", "cleanzip", "updategh", "save_custom_client", "download")
+
+_RUN_RE = re.compile(r"filename=([^&'\"]+)&uuid=([0-9a-f-]{36})")
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def _rss(pid):
+    # Linux only, the column shows n/a elsewhere
+    try:
+        with open(f"/proc/{pid}/status") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class Recorder:
+    """Latencies per endpoint plus what the server's RSS was while each endpoint was in flight."""
+
+    def __init__(self, server_pid=None):
+        self.server_pid = server_pid
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+        self.busy = {name: 0.0 for name in ENDPOINTS}
+        self.peak_rss = {}
+        self.in_flight = {}
+        self.in_flight_samples = []
+        self.rss_samples = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def call(self, endpoint, fn, *args, **kwargs):
+        with self._lock:
+            self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + 1
+        started = time.perf_counter()
+        try:
+            response = fn(*args, **kwargs)
+            if response.status_code >= 400:
+                raise requests.HTTPError(f"{endpoint}: HTTP {response.status_code}")
+            # streamed bodies count until the last byte
+            if kwargs.get("stream"):
+                for _ in response.iter_content(256 * 1024):
+                    pass
+            return response
+        except requests.RequestException:
+            with self._lock:
+                self.errors[endpoint] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.in_flight[endpoint] -= 1
+                self.latencies[endpoint].append(elapsed * 1000)
+                self.busy[endpoint] += elapsed
+
+    def sample(self, interval=0.2):
+        while not self._stop.wait(interval):
+            rss = _rss(self.server_pid) if self.server_pid else None
+            with self._lock:
+                active = [name for name, count in self.in_flight.items() if count]
+                self.in_flight_samples.append(sum(self.in_flight.values()))
+            if rss is None:
+                continue
+            self.rss_samples.append(rss)
+            for name in active:
+                self.peak_rss[name] = max(self.peak_rss.get(name, 0), rss)
+
+    def start_sampler(self):
+        threading.Thread(target=self.sample, name="bench-sampler", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class StubGithub:
+    """Accepts workflow dispatches like the GitHub API and plays each run the way the workflows do:
+    fetch and decrypt the secrets zip, cleanzip, progress callbacks, artifact upload, final status."""
+
+    def __init__(self, recorder, runners, build_seconds, artifact_bytes, failure_rate, port=0):
+        self.recorder = recorder
+        self.build_seconds = build_seconds
+        self.failure_rate = failure_rate
+        self.artifact = os.urandom(artifact_bytes)
+        self.jobs = queue.Queue()
+        self.dispatches = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.endswith("/dispatches"):
+                    stub.dispatches += 1
+                    stub.jobs.put(json.loads(body)["inputs"])
+                    self.send_response(204)
+                else:
+                    self.send_response(404)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, name="bench-github", daemon=True).start()
+        for i in range(runners):
+            threading.Thread(target=self.runner, name=f"bench-runner-{i}", daemon=True).start()
+
+    def runner(self):
+        http = requests.Session()
+        while True:
+            inputs = self.jobs.get()
+            try:
+                self.play(http, inputs)
+            except (requests.RequestException, KeyError, ValueError) as exc:
+                print(f"stub runner error: {exc}", file=sys.stderr)
+
+    def play(self, http, inputs):
+        call = self.recorder.call
+        zip_url = json.loads(inputs["zip_url"])
+        base = zip_url["url"]
+        response = call("get_zip", http.get, f"{base}/get_zip", params={"filename": zip_url["file"]}, timeout=60)
+        with pyzipper.AESZipFile(io.BytesIO(response.content)) as zf:
+            zf.setpassword(_settings.ZIP_PASSWORD.encode())
+            secrets = json.loads(zf.read("secrets.json"))
+        secrets.update(secrets.pop("platforms", {}).get(zip_url.get("platform"), {}))
+        myuuid = secrets["uuid"]
+        call("cleanzip", http.post, f"{base}/cleanzip", json={"uuid": myuuid}, timeout=60)
+        step = self.build_seconds * random.uniform(0.8, 1.2) / (len(PROGRESS) + 1)
+        for progress in PROGRESS:
+            time.sleep(step)
+            call("updategh", http.post, f"{base}/updategh",
+                 json={"uuid": myuuid, "status": f"{progress} 已完成，坐和放宽"}, timeout=60)
+        time.sleep(step)
+        if random.random() < self.failure_rate:
+            call("updategh", http.post, f"{base}/updategh", json={"uuid": myuuid, "status": FAILED_STATUS}, timeout=60)
+            return
+        call("save_custom_client", http.post, f"{base}/save_custom_client", data={"uuid": myuuid},
+             files={"file": (f"{secrets['filename']}.exe", self.artifact)}, timeout=300)
+        call("updategh", http.post, f"{base}/updategh", json={"uuid": myuuid, "status": "成功！"}, timeout=60)
+
+    def close(self):
+        self.server.shutdown()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the generator: clients submit builds, poll check_for_file and download the result "
+        "while a stub GitHub plays the workflow callbacks. Reports latency percentiles, throughput, "
+        "concurrency and server RSS per endpoint, and compares against a baseline file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=20, help="builds to submit")
+        parser.add_argument("--concurrency", type=int, default=10, help="clients active at once")
+        parser.add_argument("--runners", type=int, default=10, help="stub workflow runs at once")
+        parser.add_argument("--build-seconds", type=float, default=10)
+        parser.add_argument("--poll-interval", type=float, default=5, help="seconds between check_for_file polls")
+        parser.add_argument("--artifact-bytes", type=int, default=5 * 1024 * 1024)
+        parser.add_argument("--failure-rate", type=float, default=0.0)
+        parser.add_argument("--timeout", type=float, default=600, help="give up on a build after this many seconds")
+        parser.add_argument("--url", help="benchmark a running server instead of starting one; its "
+                                          "GITHUB_API_URL must point at --stub-port")
+        parser.add_argument("--stub-port", type=int, default=0)
+        parser.add_argument("--server-pid", type=int, help="pid to sample RSS from when using --url")
+        parser.add_argument("--workers", type=int, help="server worker count, to report saturation")
+        parser.add_argument("--baseline", default=str(Path(_settings.BASE_DIR) / "bench_baseline.json"))
+        parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="allowed p95 slowdown and throughput drop against the baseline")
+        parser.add_argument("--json", action="store_true", help="print the results as JSON")
+
+    def handle(self, *args, **options):
+        server = None
+        recorder = Recorder(options["server_pid"])
+        stub = StubGithub(recorder, options["runners"], options["build_seconds"], options["artifact_bytes"],
+                          options["failure_rate"], options["stub_port"])
+        with tempfile.TemporaryDirectory(prefix="bench_load_") as workdir:
+            try:
+                if options["url"]:
+                    base = options["url"].rstrip("/")
+                else:
+                    server, base = self.start_server(workdir, stub.url, options)
+                    recorder.server_pid = server.pid
+                rss_before = _rss(recorder.server_pid) if recorder.server_pid else None
+                recorder.start_sampler()
+                started = time.perf_counter()
+                with ThreadPoolExecutor(options["concurrency"]) as pool:
+                    outcomes = list(pool.map(lambda i: self.client(base, i, recorder, options), range(options["clients"])))
+                wall = time.perf_counter() - started
+                recorder.stop()
+                rss_after = _rss(recorder.server_pid) if recorder.server_pid else None
+            finally:
+                stub.close()
+                if server is not None:
+                    server.terminate()
+                    server.wait(timeout=30)
+
+        results = self.summarize(recorder, outcomes, wall, rss_before, rss_after, options)
+        results["dispatches"] = stub.dispatches
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.report(results)
+        baseline_path = Path(options["baseline"])
+        if options["save_baseline"]:
+            baseline_path.write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"baseline written to {baseline_path}")
+        elif baseline_path.is_file():
+            self.compare(results, json.loads(baseline_path.read_text()), options["tolerance"])
+
+    def start_server(self, workdir, github_url, options):
+        # everything the server writes lands in workdir, not in the checkout
+        port = self.free_port()
+        env = dict(
+            os.environ,
+            DB_ENGINE="sqlite",
+            DB_NAME=str(Path(workdir) / "bench.sqlite3"),
+            CACHE_BACKEND="file",
+            CACHE_LOCATION=str(Path(workdir) / "status_cache"),
+            BUILD_CACHE_DIR=str(Path(workdir) / "build_cache"),
+            ICON_ASSETS_DIR=str(Path(workdir) / "icon_assets"),
+            GITHUB_API_URL=github_url,
+            GHUSER="bench", GHBEARER="bench", REPONAME="dce",
+            PROTOCOL="http",
+            BUILD_BACKEND="github",
+            BUILD_SLOTS_GITHUB=str(options["runners"]),
+            DISPATCH_POLL_INTERVAL="1",
+            JANITOR_INTERVAL="0",
+        )
+        manage = str(Path(_settings.BASE_DIR) / "manage.py")
+        subprocess.run([sys.executable, manage, "migrate", "--verbosity", "0"], cwd=workdir, env=env, check=True)
+        server = subprocess.Popen(
+            [sys.executable, manage, "runserver", f"127.0.0.1:{port}", "--noreload"],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                requests.get(f"{base}/generator", timeout=5)
+                return server, base
+            except requests.ConnectionError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    server.kill()
+                    raise CommandError("the server didn't start")
+                time.sleep(0.5)
+
+    def free_port(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def client(self, base, index, recorder, options):
+        """One user: submit, poll check_for_file until the client is ready, download it.
+        Returns the seconds from submit to downloaded, or None if the build didn't finish."""
+        http = requests.Session()
+        call = recorder.call
+        started = time.perf_counter()
+        # a unique name per client keeps the build cache from answering
+        form = {**FORM, 'exename': f"bench{index}_{random.randrange(1 << 30)}"}
+        try:
+            page = call("generator", http.post, f"{base}/generator", data=form, timeout=60).text
+            match = _RUN_RE.search(page)
+            if match is None:
+                print(f"client {index}: no run in the generator response", file=sys.stderr)
+                return None
+            filename, myuuid = match.groups()
+            params = {"filename": filename, "uuid": myuuid, "platform": form['platform']}
+            deadline = started + options["timeout"]
+            while time.perf_counter() < deadline:
+                time.sleep(options["poll_interval"] * random.uniform(0.8, 1.2))
+                page = call("check_for_file", http.get, f"{base}/check_for_file", params=params, timeout=60).text
+                if "/download?" in page:
+                    call("download", http.get, f"{base}/download",
+                         params={"filename": f"{filename}.exe", "uuid": myuuid}, stream=True, timeout=300)
+                    return time.perf_counter() - started
+                if FAILED_STATUS in page:
+                    return None
+        except requests.RequestException as exc:
+            print(f"client {index}: {exc}", file=sys.stderr)
+        return None
+
+    def summarize(self, recorder, outcomes, wall, rss_before, rss_after, options):
+        endpoints = {}
+        for name in ENDPOINTS:
+            values = sorted(recorder.latencies[name])
+            endpoints[name] = {
+                "count": len(values),
+                "errors": recorder.errors[name],
+                "p50": round(_percentile(values, 0.50), 2),
+                "p95": round(_percentile(values, 0.95), 2),
+                "p99": round(_percentile(values, 0.99), 2),
+                "rps": round(len(values) / wall, 2) if wall else 0.0,
+                # Little's law: average requests of this endpoint the server had in flight
+                "concurrency": round(recorder.busy[name] / wall, 2) if wall else 0.0,
+                "peak_rss": recorder.peak_rss.get(name),
+            }
+        finished = sorted(seconds for seconds in outcomes if seconds is not None)
+        in_flight = recorder.in_flight_samples
+        results = {
+            "config": {key: options[key] for key in (
+                "clients", "concurrency", "runners", "build_seconds", "poll_interval", "artifact_bytes")},
+            "wall_seconds": round(wall, 2),
+            "builds": {
+                "finished": len(finished),
+                "failed": len(outcomes) - len(finished),
+                "p50": round(_percentile(finished, 0.50), 2),
+                "p95": round(_percentile(finished, 0.95), 2),
+                "per_minute": round(len(finished) / wall * 60, 2) if wall else 0.0,
+            },
+            "in_flight": {
+                "mean": round(sum(in_flight) / len(in_flight), 2) if in_flight else 0.0,
+                "peak": max(in_flight, default=0),
+            },
+            "rss": {
+                "before": rss_before,
+                "peak": max(recorder.rss_samples, default=None),
+                "after": rss_after,
+            },
+            "endpoints": endpoints,
+        }
+        if options["workers"]:
+            results["in_flight"]["saturation"] = round(results["in_flight"]["mean"] / options["workers"], 2)
+        return results
+
+    def report(self, results):
+        def mb(value):
+            return f"{value / 1024 / 1024:.1f}" if value else "n/a"
+
+        self.stdout.write(
+            f"{'endpoint':<20}{'count':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+            f"{'req/s':>8}{'conc':>7}{'rss MB':>9}"
+        )
+        for name, row in results["endpoints"].items():
+            self.stdout.write(
+                f"{name:<20}{row['count']:>7}{row['errors']:>5}{row['p50']:>10.1f}{row['p95']:>10.1f}"
+                f"{row['p99']:>10.1f}{row['rps']:>8.2f}{row['concurrency']:>7.2f}{mb(row['peak_rss']):>9}"
+            )
+        builds = results["builds"]
+        self.stdout.write(
+            f"builds: {builds['finished']} finished, {builds['failed']} failed, "
+            f"submit to download p50 {builds['p50']:.1f}s p95 {builds['p95']:.1f}s, "
+            f"{builds['per_minute']:.1f}/min over {results['wall_seconds']:.0f}s"
+        )
+        in_flight = results["in_flight"]
+        line = f"in flight: mean {in_flight['mean']:.2f}, peak {in_flight['peak']}"
+        if "saturation" in in_flight:
+            line += f", saturation {in_flight['saturation']:.0%} of the workers"
+        self.stdout.write(line)
+        rss = results["rss"]
+        self.stdout.write(f"server rss MB: before {mb(rss['before'])}, peak {mb(rss['peak'])}, after {mb(rss['after'])}")
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, row in results["endpoints"].items():
+            base = baseline.get("endpoints", {}).get(name)
+            if not base or not base["count"] or not row["count"]:
+                continue
+            # a few ms either way is noise on the fast endpoints
+            if row["p95"] > base["p95"] * (1 + tolerance) and row["p95"] - base["p95"] > 5:
+                regressions.append(f"{name}: p95 {base['p95']:.1f} -> {row['p95']:.1f} ms")
+        base_builds = baseline.get("builds", {})
+        if base_builds.get("per_minute") and results["builds"]["per_minute"] < base_builds["per_minute"] * (1 - tolerance):
+            regressions.append(
+                f"throughput: {base_builds['per_minute']:.1f} -> {results['builds']['per_minute']:.1f} builds/min"
+            )
+        if regressions:
+            raise CommandError("slower than the baseline:\n" + "\n".join(regressions))
+        self.stdout.write(f"within {tolerance:.0%} of the baseline")
@@ -0,0 +1,89 @@
+import base64
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+import pyzipper
+from django.conf import settings as _settings
+from django.core.management.base import BaseCommand
+
+from rdgenerator import secretszip
+
+
+def _sample_inputs():
+    # roughly what _client_inputs produces for a typical form
+    custom = base64.b64encode(json.dumps({
+        "conn-type": "both", "disable-installation": "N", "disable-settings": "N",
+        "default-settings": {"theme": "dark", "verification-method": "use-permanent-password"},
+        "override-settings": {"enable-keyboard": "Y", "enable-clipboard": "Y", "enable-file-transfer": "Y"},
+        "password": "x" * 16, "enable-lan-discovery": "N", "direct-server": "Y",
+    }).encode()).decode()
+    return {
+        "server": "rd.example.com", "key": "OeVuKk5nlHiXp+APNn0Y3pC1Iwpwn44JGqrQCsWqmBw=",
+        "apiServer": "https://rd.example.com:21114", "custom": custom, "uuid": str(uuid.uuid4()),
+        "iconlink_url": "https://dce.example.com", "iconlink_uuid": str(uuid.uuid4()), "iconlink_file": "icon.png",
+        "logolink_url": "https://dce.example.com", "logolink_uuid": str(uuid.uuid4()), "logolink_file": "false",
+        "appname": "Example Desk", "genurl": "https://dce.example.com", "urlLink": "https://example.com",
+        "downloadLink": "https://example.com/download", "delayFix": "true", "rdgen": "true",
+        "cycleMonitor": "false", "xOffline": "false", "removeNewVersionNotif": "false",
+        "compname": "Example Ltd", "androidappid": "", "filename": "exampledesk",
+    }
+
+
+def _legacy_bundle(inputs_raw):
+    # what write_bundle did before: plaintext json on disk, re-read into an LZMA zip
+    temp_json_path = f"data_{uuid.uuid4()}.json"
+    zip_path = "%s/secrets_%s.zip" % (secretszip.ZIP_DIR, uuid.uuid4())
+    with open(temp_json_path, "w") as f:
+        json.dump(inputs_raw, f)
+    with pyzipper.AESZipFile(zip_path, 'w', compression=pyzipper.ZIP_LZMA, encryption=pyzipper.WZ_AES) as zf:
+        zf.setpassword(_settings.ZIP_PASSWORD.encode())
+        zf.write(temp_json_path, arcname="secrets.json")
+    os.remove(temp_json_path)
+    return zip_path
+
+
+def _current_bundle(inputs_raw, compression):
+    zip_path = "%s/secrets_%s.zip" % (secretszip.ZIP_DIR, uuid.uuid4())
+    with open(zip_path, "wb") as handle:
+        handle.write(secretszip.encrypt(inputs_raw, compression))
+    return zip_path
+
+
+class Command(BaseCommand):
+    help = "Time secrets bundle creation: the old temp-file LZMA path against in-memory bundles"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        inputs_raw = _sample_inputs()
+        variants = [("legacy temp file + lzma", _legacy_bundle)]
+        for name in secretszip.COMPRESSION:
+            variants.append((f"in memory + {name}", lambda inputs, name=name: _current_bundle(inputs, name)))
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                os.mkdir(secretszip.ZIP_DIR)
+                self.stdout.write(f"{'variant':<26}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'bytes':>8}")
+                for label, build in variants:
+                    timings = []
+                    size = 0
+                    for _ in range(options["iterations"]):
+                        started = time.perf_counter()
+                        zip_path = build(inputs_raw)
+                        timings.append((time.perf_counter() - started) * 1000)
+                        size = os.path.getsize(zip_path)
+                        os.remove(zip_path)
+                    timings.sort()
+                    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                    self.stdout.write(
+                        f"{label:<26}{statistics.mean(timings):>10.2f}{statistics.median(timings):>10.2f}{p95:>10.2f}{size:>8}"
+                    )
+            finally:
+                os.chdir(cwd)
@@ -0,0 +1,21 @@
+import time
+
+from django.conf import settings as _settings
+from django.core.management.base import BaseCommand
+
+from rdgenerator import janitor
+
+
+class Command(BaseCommand):
+    help = "Apply the retention policies to exe/, png/, temp_zips/, upload_tmp/, build logs and worktrees"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="report what would be removed")
+        parser.add_argument("--loop", action="store_true", help="repeat every JANITOR_INTERVAL seconds (default 1h)")
+
+    def handle(self, *args, **options):
+        while True:
+            self.stdout.write(janitor.run(dry_run=options["dry_run"]).summary())
+            if not options["loop"]:
+                return
+            time.sleep(_settings.JANITOR_INTERVAL or 3600)
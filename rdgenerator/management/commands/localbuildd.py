@@ -0,0 +1,34 @@
+import signal
+
+from django.conf import settings as _settings
+from django.core.management.base import BaseCommand
+
+from rdgenerator.localbuild import LocalBuildPool, prime_patch_cache, refresh_mirror, start_mirror_refresher
+from rdgenerator.management.commands.prime_patches import form_versions
+
+
+class Command(BaseCommand):
+    help = "Run the local build worker pool that executes builds queued with LOCAL_BUILD"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=_settings.LOCAL_BUILD_WORKERS)
+        parser.add_argument("--timeout", type=int, default=_settings.LOCAL_BUILD_TIMEOUT)
+        parser.add_argument("--skip-patch-check", action="store_true",
+                            help="don't check the patches against every version before serving")
+
+    def handle(self, *args, **options):
+        def _terminate(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, _terminate)
+        # builds resolve versions from the mirror's ref index, fill it before the first one
+        if refresh_mirror(form_versions()):
+            # they're looked up in RUSTDESK_SRC and fail if it doesn't have them either
+            self.stderr.write("some versions aren't in the RustDesk mirror, see above")
+        start_mirror_refresher(form_versions())
+        if not options["skip_patch_check"] and prime_patch_cache(form_versions()):
+            # builds still run, they skip the patch for the affected versions
+            self.stderr.write("some patches no longer apply, see above")
+        pool = LocalBuildPool(options["workers"], options["timeout"])
+        self.stdout.write(f"local build pool: {options['workers']} workers, {options['timeout']}s timeout")
+        pool.serve()
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from rdgenerator import phases
+
+
+class Command(BaseCommand):
+    help = "Show where build time goes: duration percentiles per phase, or one run's timeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=7)
+        parser.add_argument("--kind", choices=("step", "command"), help="only statuses or only subprocesses")
+        parser.add_argument("--uuid", help="print this run's timeline instead")
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["uuid"]:
+            rows = phases.timeline(options["uuid"])
+            if options["json"]:
+                self.stdout.write(json.dumps(rows, indent=2, ensure_ascii=False))
+                return
+            for row in rows:
+                seconds = "running" if row["seconds"] is None else f"{row['seconds']:.1f}s"
+                exit_code = "" if row["exit_code"] is None else f" exit {row['exit_code']}"
+                self.stdout.write(f"{row['started']}  {row['kind']:<7} {seconds:>9}{exit_code}  {row['name']}")
+            return
+
+        rows = phases.stats(options["days"], options["kind"])
+        if options["json"]:
+            self.stdout.write(json.dumps(rows, indent=2, ensure_ascii=False))
+            return
+        self.stdout.write(f"{'kind':<7} {'count':>6} {'fail':>5} {'p50':>8} {'p90':>8} {'p95':>8} {'max':>8} {'total':>10}  name")
+        for row in rows:
+            self.stdout.write(
+                f"{row['kind']:<7} {row['count']:>6} {row['failures']:>5} {row['p50']:>8} {row['p90']:>8} "
+                f"{row['p95']:>8} {row['max']:>8} {row['total']:>10}  {row['name']}"
+            )
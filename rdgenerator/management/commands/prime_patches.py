@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rdgenerator.forms import GenerateForm
+from rdgenerator.localbuild import prime_patch_cache
+
+
+def form_versions():
+    return [value for value, _ in GenerateForm.base_fields["version"].choices]
+
+
+class Command(BaseCommand):
+    help = "Check the local build patches against every RustDesk version the form offers and cache the results"
+
+    def add_arguments(self, parser):
+        parser.add_argument("versions", nargs="*", help="defaults to every version in the form")
+
+    def handle(self, *args, **options):
+        if prime_patch_cache(options["versions"] or form_versions()):
+            raise CommandError("some patches no longer apply, see above")
@@ -0,0 +1,45 @@
+import json
+from datetime import timedelta
+
+from django.conf import settings as _settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rdgenerator import secretszip
+from rdgenerator.models import BuildBatch, BuildPhase, GithubRun
+
+
+class Command(BaseCommand):
+    help = "Delete finished runs older than RUN_RETENTION_DAYS, optionally archiving them to a JSON lines file first"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=_settings.RUN_RETENTION_DAYS)
+        parser.add_argument("--archive", default="", help="append the purged rows to this file as JSON lines")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        runs = GithubRun.objects.filter(completed__lt=cutoff).order_by("id")
+        batches = BuildBatch.objects.filter(created__lt=cutoff)
+        if options["dry_run"]:
+            self.stdout.write(f"would purge {runs.count()} runs and {batches.count()} batches")
+            return
+
+        purged = 0
+        while True:
+            chunk = list(runs.values()[:500])
+            if not chunk:
+                break
+            if options["archive"]:
+                with open(options["archive"], "a", encoding="utf-8") as handle:
+                    for row in chunk:
+                        handle.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+            GithubRun.objects.filter(pk__in=[row["id"] for row in chunk]).delete()
+            BuildPhase.objects.filter(run_uuid__in=[row["uuid"] for row in chunk]).delete()
+            # a finished run normally gave its zip up already
+            for zip_filename in {row["secrets_zip"] for row in chunk if row["secrets_zip"]}:
+                secretszip.delete_if_unused(zip_filename)
+            purged += len(chunk)
+
+        deleted_batches, _ = batches.delete()
+        self.stdout.write(f"purged {purged} runs and {deleted_batches} batches older than {options['days']} days")
@@ -0,0 +1,49 @@
+import os
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from rdgenerator import artifacts, secretszip
+from rdgenerator.models import Artifact
+
+
+class Command(BaseCommand):
+    help = "Bring the artifact manifest and the secrets zip registry in line with exe/ and temp_zips/"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--zip-grace", type=int, default=3600,
+                            help="unreferenced zips younger than this many seconds are left alone")
+        parser.add_argument("--every", type=int, default=0, help="repeat every N seconds instead of exiting")
+
+    def handle(self, *args, **options):
+        while True:
+            self.reconcile(options["zip_grace"])
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
+
+    def reconcile(self, zip_grace):
+        output_root = Path(artifacts.OUTPUT_DIR)
+        on_disk = set()
+        added = 0
+        if output_root.is_dir():
+            with os.scandir(output_root) as runs:
+                for run_dir in runs:
+                    if not run_dir.is_dir():
+                        continue
+                    added += artifacts.record_dir(run_dir.name)
+                    with os.scandir(run_dir.path) as entries:
+                        on_disk.update((run_dir.name, entry.name) for entry in entries if entry.is_file())
+        removed = 0
+        for pk, run_uuid, name in Artifact.objects.values_list("pk", "run_uuid", "name").iterator():
+            if (run_uuid, name) not in on_disk:
+                Artifact.objects.filter(pk=pk).delete()
+                removed += 1
+
+        deleted_zips, _, dangling = secretszip.sweep(zip_grace)
+
+        self.stdout.write(
+            f"artifacts: {added} recorded, {removed} removed; "
+            f"secrets zips: {deleted_zips} deleted, {dangling} dangling references cleared"
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from rdgenerator import dispatch
+
+
+class Command(BaseCommand):
+    help = "Send queued GitHub workflow dispatches, for deployments with DISPATCH_WORKER_THREAD off"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="drain the due dispatches and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            count = dispatch.drain()
+            self.stdout.write(f"attempted {count} dispatches")
+            return
+        dispatch.run_forever()
@@ -0,0 +1,26 @@
+from django.conf import settings as _settings
+from django.http import HttpResponse
+
+
+class UploadLimitMiddleware:
+    """Refuses request bodies over the configured size from Content-Length, before anything is read.
+
+    Build artifacts posted to ARTIFACT_UPLOAD_PATHS get ARTIFACT_UPLOAD_MAX_BYTES,
+    everything else UPLOAD_MAX_BYTES.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            return HttpResponse("Invalid Content-Length", status=400)
+        if request.path.startswith(_settings.ARTIFACT_UPLOAD_PATHS):
+            limit = _settings.ARTIFACT_UPLOAD_MAX_BYTES
+        else:
+            limit = _settings.UPLOAD_MAX_BYTES
+        if length > limit:
+            return HttpResponse("Request body too large", status=413)
+        return self.get_response(request)
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, unique=True, verbose_name='fingerprint')),
+                ('platform', models.CharField(max_length=20, verbose_name='platform')),
+                ('version', models.CharField(max_length=20, verbose_name='version')),
+                ('complete', models.BooleanField(default=False, verbose_name='complete')),
+                ('size', models.BigIntegerField(default=0, verbose_name='size')),
+                ('hits', models.IntegerField(default=0, verbose_name='hits')),
+                ('misses', models.IntegerField(default=0, verbose_name='misses')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created')),
+                ('last_used', models.DateTimeField(default=django.utils.timezone.now, verbose_name='last used')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='fingerprint'),
+        ),
+    ]
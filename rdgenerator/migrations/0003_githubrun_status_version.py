@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0002_build_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='status_version',
+            field=models.IntegerField(default=0, verbose_name='status version'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0003_githubrun_status_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatch_after',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='dispatch after'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatch_attempts',
+            field=models.IntegerField(default=0, verbose_name='dispatch attempts'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatch_payload',
+            field=models.TextField(blank=True, default='', verbose_name='dispatch payload'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatch_state',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='dispatch state'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='dispatch_url',
+            field=models.CharField(blank=True, default='', max_length=300, verbose_name='dispatch url'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0004_dispatch_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='backend',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='backend'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='platform',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='platform'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='requester',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='requester'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0005_scheduler'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='build_exit_code',
+            field=models.IntegerField(blank=True, null=True, verbose_name='build exit code'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='build_finished',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='build finished'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='build_pid',
+            field=models.IntegerField(blank=True, null=True, verbose_name='build pid'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='build_started',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='build started'),
+        ),
+    ]
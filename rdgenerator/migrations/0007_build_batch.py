@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0006_local_build_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=100, unique=True, verbose_name='batch id')),
+                ('members', models.TextField(default='[]', verbose_name='members')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='depends_on',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='depends on'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0007_build_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='secrets_zip',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100, verbose_name='secrets zip'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+SUCCESS_STATUSES = ("成功！", "success")
+FAILURE_STATUSES = ("生成失败，请重试", "生成已取消，请重试")
+FAILURE_PREFIXES = ("failed", "dispatch failed", "local build failed")
+
+
+def backfill(apps, schema_editor):
+    GithubRun = apps.get_model('rdgenerator', 'GithubRun')
+    # uuid becomes unique, keep the newest row of any duplicate
+    seen = set()
+    for run in GithubRun.objects.order_by('-id').only('id', 'uuid'):
+        if run.uuid in seen:
+            GithubRun.objects.filter(pk=run.pk).delete()
+        seen.add(run.uuid)
+    # older rows have no timestamps, count finished ones as completed now
+    # so they age out with the retention window
+    now = django.utils.timezone.now()
+    for run in GithubRun.objects.only('id', 'status'):
+        status = run.status or ""
+        if status in SUCCESS_STATUSES or status in FAILURE_STATUSES or status.startswith(FAILURE_PREFIXES):
+            GithubRun.objects.filter(pk=run.pk).update(completed=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0008_githubrun_secrets_zip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='githubrun',
+            name='completed',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='completed'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='created'),
+        ),
+        migrations.AddField(
+            model_name='githubrun',
+            name='updated',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='updated'),
+        ),
+        migrations.AlterField(
+            model_name='githubrun',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='fingerprint'),
+        ),
+        migrations.AlterField(
+            model_name='githubrun',
+            name='id',
+            field=models.AutoField(primary_key=True, serialize=False, verbose_name='ID'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='githubrun',
+            name='uuid',
+            field=models.CharField(max_length=100, unique=True, verbose_name='uuid'),
+        ),
+        migrations.AddIndex(
+            model_name='githubrun',
+            index=models.Index(fields=['dispatch_state', 'dispatch_after'], name='githubrun_dispatch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='githubrun',
+            index=models.Index(fields=['backend', 'dispatch_state'], name='githubrun_backend_idx'),
+        ),
+    ]
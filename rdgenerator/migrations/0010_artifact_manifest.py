@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0009_job_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Artifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_uuid', models.CharField(max_length=100, verbose_name='run uuid')),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('size', models.BigIntegerField(default=0, verbose_name='size')),
+                ('sha256', models.CharField(blank=True, default='', max_length=64, verbose_name='sha256')),
+                ('mtime', models.DateTimeField(verbose_name='mtime')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('run_uuid', 'name'), name='artifact_run_name')],
+            },
+        ),
+    ]
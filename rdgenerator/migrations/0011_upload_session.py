@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:16
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0010_artifact_manifest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.CharField(max_length=100, unique=True, verbose_name='upload id')),
+                ('run_uuid', models.CharField(db_index=True, max_length=100, verbose_name='run uuid')),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('size', models.BigIntegerField(verbose_name='size')),
+                ('sha256', models.CharField(max_length=64, verbose_name='sha256')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='created')),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now, verbose_name='updated')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0011_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildPhase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_uuid', models.CharField(db_index=True, max_length=100, verbose_name='run uuid')),
+                ('kind', models.CharField(max_length=10, verbose_name='kind')),
+                ('name', models.CharField(max_length=100, verbose_name='name')),
+                ('started', models.DateTimeField(verbose_name='started')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='finished')),
+                ('exit_code', models.IntegerField(blank=True, null=True, verbose_name='exit code')),
+                ('host', models.CharField(blank=True, default='', max_length=100, verbose_name='host')),
+                ('cpu_seconds', models.FloatField(blank=True, null=True, verbose_name='cpu seconds')),
+                ('max_rss', models.BigIntegerField(blank=True, null=True, verbose_name='max rss')),
+                ('samples', models.TextField(blank=True, default='', verbose_name='samples')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'started'], name='buildphase_kind_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rdgenerator', '0012_build_phase'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildcacheentry',
+            name='manifest',
+            field=models.TextField(blank=True, default='', verbose_name='manifest'),
+        ),
+    ]
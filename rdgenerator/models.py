@@ -1,6 +1,129 @@
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+# statuses posted to updategh by the workflows and the local build script
+SUCCESS_STATUSES = ("成功！", "success")
+FAILURE_STATUSES = ("生成失败，请重试", "生成已取消，请重试")
+FAILURE_PREFIXES = ("failed", "dispatch failed", "local build failed")
+
+def is_terminal_status(status):
+    status = status or ""
+    return status in SUCCESS_STATUSES or status in FAILURE_STATUSES or status.startswith(FAILURE_PREFIXES)
 
 class GithubRun(models.Model):
-    id = models.IntegerField(verbose_name="ID",primary_key=True)
-    uuid = models.CharField(verbose_name="uuid", max_length=100)
+    # AutoField so PostgreSQL assigns ids too, SQLite did it through rowid
+    id = models.AutoField(verbose_name="ID",primary_key=True)
+    uuid = models.CharField(verbose_name="uuid", max_length=100, unique=True)
     status = models.CharField(verbose_name="status", max_length=100)
+    fingerprint = models.CharField(verbose_name="fingerprint", max_length=64, blank=True, default="", db_index=True)
+    status_version = models.IntegerField(verbose_name="status version", default=0)
+    dispatch_state = models.CharField(verbose_name="dispatch state", max_length=20, blank=True, default="")
+    dispatch_url = models.CharField(verbose_name="dispatch url", max_length=300, blank=True, default="")
+    dispatch_payload = models.TextField(verbose_name="dispatch payload", blank=True, default="")
+    dispatch_attempts = models.IntegerField(verbose_name="dispatch attempts", default=0)
+    dispatch_after = models.DateTimeField(verbose_name="dispatch after", null=True, blank=True)
+    backend = models.CharField(verbose_name="backend", max_length=20, blank=True, default="")
+    platform = models.CharField(verbose_name="platform", max_length=20, blank=True, default="")
+    requester = models.CharField(verbose_name="requester", max_length=64, blank=True, default="")
+    build_pid = models.IntegerField(verbose_name="build pid", null=True, blank=True)
+    build_started = models.DateTimeField(verbose_name="build started", null=True, blank=True)
+    build_finished = models.DateTimeField(verbose_name="build finished", null=True, blank=True)
+    build_exit_code = models.IntegerField(verbose_name="build exit code", null=True, blank=True)
+    depends_on = models.CharField(verbose_name="depends on", max_length=100, blank=True, default="")
+    secrets_zip = models.CharField(verbose_name="secrets zip", max_length=100, blank=True, default="", db_index=True)
+    created = models.DateTimeField(verbose_name="created", default=timezone.now)
+    updated = models.DateTimeField(verbose_name="updated", default=timezone.now)
+    # set once the status is terminal, purge_runs goes by it
+    completed = models.DateTimeField(verbose_name="completed", null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # the scheduler's scans
+            models.Index(fields=["dispatch_state", "dispatch_after"], name="githubrun_dispatch_idx"),
+            models.Index(fields=["backend", "dispatch_state"], name="githubrun_backend_idx"),
+        ]
+
+class BuildCacheEntry(models.Model):
+    fingerprint = models.CharField(verbose_name="fingerprint", max_length=64, unique=True)
+    platform = models.CharField(verbose_name="platform", max_length=20)
+    version = models.CharField(verbose_name="version", max_length=20)
+    complete = models.BooleanField(verbose_name="complete", default=False)
+    size = models.BigIntegerField(verbose_name="size", default=0)
+    hits = models.IntegerField(verbose_name="hits", default=0)
+    misses = models.IntegerField(verbose_name="misses", default=0)
+    created = models.DateTimeField(verbose_name="created", default=timezone.now)
+    last_used = models.DateTimeField(verbose_name="last used", default=timezone.now)
+    # JSON {file name: sha256} of the cached files, restores copy it into the artifact manifest
+    manifest = models.TextField(verbose_name="manifest", blank=True, default="")
+
+class BuildBatch(models.Model):
+    batch_id = models.CharField(verbose_name="batch id", max_length=100, unique=True)
+    # JSON list of {index, uuid, filename, platform, cached, duplicate_of}
+    members = models.TextField(verbose_name="members", default="[]")
+    created = models.DateTimeField(verbose_name="created", default=timezone.now)
+
+class Artifact(models.Model):
+    # manifest of exe/<uuid>, so polls don't list the directory
+    run_uuid = models.CharField(verbose_name="run uuid", max_length=100)
+    name = models.CharField(verbose_name="name", max_length=255)
+    size = models.BigIntegerField(verbose_name="size", default=0)
+    sha256 = models.CharField(verbose_name="sha256", max_length=64, blank=True, default="")
+    mtime = models.DateTimeField(verbose_name="mtime")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["run_uuid", "name"], name="artifact_run_name"),
+        ]
+
+class UploadSession(models.Model):
+    # a resumable artifact upload, the bytes so far are in upload_tmp/<upload_id>.part
+    upload_id = models.CharField(verbose_name="upload id", max_length=100, unique=True)
+    run_uuid = models.CharField(verbose_name="run uuid", max_length=100, db_index=True)
+    name = models.CharField(verbose_name="name", max_length=255)
+    size = models.BigIntegerField(verbose_name="size")
+    sha256 = models.CharField(verbose_name="sha256", max_length=64)
+    created = models.DateTimeField(verbose_name="created", default=timezone.now)
+    updated = models.DateTimeField(verbose_name="updated", default=timezone.now)
+
+class BuildPhase(models.Model):
+    # one step of a run's timeline: a status it reported ("step") or a
+    # subprocess the local build script ran ("command")
+    run_uuid = models.CharField(verbose_name="run uuid", max_length=100, db_index=True)
+    kind = models.CharField(verbose_name="kind", max_length=10)
+    name = models.CharField(verbose_name="name", max_length=100)
+    started = models.DateTimeField(verbose_name="started")
+    finished = models.DateTimeField(verbose_name="finished", null=True, blank=True)
+    exit_code = models.IntegerField(verbose_name="exit code", null=True, blank=True)
+    host = models.CharField(verbose_name="host", max_length=100, blank=True, default="")
+    cpu_seconds = models.FloatField(verbose_name="cpu seconds", null=True, blank=True)
+    max_rss = models.BigIntegerField(verbose_name="max rss", null=True, blank=True)
+    # JSON list of [seconds since start, host cpu percent, rss of the process tree]
+    samples = models.TextField(verbose_name="samples", blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # the percentile report's scan
+            models.Index(fields=["kind", "started"], name="buildphase_kind_idx"),
+        ]
+
+def set_run_status(myuuid, status):
+    now = timezone.now()
+    terminal = is_terminal_status(status)
+    GithubRun.objects.filter(uuid=myuuid).update(
+        status=status,
+        status_version=F('status_version') + 1,
+        updated=now,
+        completed=now if terminal else None,
+    )
+    if terminal:
+        # frees the scheduler slot held by the run, and keeps a run that is still
+        # queued or being sent from being dispatched after it finished
+        GithubRun.objects.filter(
+            uuid=myuuid, dispatch_state__in=("queued", "sending", "sent")
+        ).update(dispatch_state="done")
+    # imported here, statuscache and phases read through this module
+    from .statuscache import refresh
+    from .phases import status_changed
+    refresh(myuuid)
+    status_changed(myuuid, status, now)
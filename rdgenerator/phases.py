@@ -0,0 +1,108 @@
+import json
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .models import BuildPhase, FAILURE_STATUSES, FAILURE_PREFIXES, is_terminal_status
+
+PERCENTILES = (50, 90, 95)
+MAX_SAMPLES = 500
+
+
+def status_changed(myuuid, status, now=None):
+    """Close the run's open step and start one named after status, unless it is terminal."""
+    now = now or timezone.now()
+    status = (status or "")[:100]
+    open_step = BuildPhase.objects.filter(run_uuid=myuuid, kind="step", finished__isnull=True).order_by("-id").first()
+    if open_step and open_step.name == status:
+        # repeated posts such as "waiting for a free worktree"
+        return
+    if open_step:
+        # the step a run fails in is the one that was running when it reported the failure
+        failed = status in FAILURE_STATUSES or status.startswith(FAILURE_PREFIXES)
+        BuildPhase.objects.filter(run_uuid=myuuid, kind="step", finished__isnull=True).update(
+            finished=now, exit_code=1 if failed else 0
+        )
+    if not is_terminal_status(status):
+        BuildPhase.objects.create(run_uuid=myuuid, kind="step", name=status, started=now)
+
+
+def _timestamp(value):
+    return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+
+
+def record_command(myuuid, event):
+    """Store a finished subprocess reported by the local build script, raises ValueError on bad input."""
+    if not isinstance(event, dict) or not event.get("name"):
+        raise ValueError("phase needs a name")
+    samples = event.get("samples") or []
+    if not isinstance(samples, list):
+        raise ValueError("samples must be a list")
+    BuildPhase.objects.create(
+        run_uuid=myuuid,
+        kind="command",
+        name=str(event["name"])[:100],
+        started=_timestamp(event["started"]),
+        finished=_timestamp(event["finished"]),
+        exit_code=int(event["exit_code"]) if event.get("exit_code") is not None else None,
+        host=str(event.get("host", ""))[:100],
+        cpu_seconds=float(event["cpu_seconds"]) if event.get("cpu_seconds") is not None else None,
+        max_rss=int(event["max_rss"]) if event.get("max_rss") is not None else None,
+        samples=json.dumps(samples[:MAX_SAMPLES]) if samples else "",
+    )
+
+
+def _seconds(phase):
+    return (phase["finished"] - phase["started"]).total_seconds()
+
+
+def timeline(myuuid):
+    """Every phase of the run in start order, with durations in seconds."""
+    phases = []
+    for phase in BuildPhase.objects.filter(run_uuid=myuuid).order_by("started", "id").values():
+        phases.append({
+            "kind": phase["kind"],
+            "name": phase["name"],
+            "started": phase["started"].isoformat(),
+            "finished": phase["finished"].isoformat() if phase["finished"] else None,
+            "seconds": round(_seconds(phase), 1) if phase["finished"] else None,
+            "exit_code": phase["exit_code"],
+            "host": phase["host"],
+            "cpu_seconds": phase["cpu_seconds"],
+            "max_rss": phase["max_rss"],
+            "samples": json.loads(phase["samples"]) if phase["samples"] else [],
+        })
+    return phases
+
+
+def _percentile(ordered, pct):
+    # nearest rank, ordered is sorted ascending
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def stats(days=7, kind=None):
+    """Duration percentiles per (kind, name) over the phases finished in the last days."""
+    phases = BuildPhase.objects.filter(started__gte=timezone.now() - timedelta(days=days), finished__isnull=False)
+    if kind:
+        phases = phases.filter(kind=kind)
+    durations = defaultdict(list)
+    failures = defaultdict(int)
+    for phase in phases.values("kind", "name", "started", "finished", "exit_code").iterator():
+        key = (phase["kind"], phase["name"])
+        durations[key].append(_seconds(phase))
+        if phase["exit_code"]:
+            failures[key] += 1
+    rows = []
+    for (phase_kind, name), values in durations.items():
+        values.sort()
+        row = {"kind": phase_kind, "name": name, "count": len(values), "failures": failures[(phase_kind, name)]}
+        for pct in PERCENTILES:
+            row[f"p{pct}"] = round(_percentile(values, pct), 1)
+        row["max"] = round(values[-1], 1)
+        row["total"] = round(sum(values), 1)
+        rows.append(row)
+    # where the build minutes go, biggest first
+    rows.sort(key=lambda row: row["total"], reverse=True)
+    return rows
@@ -0,0 +1,104 @@
+import io
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+import pyzipper
+from django.conf import settings as _settings
+
+from .models import GithubRun
+
+ZIP_DIR = "temp_zips"
+# the payload is a few hundred bytes of JSON, LZMA costs more than it saves there
+COMPRESSION = {
+    "stored": pyzipper.ZIP_STORED,
+    "deflate": pyzipper.ZIP_DEFLATED,
+    "lzma": pyzipper.ZIP_LZMA,
+}
+
+
+def write_bundle(inputs_raw, platforms=None):
+    """Encrypt the build inputs into temp_zips/secrets_<id>.zip and return the file name.
+
+    `platforms` maps platform -> inputs for a matrix build. All of them share one
+    bundle: the first platform's inputs are stored as usual and the keys that
+    differ for the others (uuid, custom, ...) go under "platforms".
+    """
+    secrets = dict(inputs_raw)
+    if platforms:
+        secrets["platforms"] = {
+            platform: {k: v for k, v in inputs.items() if inputs_raw.get(k) != v}
+            for platform, inputs in platforms.items()
+        }
+
+    zip_filename = f"secrets_{uuid.uuid4()}.zip"
+    Path(ZIP_DIR).mkdir(parents=True, exist_ok=True)
+    # only the encrypted bytes reach the disk, renamed into place so /get_zip
+    # never serves half a file
+    tmp_path = Path(ZIP_DIR) / f".{zip_filename}.tmp"
+    tmp_path.write_bytes(encrypt(secrets))
+    os.replace(tmp_path, Path(ZIP_DIR) / zip_filename)
+    return zip_filename
+
+
+def encrypt(secrets, compression=None):
+    """Returns an AES zip holding secrets as secrets.json, built in memory."""
+    compression = COMPRESSION[compression or _settings.SECRETS_ZIP_COMPRESSION]
+    buffer = io.BytesIO()
+    with pyzipper.AESZipFile(buffer, 'w', compression=compression, encryption=pyzipper.WZ_AES) as zf:
+        zf.setpassword(_settings.ZIP_PASSWORD.encode())
+        zf.writestr("secrets.json", json.dumps(secrets))
+    return buffer.getvalue()
+
+
+def delete_if_unused(zip_filename):
+    if not zip_filename or GithubRun.objects.filter(secrets_zip=zip_filename).exists():
+        return False
+    try:
+        os.remove(os.path.join(ZIP_DIR, zip_filename))
+    except FileNotFoundError:
+        return False
+    print(f"Successfully deleted {zip_filename}")
+    return True
+
+
+def release(myuuid):
+    """Drop the run's reference to its secrets zip, the zip goes once no run needs it."""
+    zip_filename = GithubRun.objects.filter(uuid=myuuid).values_list("secrets_zip", flat=True).first()
+    if not zip_filename:
+        return False
+    GithubRun.objects.filter(uuid=myuuid).update(secrets_zip="")
+    return delete_if_unused(zip_filename)
+
+
+def sweep(grace, dry_run=False):
+    """Delete zips no run references that are older than `grace` seconds and clear
+    references to zips that are gone. Returns (deleted, bytes, cleared)."""
+    zips = set()
+    deleted = reclaimed = 0
+    if os.path.isdir(ZIP_DIR):
+        cutoff = time.time() - grace
+        with os.scandir(ZIP_DIR) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                zips.add(entry.name)
+                stat = entry.stat()
+                # written but never handed to a run, e.g. the request died in between
+                if stat.st_mtime >= cutoff or GithubRun.objects.filter(secrets_zip=entry.name).exists():
+                    continue
+                if dry_run or delete_if_unused(entry.name):
+                    zips.discard(entry.name)
+                    deleted += 1
+                    reclaimed += stat.st_size
+    cleared = 0
+    referenced = GithubRun.objects.exclude(secrets_zip="").values_list("secrets_zip", flat=True).distinct()
+    for zip_filename in list(referenced):
+        if zip_filename not in zips:
+            if dry_run:
+                cleared += GithubRun.objects.filter(secrets_zip=zip_filename).count()
+            else:
+                cleared += GithubRun.objects.filter(secrets_zip=zip_filename).update(secrets_zip="")
+    return deleted, reclaimed, cleared
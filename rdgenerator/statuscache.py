@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings as _settings
+from django.core.cache import caches
+
+from .models import GithubRun, is_terminal_status
+
+COUNTERS = ("hits", "misses", "writes", "stampede_waits")
+# seconds between pushes of this process's counters into the shared cache
+COUNTER_FLUSH_INTERVAL = 10
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _cache():
+    return caches[_settings.STATUS_CACHE_ALIAS]
+
+
+def _key(myuuid):
+    return f"run_status:{myuuid}"
+
+
+def _count(name):
+    # counted per process, a poll shouldn't pay for a cache write (several file
+    # writes on FileBasedCache); the totals are merged in the cache now and then
+    with _counts_lock:
+        _counts[name] += 1
+        due = time.monotonic() - _flushed_at >= COUNTER_FLUSH_INTERVAL
+    if due:
+        _flush_counts()
+
+
+def _flush_counts():
+    global _flushed_at
+    with _counts_lock:
+        pending = dict(_counts)
+        _counts.clear()
+        _flushed_at = time.monotonic()
+    cache = _cache()
+    for name, value in pending.items():
+        key = f"status_cache:{name}"
+        if cache.add(key, value, timeout=None):
+            continue
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.add(key, value, timeout=None)
+
+
+def put(myuuid, row):
+    """Cache {'status', 'status_version'} for the run, None records that there is no such run."""
+    if row and is_terminal_status(row["status"]):
+        ttl = _settings.STATUS_CACHE_TERMINAL_TTL
+    else:
+        ttl = _settings.STATUS_CACHE_TTL
+    _cache().set(_key(myuuid), dict(row) if row else {}, ttl)
+
+
+def load(myuuid):
+    row = GithubRun.objects.filter(uuid=myuuid).values("status", "status_version").first()
+    put(myuuid, row)
+    return row
+
+
+def refresh(myuuid):
+    # write-through after a status update, the version is bumped in SQL so read it back
+    _count("writes")
+    return load(myuuid)
+
+
+def get(myuuid):
+    """Returns {'status', 'status_version'} for the run or None, from the cache when possible.
+
+    On a miss only one caller per uuid reads the database, the others wait up to
+    STATUS_CACHE_LOCK_TTL for it to fill the entry.
+    """
+    cache = _cache()
+    key = _key(myuuid)
+    cached = cache.get(key)
+    if cached is not None:
+        _count("hits")
+        return cached or None
+    lock = f"{key}:lock"
+    locked = cache.add(lock, 1, _settings.STATUS_CACHE_LOCK_TTL)
+    if not locked:
+        _count("stampede_waits")
+        deadline = time.monotonic() + _settings.STATUS_CACHE_LOCK_TTL
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            cached = cache.get(key)
+            if cached is not None:
+                _count("hits")
+                return cached or None
+        # the lock holder died or is very slow, read it ourselves
+    try:
+        _count("misses")
+        return load(myuuid)
+    finally:
+        # a waiter that timed out must not drop the lock another request holds
+        if locked:
+            cache.delete(lock)
+
+
+def stats():
+    # other processes' counts show up after their next flush
+    _flush_counts()
+    values = _cache().get_many([f"status_cache:{name}" for name in COUNTERS])
+    counters = {name: values.get(f"status_cache:{name}", 0) for name in COUNTERS}
+    return {
+        "backend": _settings.CACHES[_settings.STATUS_CACHE_ALIAS]["BACKEND"].rsplit(".", 1)[-1],
+        **counters,
+        "db_reads_avoided": counters["hits"],
+    }
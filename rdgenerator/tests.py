@@ -1,3 +1,500 @@
-from django.test import TestCase
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import artifacts, buildcache, dispatch, janitor, statuscache, uploads
+from .models import Artifact, BuildBatch, BuildCacheEntry, GithubRun, UploadSession, set_run_status
+
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "dce-tests"}}
+
+
+def load_build_script():
+    path = Path(settings.BASE_DIR) / "scripts" / "build_windows_local.py"
+    spec = importlib.util.spec_from_file_location("build_windows_local", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_run(myuuid, **fields):
+    fields.setdefault("status", "正在启动生成器……请稍候")
+    return GithubRun.objects.create(uuid=myuuid, **fields)
+
+
+def age(path, days):
+    stamp = time.time() - days * 86400
+    os.utime(path, (stamp, stamp))
+
+
+class BaseKeyInputsTests(SimpleTestCase):
+    def test_script_keys_bases_by_the_code_inputs(self):
+        # a field missing on one side lets two different clients share a base
+        self.assertEqual(tuple(load_build_script().CODE_FIELDS), buildcache.CODE_INPUTS)
+
+
+class WorkdirMixin:
+    """Runs each test in an empty working directory, exe/, png/ and upload_tmp/ are relative."""
+
+    def setUp(self):
+        super().setUp()
+        self.workdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        cwd = os.getcwd()
+        os.chdir(self.workdir)
+        self.addCleanup(os.chdir, cwd)
+        # background hashing would run outside the test transaction
+        patcher = mock.patch.object(artifacts, "_hash_later")
+        self.hash_later = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_output(self, myuuid, name, data=b"client"):
+        path = Path(artifacts.OUTPUT_DIR) / myuuid / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return path
+
+
+@override_settings(
+    CACHES=LOCMEM,
+    DISPATCH_WORKER_THREAD=False,
+    BUILD_SLOTS={"github": 2, "local": 1},
+    BUILD_PLATFORM_SLOTS={},
+)
+class DispatchTests(TestCase):
+    def queue(self, myuuid, **fields):
+        fields.setdefault("backend", "github")
+        fields.setdefault("platform", "windows")
+        fields.setdefault("dispatch_after", timezone.now())
+        return make_run(myuuid, dispatch_state="queued", **fields)
+
+    def test_claim_takes_the_oldest_due_run(self):
+        self.queue("a")
+        self.queue("b")
+        run = dispatch._claim()
+        self.assertEqual(run.uuid, "a")
+        self.assertEqual(run.dispatch_state, "sending")
+        self.assertEqual(run.dispatch_attempts, 1)
+
+    def test_claim_skips_runs_not_due_yet(self):
+        self.queue("later", dispatch_after=timezone.now() + timedelta(minutes=5))
+        self.assertIsNone(dispatch._claim())
+
+    def test_claim_respects_backend_slots(self):
+        self.queue("a", backend="local")
+        self.queue("b", backend="local")
+        self.assertEqual(dispatch._claim().uuid, "a")
+        self.assertIsNone(dispatch._claim())
+
+    @override_settings(BUILD_PLATFORM_SLOTS={"windows": 1})
+    def test_claim_respects_platform_slots(self):
+        self.queue("win1")
+        self.queue("win2")
+        self.queue("mac", platform="macos")
+        self.assertEqual(dispatch._claim().uuid, "win1")
+        self.assertEqual(dispatch._claim().uuid, "mac")
+        self.assertIsNone(dispatch._claim())
+
+    def test_expired_builds_stop_holding_their_slot(self):
+        stale = timezone.now() - timedelta(seconds=settings.BUILD_SLOT_TIMEOUT + 60)
+        make_run("old1", backend="local", dispatch_state="sent", dispatch_after=stale)
+        self.queue("new", backend="local")
+        self.assertEqual(dispatch._claim().uuid, "new")
+
+    def test_requester_with_fewer_running_builds_goes_first(self):
+        make_run("running", backend="github", dispatch_state="sent", dispatch_after=timezone.now(), requester="busy")
+        self.queue("first", requester="busy")
+        self.queue("second", requester="idle")
+        self.assertEqual(dispatch._claim().uuid, "second")
+
+    def test_dependent_run_waits_for_its_base_build(self):
+        self.queue("base")
+        self.queue("member", depends_on="base")
+        self.assertEqual(dispatch._claim().uuid, "base")
+        self.assertIsNone(dispatch._claim())
+        set_run_status("base", "success")
+        self.assertEqual(dispatch._claim().uuid, "member")
+
+    def test_completed_run_is_not_claimed(self):
+        self.queue("done")
+        GithubRun.objects.filter(uuid="done").update(completed=timezone.now())
+        self.assertIsNone(dispatch._claim())
+
+    def test_claim_picks_again_after_losing_a_race(self):
+        self.queue("a")
+        self.queue("b")
+        real_pick = dispatch._pick
+        calls = []
+
+        def pick_then_lose(*args):
+            run = real_pick(*args)
+            if not calls:
+                # another worker claims the row between the pick and the update
+                lease = timezone.now() + timedelta(seconds=settings.DISPATCH_LEASE)
+                GithubRun.objects.filter(pk=run.pk).update(dispatch_state="sending", dispatch_after=lease)
+            calls.append(run.uuid)
+            return run
+
+        with mock.patch.object(dispatch, "_pick", side_effect=pick_then_lose):
+            run = dispatch._claim()
+        self.assertEqual(calls, ["a", "b"])
+        self.assertEqual(run.uuid, "b")
+
+    def test_terminal_status_frees_the_slot(self):
+        self.queue("a", backend="local")
+        self.queue("b", backend="local")
+        run = dispatch._claim()
+        dispatch._mark_sent(run)
+        self.assertIsNone(dispatch._claim())
+        set_run_status("a", "生成失败，请重试")
+        self.assertEqual(GithubRun.objects.get(uuid="a").dispatch_state, "done")
+        self.assertEqual(dispatch._claim().uuid, "b")
+
+    def test_queue_position(self):
+        self.queue("a")
+        self.queue("b")
+        self.queue("other", backend="local")
+        self.assertEqual(dispatch.queue_position("a"), 1)
+        self.assertEqual(dispatch.queue_position("b"), 2)
+        self.assertEqual(dispatch.queue_position("other"), 1)
+        dispatch._claim()
+        self.assertEqual(dispatch.queue_position("a"), 0)
+        self.assertEqual(dispatch.queue_position("b"), 1)
+
+    def test_cancel_queued_run(self):
+        self.queue("a")
+        self.assertTrue(dispatch.cancel("a"))
+        run = GithubRun.objects.get(uuid="a")
+        self.assertEqual(run.dispatch_state, "cancelled")
+        self.assertIsNotNone(run.completed)
+        self.assertIsNone(dispatch._claim())
+
+
+@override_settings(CACHES=LOCMEM, BUILD_CACHE_ENABLED=True, BUILD_CACHE_MAX_ENTRIES=500)
+class BuildCacheTests(WorkdirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache_dir = override_settings(BUILD_CACHE_DIR=str(self.workdir / "build_cache"))
+        cache_dir.enable()
+        self.addCleanup(cache_dir.disable)
+
+    def build(self, myuuid, fingerprint, data=b"client"):
+        make_run(myuuid, fingerprint=fingerprint)
+        buildcache.record_miss(fingerprint, "windows", "1.3.0")
+        path = self.write_output(myuuid, "client.exe", data)
+        artifacts.record(myuuid, path)
+        buildcache.add_artifact(fingerprint, path)
+        buildcache.finalize(fingerprint, myuuid)
+        return path
+
+    def test_fingerprint_ignores_volatile_inputs_and_custom_key_order(self):
+        custom_a = "eyJhIjogMSwgImIiOiAyfQ=="  # {"a": 1, "b": 2}
+        custom_b = "eyJiIjogMiwgImEiOiAxfQ=="  # {"b": 2, "a": 1}
+        first = buildcache.compute_fingerprint("windows", "1.3.0", {"uuid": "1", "server": "x", "custom": custom_a})
+        second = buildcache.compute_fingerprint("windows", "1.3.0", {"uuid": "2", "server": "x", "custom": custom_b})
+        other = buildcache.compute_fingerprint("windows", "1.3.0", {"uuid": "3", "server": "y", "custom": custom_a})
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_restore_after_finalize(self):
+        self.build("first", "f" * 64)
+        names = buildcache.restore("f" * 64, "second")
+        self.assertEqual(names, ["client.exe"])
+        self.assertEqual((Path("exe") / "second" / "client.exe").read_bytes(), b"client")
+        entry = BuildCacheEntry.objects.get(fingerprint="f" * 64)
+        self.assertTrue(entry.complete)
+        self.assertEqual((entry.hits, entry.misses), (1, 1))
+        self.assertEqual(buildcache.digests("f" * 64), {"client.exe": hashlib.sha256(b"client").hexdigest()})
+
+    def test_restore_records_known_digests_without_hashing(self):
+        self.build("first", "f" * 64)
+        buildcache.restore("f" * 64, "second")
+        artifacts.record_dir("second", buildcache.digests("f" * 64))
+        self.hash_later.assert_not_called()
+        self.assertEqual(
+            Artifact.objects.get(run_uuid="second").sha256, hashlib.sha256(b"client").hexdigest()
+        )
+
+    def test_incomplete_entry_is_a_miss(self):
+        buildcache.record_miss("e" * 64, "windows", "1.3.0")
+        self.assertIsNone(buildcache.restore("e" * 64, "second"))
+
+    @override_settings(BUILD_CACHE_MASTER_MAX_AGE=60)
+    def test_stale_master_build_is_discarded(self):
+        self.build("first", "m" * 64)
+        BuildCacheEntry.objects.filter(fingerprint="m" * 64).update(
+            version="master", created=timezone.now() - timedelta(hours=1)
+        )
+        self.assertIsNone(buildcache.restore("m" * 64, "second"))
+        self.assertFalse(BuildCacheEntry.objects.get(fingerprint="m" * 64).complete)
+
+    @override_settings(BUILD_CACHE_MAX_ENTRIES=1)
+    def test_evicts_least_recently_used(self):
+        self.build("first", "a" * 64)
+        BuildCacheEntry.objects.filter(fingerprint="a" * 64).update(last_used=timezone.now() - timedelta(days=1))
+        self.build("second", "b" * 64)
+        complete = set(BuildCacheEntry.objects.filter(complete=True).values_list("fingerprint", flat=True))
+        self.assertEqual(complete, {"b" * 64})
+        self.assertFalse((self.workdir / "build_cache" / ("a" * 64)).exists())
+
+
+@override_settings(CACHES=LOCMEM, STATUS_CACHE_LOCK_TTL=0.2)
+class StatusCacheTests(TestCase):
+    def setUp(self):
+        statuscache._cache().clear()
+        statuscache._counts.clear()
+
+    def test_second_poll_is_served_from_the_cache(self):
+        make_run("a", status="queued")
+        self.assertEqual(statuscache.get("a")["status"], "queued")
+        with self.assertNumQueries(0):
+            self.assertEqual(statuscache.get("a")["status"], "queued")
+
+    def test_unknown_run_is_cached_as_missing(self):
+        self.assertIsNone(statuscache.get("missing"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(statuscache.get("missing"))
+
+    def test_status_update_writes_through(self):
+        make_run("a", status="queued")
+        statuscache.get("a")
+        set_run_status("a", "building")
+        row = statuscache.get("a")
+        self.assertEqual(row["status"], "building")
+        self.assertEqual(row["status_version"], 1)
+
+    def test_waiter_reads_the_database_when_the_lock_holder_is_gone(self):
+        make_run("a", status="queued")
+        statuscache._cache().add("run_status:a:lock", 1, 60)
+        self.assertEqual(statuscache.get("a")["status"], "queued")
+        # the lock belongs to someone else, it must survive
+        self.assertIsNotNone(statuscache._cache().get("run_status:a:lock"))
+
+    def test_stats_include_this_process_counts(self):
+        make_run("a", status="queued")
+        statuscache.get("a")
+        statuscache.get("a")
+        stats = statuscache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["db_reads_avoided"], 1)
+
+
+@override_settings(CACHES=LOCMEM, UPLOAD_CHUNK_MAX_BYTES=1024)
+class ResumableUploadTests(WorkdirMixin, TestCase):
+    data = bytes(range(256)) * 10
+
+    def start(self, sha256=None, name="client.exe"):
+        body = {
+            "uuid": "run1",
+            "name": name,
+            "size": len(self.data),
+            "sha256": sha256 or hashlib.sha256(self.data).hexdigest(),
+        }
+        return self.client.post("/upload_start", json.dumps(body), content_type="application/json")
+
+    def put(self, upload_id, offset, chunk):
+        return self.client.put(
+            f"/upload_chunk?upload_id={upload_id}&offset={offset}", chunk, content_type="application/octet-stream"
+        )
+
+    def commit(self, upload_id):
+        return self.client.post("/upload_commit", json.dumps({"upload_id": upload_id}), content_type="application/json")
+
+    def test_chunked_upload_is_published(self):
+        upload_id = self.start().json()["upload_id"]
+        offset = 0
+        while offset < len(self.data):
+            offset = self.put(upload_id, offset, self.data[offset:offset + 1000]).json()["offset"]
+        response = self.commit(upload_id)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((Path("exe") / "run1" / "client.exe").read_bytes(), self.data)
+        self.assertEqual(artifacts.names("run1"), ["client.exe"])
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_start_resumes_the_unfinished_session(self):
+        upload_id = self.start().json()["upload_id"]
+        self.put(upload_id, 0, self.data[:1000])
+        response = self.start().json()
+        self.assertEqual(response, {"upload_id": upload_id, "offset": 1000})
+        self.assertEqual(self.client.get(f"/upload_status?upload_id={upload_id}").json()["offset"], 1000)
+
+    def test_resent_chunk_overwrites_what_followed(self):
+        upload_id = self.start().json()["upload_id"]
+        self.put(upload_id, 0, self.data[:1000])
+        self.assertEqual(self.put(upload_id, 500, self.data[500:700]).json()["offset"], 700)
+
+    def test_offset_past_received_bytes_is_refused(self):
+        upload_id = self.start().json()["upload_id"]
+        response = self.put(upload_id, 100, self.data[100:200])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 0)
+
+    def test_oversized_chunk_is_refused(self):
+        upload_id = self.start().json()["upload_id"]
+        self.assertEqual(self.put(upload_id, 0, self.data[:2000]).status_code, 413)
+
+    def test_incomplete_upload_is_not_committed(self):
+        upload_id = self.start().json()["upload_id"]
+        self.put(upload_id, 0, self.data[:1000])
+        self.assertEqual(self.commit(upload_id).status_code, 422)
+        self.assertTrue(UploadSession.objects.filter(upload_id=upload_id).exists())
+
+    def test_checksum_mismatch_discards_the_upload(self):
+        upload_id = self.start(sha256="0" * 64).json()["upload_id"]
+        self.put(upload_id, 0, self.data[:1000])
+        self.put(upload_id, 1000, self.data[1000:2000])
+        self.put(upload_id, 2000, self.data[2000:])
+        self.assertEqual(self.commit(upload_id).status_code, 422)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(Path("exe", "run1", "client.exe").exists())
+
+    def test_unsafe_name_is_refused(self):
+        self.assertEqual(self.start(name="../settings.py").status_code, 400)
+
+
+@override_settings(DOWNLOAD_ACCEL_REDIRECT="", DOWNLOAD_X_SENDFILE=False)
+class DownloadTests(WorkdirMixin, TestCase):
+    data = b"0123456789"
+
+    def setUp(self):
+        super().setUp()
+        self.write_output("run1", "client.exe", self.data)
+
+    def get(self, **headers):
+        return self.client.get("/download", {"uuid": "run1", "filename": "client.exe"}, headers=headers)
+
+    def test_full_download(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertTrue(response["ETag"])
+
+    def test_range(self):
+        response = self.get(range="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+
+    def test_open_and_suffix_ranges(self):
+        self.assertEqual(b"".join(self.get(range="bytes=7-").streaming_content), b"789")
+        self.assertEqual(b"".join(self.get(range="bytes=-3").streaming_content), b"789")
+
+    def test_unsatisfiable_range(self):
+        response = self.get(range="bytes=20-30")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_if_none_match(self):
+        etag = self.get()["ETag"]
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+
+    def test_if_range_with_a_changed_file_sends_everything(self):
+        response = self.get(range="bytes=2-5", if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+
+    def test_path_outside_the_run_is_not_served(self):
+        response = self.client.get("/download", {"uuid": "..", "filename": "manage.py"})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(
+    CACHES=LOCMEM,
+    LOCAL_BUILD_RUSTDESK_SRC="",
+    JANITOR_EXE_MAX_AGE_DAYS=7,
+    JANITOR_EXE_MAX_BYTES=0,
+    JANITOR_PNG_MAX_AGE_DAYS=7,
+    JANITOR_LOG_MAX_AGE_DAYS=14,
+    JANITOR_ICON_ASSETS_MAX_AGE_DAYS=30,
+)
+class JanitorTests(WorkdirMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        dirs = override_settings(
+            LOCAL_BUILD_LOG_DIR=str(self.workdir / "logs"),
+            LOCAL_BUILD_WORKTREE_ROOT=str(self.workdir / "local_builds"),
+            ICON_ASSETS_DIR=str(self.workdir / "icon_assets"),
+        )
+        dirs.enable()
+        self.addCleanup(dirs.disable)
+
+    def old_dir(self, path, days):
+        path.mkdir(parents=True)
+        (path / "file").write_bytes(b"x" * 100)
+        age(path, days)
+        return path
+
+    def test_old_outputs_are_removed_with_their_manifest(self):
+        old = self.write_output("old", "client.exe")
+        artifacts.record("old", old)
+        age(old.parent, 10)
+        self.write_output("new", "client.exe")
+        report = janitor.run()
+        self.assertFalse(old.parent.exists())
+        self.assertTrue(Path("exe", "new").exists())
+        self.assertFalse(Artifact.objects.filter(run_uuid="old").exists())
+        self.assertEqual(report.areas["exe"][0], 1)
+
+    def test_outputs_of_unfinished_runs_are_kept(self):
+        make_run("busy")
+        age(self.write_output("busy", "client.exe").parent, 10)
+        janitor.run()
+        self.assertTrue(Path("exe", "busy").exists())
+
+    def test_dry_run_removes_nothing(self):
+        old = self.old_dir(Path("png") / "old", 10)
+        report = janitor.run(dry_run=True)
+        self.assertTrue(old.exists())
+        self.assertEqual(report.areas["png"], (1, 100))
+
+    def test_matrix_assets_are_kept_while_a_run_of_the_batch_builds(self):
+        shared = self.old_dir(Path("png") / "batch1", 10)
+        make_run("member1", completed=timezone.now())
+        make_run("member2")
+        BuildBatch.objects.create(batch_id="batch1", members=json.dumps([{"uuid": "member1"}, {"uuid": "member2"}]))
+        janitor.run()
+        self.assertTrue(shared.exists())
+        set_run_status("member2", "success")
+        janitor.run()
+        self.assertFalse(shared.exists())
+
+    def test_unused_icon_assets_age_out(self):
+        old = self.old_dir(self.workdir / "icon_assets" / ("a" * 64), 40)
+        recent = self.old_dir(self.workdir / "icon_assets" / ("b" * 64), 1)
+        janitor.run()
+        self.assertFalse(old.exists())
+        self.assertTrue(recent.exists())
+
+    def test_old_logs_are_removed(self):
+        log_dir = self.workdir / "logs"
+        log_dir.mkdir()
+        old = log_dir / "build_old.log"
+        old.write_text("log")
+        age(old, 20)
+        busy = log_dir / "build_busy.log"
+        busy.write_text("log")
+        age(busy, 20)
+        make_run("busy")
+        janitor.run()
+        self.assertFalse(old.exists())
+        self.assertTrue(busy.exists())
+
+    @override_settings(JANITOR_UPLOAD_MAX_AGE=3600)
+    def test_abandoned_upload_sessions_are_discarded(self):
+        session = uploads.start("run1", "client.exe", 10, "0" * 64)
+        uploads.write_chunk(session, 0, open(__file__, "rb"), 5)
+        UploadSession.objects.filter(pk=session.pk).update(updated=timezone.now() - timedelta(hours=2))
+        janitor.run()
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(Path(uploads.UPLOAD_DIR, f"{session.upload_id}.part").exists())
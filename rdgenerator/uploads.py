@@ -0,0 +1,121 @@
+import os
+import re
+import uuid
+from pathlib import Path
+
+from django.conf import settings as _settings
+from django.utils import timezone
+
+from . import artifacts
+from .buildcache import file_digest
+from .models import UploadSession
+
+# same filesystem as exe/, so publishing is a rename
+UPLOAD_DIR = "upload_tmp"
+COPY_BLOCK = 1024 * 1024
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _part_path(upload_id):
+    return Path(UPLOAD_DIR) / f"{upload_id}.part"
+
+
+def temp_path():
+    Path(UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
+    return _part_path(uuid.uuid4().hex)
+
+
+def publish(tmp_path, myuuid, name, sha256):
+    """Move a completely written upload into exe/<uuid>/<name> and record it."""
+    target_dir = Path(artifacts.OUTPUT_DIR) / myuuid
+    target_dir.mkdir(parents=True, exist_ok=True)
+    target = target_dir / name
+    os.replace(tmp_path, target)
+    artifacts.record(myuuid, target, sha256)
+    return target
+
+
+def safe_name(name):
+    # artifact names end up as a path component under exe/<uuid>
+    return bool(name) and name == os.path.basename(name) and not name.startswith(".") and "\\" not in name
+
+
+def start(myuuid, name, size, sha256):
+    """Open an upload session, or resume the unfinished one for the same file."""
+    if not myuuid or not safe_name(myuuid) or not safe_name(name):
+        raise ValueError("invalid uuid or name")
+    if not isinstance(size, int) or size < 0 or size > _settings.ARTIFACT_UPLOAD_MAX_BYTES:
+        raise ValueError("invalid size")
+    if not _SHA256_RE.match(sha256 or ""):
+        raise ValueError("invalid sha256")
+    session = UploadSession.objects.filter(run_uuid=myuuid, name=name, size=size, sha256=sha256).first()
+    if session is None:
+        session = UploadSession.objects.create(
+            upload_id=uuid.uuid4().hex, run_uuid=myuuid, name=name, size=size, sha256=sha256
+        )
+    return session
+
+
+def received(session):
+    try:
+        return _part_path(session.upload_id).stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def write_chunk(session, offset, stream, length):
+    """Write `length` bytes from `stream` at `offset`, returns the new offset.
+
+    The offset may point back into data already received (a retried chunk), but
+    not past it; returns None in that case so the client can resync.
+    """
+    if offset < 0 or offset > received(session):
+        return None
+    if offset + length > session.size:
+        raise ValueError("chunk runs past the declared size")
+    path = _part_path(session.upload_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "r+b" if path.exists() else "wb") as handle:
+        handle.seek(offset)
+        remaining = length
+        while remaining:
+            block = stream.read(min(COPY_BLOCK, remaining))
+            if not block:
+                break
+            handle.write(block)
+            remaining -= len(block)
+        # whatever followed belonged to a chunk that is being resent
+        handle.truncate()
+        new_offset = handle.tell()
+    UploadSession.objects.filter(pk=session.pk).update(updated=timezone.now())
+    return new_offset
+
+
+def commit(session):
+    """Verify size and sha256 and publish the artifact, raises ValueError on a mismatch.
+
+    A file that fails the checksum is discarded with its session, the client
+    starts over.
+    """
+    path = _part_path(session.upload_id)
+    if session.size == 0:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    size = received(session)
+    if size != session.size:
+        raise ValueError(f"incomplete upload: {size} of {session.size} bytes")
+    if file_digest(path) != session.sha256:
+        discard(session)
+        raise ValueError("sha256 mismatch")
+    target = publish(path, session.run_uuid, session.name, session.sha256)
+    session.delete()
+    return target
+
+
+def discard(session):
+    try:
+        _part_path(session.upload_id).unlink()
+    except FileNotFoundError:
+        pass
+    session.delete()
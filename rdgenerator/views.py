@@ -1,473 +1,665 @@
+import csv
+import hashlib
 import io
+import shutil
 from pathlib import Path
-import subprocess
-import sys
-from django.http import HttpResponse, JsonResponse
+import time
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
-from django.core.files.base import ContentFile
 import os
 import re
-import requests
 import base64
 import json
 import uuid
-import pyzipper
 from django.conf import settings as _settings
 from django.db.models import Q
+from django.utils import timezone
 from .forms import GenerateForm
-from .models import GithubRun
+from .models import BuildBatch, GithubRun, UploadSession, SUCCESS_STATUSES, is_terminal_status, set_run_status
+from . import artifacts, backends, buildcache, dispatch, icons, phases, secretszip, statuscache, uploads
+from .downloads import serve_file
 from PIL import Image
 from urllib.parse import quote
 
-def _start_local_build(zip_path, myuuid, filename, platform, full_url):
-    if platform != _settings.LOCAL_BUILD_PLATFORM:
-        GithubRun.objects.filter(Q(uuid=myuuid)).update(
-            status="local build supports windows only"
-        )
-        return False
-    script_path = Path(_settings.BASE_DIR) / "scripts" / "build_windows_local.py"
-    if not script_path.exists():
-        GithubRun.objects.filter(Q(uuid=myuuid)).update(
-            status="local build script missing"
-        )
-        return False
-    log_dir = Path(_settings.LOCAL_BUILD_LOG_DIR) if _settings.LOCAL_BUILD_LOG_DIR else Path(_settings.BASE_DIR) / "logs"
-    log_dir.mkdir(parents=True, exist_ok=True)
-    log_path = log_dir / f"build_{myuuid}.log"
-    env = os.environ.copy()
-    env["DCE_ZIP_PATH"] = str(Path(zip_path).resolve())
-    env["DCE_UUID"] = myuuid
-    env["DCE_FILENAME"] = filename
-    env["DCE_PLATFORM"] = platform
-    env["DCE_STATUS_URL"] = f"{full_url}/updategh"
-    env["DCE_OUTPUT_DIR"] = str(Path(_settings.BASE_DIR) / "exe" / myuuid)
-    env["DCE_ROOT"] = str(_settings.BASE_DIR)
-    if _settings.LOCAL_BUILD_RUSTDESK_SRC:
-        env["RUSTDESK_SRC"] = _settings.LOCAL_BUILD_RUSTDESK_SRC
-    if _settings.LOCAL_BUILD_WORKTREE_ROOT:
-        env["LOCAL_BUILD_WORKTREE_ROOT"] = _settings.LOCAL_BUILD_WORKTREE_ROOT
-    with open(log_path, "wb") as log_handle:
-        subprocess.Popen(
-            [sys.executable, "-u", str(script_path)],
-            cwd=str(_settings.BASE_DIR),
-            env=env,
-            stdout=log_handle,
-            stderr=log_handle,
-        )
-    GithubRun.objects.filter(Q(uuid=myuuid)).update(status="local build started")
-    return True
-
 def generator_view(request):
     if request.method == 'POST':
         form = GenerateForm(request.POST, request.FILES)
         if form.is_valid():
-            platform = form.cleaned_data['platform']
-            version = form.cleaned_data['version']
-            delayFix = form.cleaned_data['delayFix']
-            cycleMonitor = form.cleaned_data['cycleMonitor']
-            xOffline = form.cleaned_data['xOffline']
-            hidecm = form.cleaned_data['hidecm']
-            removeNewVersionNotif = form.cleaned_data['removeNewVersionNotif']
-            server = form.cleaned_data['serverIP']
-            key = form.cleaned_data['key']
-            apiServer = form.cleaned_data['apiServer']
-            urlLink = form.cleaned_data['urlLink']
-            downloadLink = form.cleaned_data['downloadLink']
-            if not server:
-                server = 'rs-ny.rustdesk.com' #default rustdesk server
-            if not key:
-                key = 'OeVuKk5nlHiXp+APNn0Y3pC1Iwpwn44JGqrQCsWqmBw=' #default rustdesk key
-            if not apiServer:
-                apiServer = server+":21114"
-            if not urlLink:
-                urlLink = "https://rustdesk.com"
-            if not downloadLink:
-                downloadLink = "https://rustdesk.com/download"
-            direction = form.cleaned_data['direction']
-            installation = form.cleaned_data['installation']
-            settings = form.cleaned_data['settings']
-            appname = form.cleaned_data['appname']
-            if not appname:
-                appname = "rustdesk"
-            filename = form.cleaned_data['exename']
-            compname = form.cleaned_data['compname']
-            if not compname:
-                compname = "Purslane Ltd"
-            androidappid = form.cleaned_data['androidappid']
-            if not androidappid:
-                androidappid = "com.carriez.flutter_hbb"
-            compname = compname.replace("&","\\&")
-            permPass = form.cleaned_data['permanentPassword']
-            theme = form.cleaned_data['theme']
-            themeDorO = form.cleaned_data['themeDorO']
-            #runasadmin = form.cleaned_data['runasadmin']
-            passApproveMode = form.cleaned_data['passApproveMode']
-            denyLan = form.cleaned_data['denyLan']
-            enableDirectIP = form.cleaned_data['enableDirectIP']
-            #ipWhitelist = form.cleaned_data['ipWhitelist']
-            autoClose = form.cleaned_data['autoClose']
-            permissionsDorO = form.cleaned_data['permissionsDorO']
-            permissionsType = form.cleaned_data['permissionsType']
-            enableKeyboard = form.cleaned_data['enableKeyboard']
-            enableClipboard = form.cleaned_data['enableClipboard']
-            enableFileTransfer = form.cleaned_data['enableFileTransfer']
-            enableAudio = form.cleaned_data['enableAudio']
-            enableTCP = form.cleaned_data['enableTCP']
-            enableRemoteRestart = form.cleaned_data['enableRemoteRestart']
-            enableRecording = form.cleaned_data['enableRecording']
-            enableBlockingInput = form.cleaned_data['enableBlockingInput']
-            enableRemoteModi = form.cleaned_data['enableRemoteModi']
-            removeWallpaper = form.cleaned_data['removeWallpaper']
-            defaultManual = form.cleaned_data['defaultManual']
-            overrideManual = form.cleaned_data['overrideManual']
-            enablePrinter = form.cleaned_data['enablePrinter']
-            enableCamera = form.cleaned_data['enableCamera']
-            enableTerminal = form.cleaned_data['enableTerminal']
-
-            if all(char.isascii() for char in filename):
-                filename = re.sub(r'[^\w\s-]', '_', filename).strip()
-                filename = filename.replace(" ","_")
-            else:
-                filename = "rustdesk"
-            if not all(char.isascii() for char in appname):
-                appname = "rustdesk"
             myuuid = str(uuid.uuid4())
             protocol = _settings.PROTOCOL
             host = request.get_host()
             full_url = f"{protocol}://{host}"
-            try:
-                iconfile = form.cleaned_data.get('iconfile')
-                if not iconfile:
-                    iconfile = form.cleaned_data.get('iconbase64')
-                iconlink_url, iconlink_uuid, iconlink_file = save_png(iconfile,myuuid,full_url,"icon.png")
-            except:
-                print("failed to get icon, using default")
-                iconlink_url = "false"
-                iconlink_uuid = "false"
-                iconlink_file = "false"
-            try:
-                logofile = form.cleaned_data.get('logofile')
-                if not logofile:
-                    logofile = form.cleaned_data.get('logobase64')
-                logolink_url, logolink_uuid, logolink_file = save_png(logofile,myuuid,full_url,"logo.png")
-            except:
-                print("failed to get logo")
-                logolink_url = "false"
-                logolink_uuid = "false"
-                logolink_file = "false"
-
-            ###create the custom.txt json here and send in as inputs below
-            decodedCustom = {}
-            if direction != "Both":
-                decodedCustom['conn-type'] = direction
-            if installation == "installationN":
-                decodedCustom['disable-installation'] = 'Y'
-            if settings == "settingsN":
-                decodedCustom['disable-settings'] = 'Y'
-            if appname.upper != "rustdesk".upper and appname != "":
-                decodedCustom['app-name'] = appname
-            decodedCustom['override-settings'] = {}
-            decodedCustom['default-settings'] = {}
-            if permPass != "":
-                decodedCustom['password'] = permPass
-            if theme != "system":
-                if themeDorO == "default":
-                    if platform == "windows-x86":
-                        decodedCustom['default-settings']['allow-darktheme'] = 'Y' if theme == "dark" else 'N'
-                    else:
-                        decodedCustom['default-settings']['theme'] = theme
-                elif themeDorO == "override":
-                    if platform == "windows-x86":
-                        decodedCustom['override-settings']['allow-darktheme'] = 'Y' if theme == "dark" else 'N'
-                    else:
-                        decodedCustom['override-settings']['theme'] = theme
-            decodedCustom['enable-lan-discovery'] = 'N' if denyLan else 'Y'
-            #decodedCustom['direct-server'] = 'Y' if enableDirectIP else 'N'
-            decodedCustom['allow-auto-disconnect'] = 'Y' if autoClose else 'N'
-            if permissionsDorO == "default":
-                decodedCustom['default-settings']['access-mode'] = permissionsType
-                decodedCustom['default-settings']['enable-keyboard'] = 'Y' if enableKeyboard else 'N'
-                decodedCustom['default-settings']['enable-clipboard'] = 'Y' if enableClipboard else 'N'
-                decodedCustom['default-settings']['enable-file-transfer'] = 'Y' if enableFileTransfer else 'N'
-                decodedCustom['default-settings']['enable-audio'] = 'Y' if enableAudio else 'N'
-                decodedCustom['default-settings']['enable-tunnel'] = 'Y' if enableTCP else 'N'
-                decodedCustom['default-settings']['enable-remote-restart'] = 'Y' if enableRemoteRestart else 'N'
-                decodedCustom['default-settings']['enable-record-session'] = 'Y' if enableRecording else 'N'
-                decodedCustom['default-settings']['enable-block-input'] = 'Y' if enableBlockingInput else 'N'
-                decodedCustom['default-settings']['allow-remote-config-modification'] = 'Y' if enableRemoteModi else 'N'
-                decodedCustom['default-settings']['direct-server'] = 'Y' if enableDirectIP else 'N'
-                decodedCustom['default-settings']['verification-method'] = 'use-permanent-password' if hidecm else 'use-both-passwords'
-                decodedCustom['default-settings']['approve-mode'] = passApproveMode
-                decodedCustom['default-settings']['allow-hide-cm'] = 'Y' if hidecm else 'N'
-                decodedCustom['default-settings']['allow-remove-wallpaper'] = 'Y' if removeWallpaper else 'N'
-                decodedCustom['default-settings']['enable-remote-printer'] = 'Y' if enablePrinter else 'N'
-                decodedCustom['default-settings']['enable-camera'] = 'Y' if enableCamera else 'N'
-                decodedCustom['default-settings']['enable-terminal'] = 'Y' if enableTerminal else 'N'
-            else:
-                decodedCustom['override-settings']['access-mode'] = permissionsType
-                decodedCustom['override-settings']['enable-keyboard'] = 'Y' if enableKeyboard else 'N'
-                decodedCustom['override-settings']['enable-clipboard'] = 'Y' if enableClipboard else 'N'
-                decodedCustom['override-settings']['enable-file-transfer'] = 'Y' if enableFileTransfer else 'N'
-                decodedCustom['override-settings']['enable-audio'] = 'Y' if enableAudio else 'N'
-                decodedCustom['override-settings']['enable-tunnel'] = 'Y' if enableTCP else 'N'
-                decodedCustom['override-settings']['enable-remote-restart'] = 'Y' if enableRemoteRestart else 'N'
-                decodedCustom['override-settings']['enable-record-session'] = 'Y' if enableRecording else 'N'
-                decodedCustom['override-settings']['enable-block-input'] = 'Y' if enableBlockingInput else 'N'
-                decodedCustom['override-settings']['allow-remote-config-modification'] = 'Y' if enableRemoteModi else 'N'
-                decodedCustom['override-settings']['direct-server'] = 'Y' if enableDirectIP else 'N'
-                decodedCustom['override-settings']['verification-method'] = 'use-permanent-password' if hidecm else 'use-both-passwords'
-                decodedCustom['override-settings']['approve-mode'] = passApproveMode
-                decodedCustom['override-settings']['allow-hide-cm'] = 'Y' if hidecm else 'N'
-                decodedCustom['override-settings']['allow-remove-wallpaper'] = 'Y' if removeWallpaper else 'N'
-                decodedCustom['override-settings']['enable-remote-printer'] = 'Y' if enablePrinter else 'N'
-                decodedCustom['override-settings']['enable-camera'] = 'Y' if enableCamera else 'N'
-                decodedCustom['override-settings']['enable-terminal'] = 'Y' if enableTerminal else 'N'
-
-            for line in defaultManual.splitlines():
-                k, value = line.split('=')
-                decodedCustom['default-settings'][k.strip()] = value.strip()
-
-            for line in overrideManual.splitlines():
-                k, value = line.split('=')
-                decodedCustom['override-settings'][k.strip()] = value.strip()
-            
-            decodedCustomJson = json.dumps(decodedCustom)
-
-            string_bytes = decodedCustomJson.encode("ascii")
-            base64_bytes = base64.b64encode(string_bytes)
-            encodedCustom = base64_bytes.decode("ascii")
-
-            # #github limits inputs to 10, so lump extras into one with json
-            # extras = {}
-            # extras['genurl'] = _settings.GENURL
-            # #extras['runasadmin'] = runasadmin
-            # extras['urlLink'] = urlLink
-            # extras['downloadLink'] = downloadLink
-            # extras['delayFix'] = 'true' if delayFix else 'false'
-            # extras['dce'] = 'true'
-            # extras['cycleMonitor'] = 'true' if cycleMonitor else 'false'
-            # extras['xOffline'] = 'true' if xOffline else 'false'
-            # extras['removeNewVersionNotif'] = 'true' if removeNewVersionNotif else 'false'
-            # extras['compname'] = compname
-            # extras['androidappid'] = androidappid
-            # extra_input = json.dumps(extras)
-
-            ####from here run the github action, we need user, repo, access token.
-            if platform == 'windows':
-                url = 'https://api.github.com/repos/'+_settings.GHUSER+'/'+_settings.REPONAME+'/actions/workflows/generator-windows.yml/dispatches'
-            if platform == 'windows-x86':
-                url = 'https://api.github.com/repos/'+_settings.GHUSER+'/'+_settings.REPONAME+'/actions/workflows/generator-windows-x86.yml/dispatches'
-            elif platform == 'linux':
-                url = 'https://api.github.com/repos/'+_settings.GHUSER+'/'+_settings.REPONAME+'/actions/workflows/generator-linux.yml/dispatches'
-            elif platform == 'android':
-                url = 'https://api.github.com/repos/'+_settings.GHUSER+'/'+_settings.REPONAME+'/actions/workflows/generator-android.yml/dispatches'
-            elif platform == 'macos':
-                url = 'https://api.github.com/repos/'+_settings.GHUSER+'/'+_settings.REPONAME+'/actions/workflows/generator-macos.yml/dispatches'
-            else:
-                url = 'https://api.github.com/repos/'+_settings.GHUSER+'/'+_settings.REPONAME+'/actions/workflows/generator-windows.yml/dispatches'
-
-            #url = 'https://api.github.com/repos/'+_settings.GHUSER+'/rustdesk/actions/workflows/test.yml/dispatches'  
-            inputs_raw = {
-                "server":server,
-                "key":key,
-                "apiServer":apiServer,
-                "custom":encodedCustom,
-                "uuid":myuuid,
-                "iconlink_url":iconlink_url,
-                "iconlink_uuid":iconlink_uuid,
-                "iconlink_file":iconlink_file,
-                "logolink_url":logolink_url,
-                "logolink_uuid":logolink_uuid,
-                "logolink_file":logolink_file,
-                "appname":appname,
-                "genurl":_settings.GENURL,
-                "urlLink":urlLink,
-                "downloadLink":downloadLink,
-                "delayFix": 'true' if delayFix else 'false',
-                "dce":'true',
-                "cycleMonitor": 'true' if cycleMonitor else 'false',
-                "xOffline": 'true' if xOffline else 'false',
-                "removeNewVersionNotif": 'true' if removeNewVersionNotif else 'false',
-                "compname": compname,
-                "androidappid":androidappid,
-                "filename":filename
-            }
-
-            temp_json_path = f"data_{uuid.uuid4()}.json"
-            zip_filename = f"secrets_{uuid.uuid4()}.zip"
-            zip_path = "temp_zips/%s" % (zip_filename)
-            Path("temp_zips").mkdir(parents=True, exist_ok=True)
-
-            with open(temp_json_path, "w") as f:
-                json.dump(inputs_raw, f)
-
-            with pyzipper.AESZipFile(zip_path, 'w', compression=pyzipper.ZIP_LZMA, encryption=pyzipper.WZ_AES) as zf:
-                zf.setpassword(_settings.ZIP_PASSWORD.encode())
-                zf.write(temp_json_path, arcname="secrets.json")
-
-            # 4. Cleanup the plain JSON file immediately
-            if os.path.exists(temp_json_path):
-                os.remove(temp_json_path)
-
-            zipJson = {}
-            zipJson['url'] = full_url
-            zipJson['file'] = zip_filename
-
-            zip_url = json.dumps(zipJson)
-
-            data = {
-                "ref":_settings.GHBRANCH,
-                "inputs":{
-                    "version":version,
-                    "zip_url":zip_url
-                }
-            } 
-            #print(data)
-            headers = {
-                'Accept':  'application/vnd.github+json',
-                'Content-Type': 'application/json',
-                'Authorization': 'Bearer '+_settings.GHBEARER,
-                'X-GitHub-Api-Version': '2022-11-28'
-            }
-            create_github_run(myuuid)
-            if _settings.LOCAL_BUILD:
-                started = _start_local_build(zip_path, myuuid, filename, platform, full_url)
-                status = "local build started" if started else "local build failed to start"
-                return render(request, 'waiting.html', {'filename':filename, 'uuid':myuuid, 'status':status, 'platform':platform})
-            response = requests.post(url, json=data, headers=headers)
-            print(response)
-            if 200 <= response.status_code < 300:
-                return render(request, 'waiting.html', {'filename':filename, 'uuid':myuuid, 'status':"正在启动生成器……请稍候", 'platform':platform})
-            else:
-                if _settings.DEBUG_API_RESPONSE:
-                    return JsonResponse({
-                        "error": "Something went wrong",
-                        "status_code": response.status_code,
-                        "response_text": response.text
-                    })
-                else:
-                    return JsonResponse({"error": "Something went wrong"})
+            platforms = list(dict.fromkeys([form.cleaned_data['platform']] + form.cleaned_data['platforms']))
+            if len(platforms) > 1:
+                return _matrix_build(request, form.cleaned_data, platforms, full_url)
+            inputs_raw, platform, version, filename = _client_inputs(form.cleaned_data, myuuid, full_url)
+            cached_files = _submit_build(inputs_raw, platform, version, full_url, _requester(request))
+            if cached_files:
+                return render(request, 'generated.html', {
+                    'filename': filename,
+                    'uuid': myuuid,
+                    'platform': platform,
+                    'has_exe': f"{filename}.exe" in cached_files,
+                    'has_msi': f"{filename}.msi" in cached_files,
+                })
+            return render(request, 'waiting.html', _waiting_context(myuuid, filename, platform))
     else:
         form = GenerateForm()
     #return render(request, 'maintenance.html')
     return render(request, 'generator.html', {'form': form})
 
 
+def _matrix_build(request, cleaned, platforms, full_url):
+    # one submission for several platforms: the icon and logo are saved once and
+    # a single secrets bundle carries what differs per platform
+    matrix_id = str(uuid.uuid4())
+    requester = _requester(request)
+    assets = _save_assets(cleaned, matrix_id, full_url)
+    # every platform builds the same version
+    version = cleaned['version']
+    per_platform = {}
+    for platform in platforms:
+        inputs_raw, _, _, _ = _client_inputs({**cleaned, 'platform': platform}, str(uuid.uuid4()), full_url, assets)
+        per_platform[platform] = inputs_raw
+    zip_filename = secretszip.write_bundle(next(iter(per_platform.values())), per_platform)
+    members = []
+    for index, (platform, inputs_raw) in enumerate(per_platform.items()):
+        cached_files = _submit_build(inputs_raw, platform, version, full_url, requester, bundle=zip_filename)
+        members.append({
+            'index': index,
+            'uuid': inputs_raw['uuid'],
+            # exename as sanitized by _client_inputs
+            'filename': inputs_raw['filename'],
+            'platform': platform,
+            'cached': bool(cached_files),
+            'duplicate_of': None,
+        })
+    # every platform came from the build cache
+    secretszip.delete_if_unused(zip_filename)
+    BuildBatch.objects.create(batch_id=matrix_id, members=json.dumps(members))
+    return render(request, 'matrix.html', {'batch_id': matrix_id, 'members': members})
+
+
+def matrix_view(request):
+    batch = BuildBatch.objects.filter(batch_id=request.GET['batch_id']).first()
+    if batch is None:
+        raise Http404("Build not found")
+    return render(request, 'matrix.html', {'batch_id': batch.batch_id, 'members': json.loads(batch.members)})
+
+
+def _save_assets(cleaned, asset_uuid, full_url):
+    """Saves the icon and logo under png/<asset_uuid>, returns the (url, uuid, file) link for each."""
+    try:
+        iconfile = cleaned.get('iconfile')
+        if not iconfile:
+            iconfile = cleaned.get('iconbase64')
+        iconlink_url, iconlink_uuid, iconlink_file = save_png(iconfile,asset_uuid,full_url,"icon.png")
+    except:
+        print("failed to get icon, using default")
+        iconlink_url = "false"
+        iconlink_uuid = "false"
+        iconlink_file = "false"
+    try:
+        logofile = cleaned.get('logofile')
+        if not logofile:
+            logofile = cleaned.get('logobase64')
+        logolink_url, logolink_uuid, logolink_file = save_png(logofile,asset_uuid,full_url,"logo.png")
+    except:
+        print("failed to get logo")
+        logolink_url = "false"
+        logolink_uuid = "false"
+        logolink_file = "false"
+
+    return (iconlink_url, iconlink_uuid, iconlink_file), (logolink_url, logolink_uuid, logolink_file)
+
+
+def _render_icon(iconlink_uuid, iconlink_file):
+    # builds fetch the pre-rendered ico/png set instead of running ImageMagick,
+    # an empty hash makes them fall back to it
+    if iconlink_file == "false":
+        return ""
+    try:
+        return icons.render_icon(f"png/{iconlink_uuid}/{iconlink_file}")
+    except (OSError, ValueError) as e:
+        print(f"failed to render icon assets: {e}")
+        return ""
+
+
+def _client_inputs(cleaned, myuuid, full_url, assets=None):
+    """Turns validated GenerateForm data into the secrets.json inputs, saving icon/logo under png/<uuid>
+    unless already saved `assets` are passed in."""
+    platform = cleaned['platform']
+    version = cleaned['version']
+    delayFix = cleaned['delayFix']
+    cycleMonitor = cleaned['cycleMonitor']
+    xOffline = cleaned['xOffline']
+    hidecm = cleaned['hidecm']
+    removeNewVersionNotif = cleaned['removeNewVersionNotif']
+    server = cleaned['serverIP']
+    key = cleaned['key']
+    apiServer = cleaned['apiServer']
+    urlLink = cleaned['urlLink']
+    downloadLink = cleaned['downloadLink']
+    if not server:
+        server = 'rs-ny.rustdesk.com' #default rustdesk server
+    if not key:
+        key = 'OeVuKk5nlHiXp+APNn0Y3pC1Iwpwn44JGqrQCsWqmBw=' #default rustdesk key
+    if not apiServer:
+        apiServer = server+":21114"
+    if not urlLink:
+        urlLink = "https://rustdesk.com"
+    if not downloadLink:
+        downloadLink = "https://rustdesk.com/download"
+    direction = cleaned['direction']
+    installation = cleaned['installation']
+    settings = cleaned['settings']
+    appname = cleaned['appname']
+    if not appname:
+        appname = "rustdesk"
+    filename = cleaned['exename']
+    compname = cleaned['compname']
+    if not compname:
+        compname = "Purslane Ltd"
+    androidappid = cleaned['androidappid']
+    if not androidappid:
+        androidappid = "com.carriez.flutter_hbb"
+    compname = compname.replace("&","\\&")
+    permPass = cleaned['permanentPassword']
+    theme = cleaned['theme']
+    themeDorO = cleaned['themeDorO']
+    #runasadmin = cleaned['runasadmin']
+    passApproveMode = cleaned['passApproveMode']
+    denyLan = cleaned['denyLan']
+    enableDirectIP = cleaned['enableDirectIP']
+    #ipWhitelist = cleaned['ipWhitelist']
+    autoClose = cleaned['autoClose']
+    permissionsDorO = cleaned['permissionsDorO']
+    permissionsType = cleaned['permissionsType']
+    enableKeyboard = cleaned['enableKeyboard']
+    enableClipboard = cleaned['enableClipboard']
+    enableFileTransfer = cleaned['enableFileTransfer']
+    enableAudio = cleaned['enableAudio']
+    enableTCP = cleaned['enableTCP']
+    enableRemoteRestart = cleaned['enableRemoteRestart']
+    enableRecording = cleaned['enableRecording']
+    enableBlockingInput = cleaned['enableBlockingInput']
+    enableRemoteModi = cleaned['enableRemoteModi']
+    removeWallpaper = cleaned['removeWallpaper']
+    defaultManual = cleaned['defaultManual']
+    overrideManual = cleaned['overrideManual']
+    enablePrinter = cleaned['enablePrinter']
+    enableCamera = cleaned['enableCamera']
+    enableTerminal = cleaned['enableTerminal']
+
+    if all(char.isascii() for char in filename):
+        filename = re.sub(r'[^\w\s-]', '_', filename).strip()
+        filename = filename.replace(" ","_")
+    else:
+        filename = "rustdesk"
+    if not all(char.isascii() for char in appname):
+        appname = "rustdesk"
+    if assets is None:
+        assets = _save_assets(cleaned, myuuid, full_url)
+    (iconlink_url, iconlink_uuid, iconlink_file), (logolink_url, logolink_uuid, logolink_file) = assets
+    iconlink_hash = _render_icon(iconlink_uuid, iconlink_file)
+
+    ###create the custom.txt json here and send in as inputs below
+    decodedCustom = {}
+    if direction != "Both":
+        decodedCustom['conn-type'] = direction
+    if installation == "installationN":
+        decodedCustom['disable-installation'] = 'Y'
+    if settings == "settingsN":
+        decodedCustom['disable-settings'] = 'Y'
+    if appname.upper != "rustdesk".upper and appname != "":
+        decodedCustom['app-name'] = appname
+    decodedCustom['override-settings'] = {}
+    decodedCustom['default-settings'] = {}
+    if permPass != "":
+        decodedCustom['password'] = permPass
+    if theme != "system":
+        if themeDorO == "default":
+            if platform == "windows-x86":
+                decodedCustom['default-settings']['allow-darktheme'] = 'Y' if theme == "dark" else 'N'
+            else:
+                decodedCustom['default-settings']['theme'] = theme
+        elif themeDorO == "override":
+            if platform == "windows-x86":
+                decodedCustom['override-settings']['allow-darktheme'] = 'Y' if theme == "dark" else 'N'
+            else:
+                decodedCustom['override-settings']['theme'] = theme
+    decodedCustom['enable-lan-discovery'] = 'N' if denyLan else 'Y'
+    #decodedCustom['direct-server'] = 'Y' if enableDirectIP else 'N'
+    decodedCustom['allow-auto-disconnect'] = 'Y' if autoClose else 'N'
+    if permissionsDorO == "default":
+        decodedCustom['default-settings']['access-mode'] = permissionsType
+        decodedCustom['default-settings']['enable-keyboard'] = 'Y' if enableKeyboard else 'N'
+        decodedCustom['default-settings']['enable-clipboard'] = 'Y' if enableClipboard else 'N'
+        decodedCustom['default-settings']['enable-file-transfer'] = 'Y' if enableFileTransfer else 'N'
+        decodedCustom['default-settings']['enable-audio'] = 'Y' if enableAudio else 'N'
+        decodedCustom['default-settings']['enable-tunnel'] = 'Y' if enableTCP else 'N'
+        decodedCustom['default-settings']['enable-remote-restart'] = 'Y' if enableRemoteRestart else 'N'
+        decodedCustom['default-settings']['enable-record-session'] = 'Y' if enableRecording else 'N'
+        decodedCustom['default-settings']['enable-block-input'] = 'Y' if enableBlockingInput else 'N'
+        decodedCustom['default-settings']['allow-remote-config-modification'] = 'Y' if enableRemoteModi else 'N'
+        decodedCustom['default-settings']['direct-server'] = 'Y' if enableDirectIP else 'N'
+        decodedCustom['default-settings']['verification-method'] = 'use-permanent-password' if hidecm else 'use-both-passwords'
+        decodedCustom['default-settings']['approve-mode'] = passApproveMode
+        decodedCustom['default-settings']['allow-hide-cm'] = 'Y' if hidecm else 'N'
+        decodedCustom['default-settings']['allow-remove-wallpaper'] = 'Y' if removeWallpaper else 'N'
+        decodedCustom['default-settings']['enable-remote-printer'] = 'Y' if enablePrinter else 'N'
+        decodedCustom['default-settings']['enable-camera'] = 'Y' if enableCamera else 'N'
+        decodedCustom['default-settings']['enable-terminal'] = 'Y' if enableTerminal else 'N'
+    else:
+        decodedCustom['override-settings']['access-mode'] = permissionsType
+        decodedCustom['override-settings']['enable-keyboard'] = 'Y' if enableKeyboard else 'N'
+        decodedCustom['override-settings']['enable-clipboard'] = 'Y' if enableClipboard else 'N'
+        decodedCustom['override-settings']['enable-file-transfer'] = 'Y' if enableFileTransfer else 'N'
+        decodedCustom['override-settings']['enable-audio'] = 'Y' if enableAudio else 'N'
+        decodedCustom['override-settings']['enable-tunnel'] = 'Y' if enableTCP else 'N'
+        decodedCustom['override-settings']['enable-remote-restart'] = 'Y' if enableRemoteRestart else 'N'
+        decodedCustom['override-settings']['enable-record-session'] = 'Y' if enableRecording else 'N'
+        decodedCustom['override-settings']['enable-block-input'] = 'Y' if enableBlockingInput else 'N'
+        decodedCustom['override-settings']['allow-remote-config-modification'] = 'Y' if enableRemoteModi else 'N'
+        decodedCustom['override-settings']['direct-server'] = 'Y' if enableDirectIP else 'N'
+        decodedCustom['override-settings']['verification-method'] = 'use-permanent-password' if hidecm else 'use-both-passwords'
+        decodedCustom['override-settings']['approve-mode'] = passApproveMode
+        decodedCustom['override-settings']['allow-hide-cm'] = 'Y' if hidecm else 'N'
+        decodedCustom['override-settings']['allow-remove-wallpaper'] = 'Y' if removeWallpaper else 'N'
+        decodedCustom['override-settings']['enable-remote-printer'] = 'Y' if enablePrinter else 'N'
+        decodedCustom['override-settings']['enable-camera'] = 'Y' if enableCamera else 'N'
+        decodedCustom['override-settings']['enable-terminal'] = 'Y' if enableTerminal else 'N'
+
+    for line in defaultManual.splitlines():
+        k, value = line.split('=')
+        decodedCustom['default-settings'][k.strip()] = value.strip()
+
+    for line in overrideManual.splitlines():
+        k, value = line.split('=')
+        decodedCustom['override-settings'][k.strip()] = value.strip()
+    
+    decodedCustomJson = json.dumps(decodedCustom)
+
+    string_bytes = decodedCustomJson.encode("ascii")
+    base64_bytes = base64.b64encode(string_bytes)
+    encodedCustom = base64_bytes.decode("ascii")
+
+    # #github limits inputs to 10, so lump extras into one with json
+    # extras = {}
+    # extras['genurl'] = _settings.GENURL
+    # #extras['runasadmin'] = runasadmin
+    # extras['urlLink'] = urlLink
+    # extras['downloadLink'] = downloadLink
+    # extras['delayFix'] = 'true' if delayFix else 'false'
+    # extras['dce'] = 'true'
+    # extras['cycleMonitor'] = 'true' if cycleMonitor else 'false'
+    # extras['xOffline'] = 'true' if xOffline else 'false'
+    # extras['removeNewVersionNotif'] = 'true' if removeNewVersionNotif else 'false'
+    # extras['compname'] = compname
+    # extras['androidappid'] = androidappid
+    # extra_input = json.dumps(extras)
+
+    #url = 'https://api.github.com/repos/'+_settings.GHUSER+'/rustdesk/actions/workflows/test.yml/dispatches'  
+    inputs_raw = {
+        "server":server,
+        "key":key,
+        "apiServer":apiServer,
+        "custom":encodedCustom,
+        "uuid":myuuid,
+        "iconlink_url":iconlink_url,
+        "iconlink_uuid":iconlink_uuid,
+        "iconlink_file":iconlink_file,
+        "iconlink_hash":iconlink_hash,
+        "logolink_url":logolink_url,
+        "logolink_uuid":logolink_uuid,
+        "logolink_file":logolink_file,
+        "appname":appname,
+        "genurl":_settings.GENURL,
+        "urlLink":urlLink,
+        "downloadLink":downloadLink,
+        "delayFix": 'true' if delayFix else 'false',
+        "dce":'true',
+        "cycleMonitor": 'true' if cycleMonitor else 'false',
+        "xOffline": 'true' if xOffline else 'false',
+        "removeNewVersionNotif": 'true' if removeNewVersionNotif else 'false',
+        "compname": compname,
+        "androidappid":androidappid,
+        "filename":filename
+    }
+    return inputs_raw, platform, version, filename
+
+
+def _asset_paths(inputs_raw):
+    # iconlink_uuid differs from the run's uuid when a matrix build shares its assets
+    icon_path = f"png/{inputs_raw['iconlink_uuid']}/{inputs_raw['iconlink_file']}" if inputs_raw['iconlink_file'] != "false" else None
+    logo_path = f"png/{inputs_raw['logolink_uuid']}/{inputs_raw['logolink_file']}" if inputs_raw['logolink_file'] != "false" else None
+    return icon_path, logo_path
+
+
+def _fingerprint(inputs_raw, platform, version):
+    icon_path, logo_path = _asset_paths(inputs_raw)
+    return buildcache.compute_fingerprint(platform, version, inputs_raw, icon_path, logo_path)
+
+
+def _submit_build(inputs_raw, platform, version, full_url, requester, fingerprint=None, depends_on="", bundle=None):
+    """Creates the run for one client and queues its build, `bundle` is a shared matrix secrets zip.
+
+    Returns the file names when the build cache already has the client, None when it was queued.
+    """
+    myuuid = inputs_raw['uuid']
+    filename = inputs_raw['filename']
+    if fingerprint is None:
+        fingerprint = _fingerprint(inputs_raw, platform, version)
+    cached_files = buildcache.restore(fingerprint, myuuid)
+    if cached_files:
+        create_github_run(myuuid, status=SUCCESS_STATUSES[0], platform=platform)
+        artifacts.record_dir(myuuid, buildcache.digests(fingerprint))
+        return cached_files
+    buildcache.record_miss(fingerprint, platform, version)
+
+    if bundle is None:
+        zip_filename = secretszip.write_bundle(inputs_raw)
+    else:
+        zip_filename = bundle
+    backend = backends.get_backend()
+    url, data = backend.request(
+        zip_filename, platform, version, filename, full_url,
+        bundle_platform=platform if bundle is not None else None,
+    )
+    create_github_run(myuuid, fingerprint=fingerprint, secrets_zip=zip_filename, platform=platform)
+    # the scheduler starts it once a slot is free, waiting.html shows the outcome
+    dispatch.enqueue(myuuid, url, data, backend=backend.name, platform=platform, requester=requester, depends_on=depends_on)
+    return None
+
+
+def _form_defaults():
+    return {name: field.initial for name, field in GenerateForm.base_fields.items() if field.initial is not None}
+
+
+def _batch_members(request):
+    """Reads batch members as form data, from a JSON list (or {"defaults": {...}, "members": [...]})
+    or a CSV with form field names as the header row. Missing fields fall back to the form's initial values."""
+    defaults = {}
+    if 'file' in request.FILES or request.content_type == 'text/csv':
+        raw = request.FILES['file'].read() if 'file' in request.FILES else request.body
+        # empty cells mean "not set", not an empty value
+        rows = [
+            {k: v for k, v in row.items() if k and v not in (None, '')}
+            for row in csv.DictReader(io.StringIO(raw.decode('utf-8-sig')))
+        ]
+    else:
+        payload = json.loads(request.body)
+        if isinstance(payload, dict):
+            defaults = payload.get('defaults') or {}
+            rows = payload.get('members')
+        else:
+            rows = payload
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows) or not isinstance(defaults, dict):
+            raise ValueError("expected a list of objects")
+    base = _form_defaults()
+    return [{**base, **defaults, **row} for row in rows]
+
+
+def batch_generate(request):
+    # one submission for many clients: identical members share a run, and with
+    # local builds members that compile the same base wait for the first one
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST a JSON or CSV list of clients'}, status=405)
+    try:
+        members = _batch_members(request)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return JsonResponse({'error': f"invalid batch: {e}"}, status=400)
+    if not members:
+        return JsonResponse({'error': 'batch is empty'}, status=400)
+    if len(members) > _settings.BATCH_MAX_MEMBERS:
+        return JsonResponse({'error': f"batch is limited to {_settings.BATCH_MAX_MEMBERS} clients"}, status=400)
+    forms = [GenerateForm(data) for data in members]
+    errors = [{'index': i, 'errors': form.errors.get_json_data()} for i, form in enumerate(forms) if not form.is_valid()]
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    full_url = f"{_settings.PROTOCOL}://{request.get_host()}"
+    requester = _requester(request)
+    results = []
+    by_fingerprint = {}
+    base_heads = {}
+    for index, form in enumerate(forms):
+        myuuid = str(uuid.uuid4())
+        inputs_raw, platform, version, filename = _client_inputs(form.cleaned_data, myuuid, full_url)
+        fingerprint = _fingerprint(inputs_raw, platform, version)
+        if fingerprint in by_fingerprint:
+            first = by_fingerprint[fingerprint]
+            shutil.rmtree(Path("png") / myuuid, ignore_errors=True)
+            results.append({**first, 'index': index, 'duplicate_of': first['index']})
+            continue
+        depends_on = ""
+        if _settings.BUILD_BACKEND == "local":
+            icon_path, _ = _asset_paths(inputs_raw)
+            base = buildcache.base_fingerprint(platform, version, inputs_raw, icon_path)
+            head = base_heads.setdefault(base, myuuid)
+            depends_on = head if head != myuuid else ""
+        cached_files = _submit_build(inputs_raw, platform, version, full_url, requester, fingerprint, depends_on)
+        member = {
+            'index': index,
+            'uuid': myuuid,
+            'filename': filename,
+            'platform': platform,
+            'cached': bool(cached_files),
+            'duplicate_of': None,
+        }
+        by_fingerprint[fingerprint] = member
+        results.append(member)
+    batch_id = str(uuid.uuid4())
+    BuildBatch.objects.create(batch_id=batch_id, members=json.dumps(results))
+    return JsonResponse({'batch_id': batch_id, 'members': results}, status=202)
+
+
+def batch_status(request):
+    batch = BuildBatch.objects.filter(batch_id=request.GET['batch_id']).first()
+    if batch is None:
+        return JsonResponse({'error': 'unknown batch'}, status=404)
+    members = json.loads(batch.members)
+    runs = {
+        row['uuid']: row
+        for row in GithubRun.objects.filter(uuid__in={m['uuid'] for m in members}).values('uuid', 'status', 'dispatch_state')
+    }
+    counts = {'succeeded': 0, 'failed': 0, 'queued': 0, 'running': 0}
+    for member in members:
+        run = runs.get(member['uuid'], {})
+        status = run.get('status', "waiting")
+        if status in SUCCESS_STATUSES:
+            state = 'succeeded'
+        elif is_terminal_status(status):
+            state = 'failed'
+        elif run.get('dispatch_state') == 'queued':
+            state = 'queued'
+        else:
+            state = 'running'
+        counts[state] += 1
+        member['status'] = status
+        member['state'] = state
+        member['files'] = _artifact_names(member['uuid'])
+    return JsonResponse({
+        'batch_id': batch.batch_id,
+        'total': len(members),
+        'finished': counts['succeeded'] + counts['failed'] == len(members),
+        **counts,
+        'members': members,
+    })
+
+
 def check_for_file(request):
     filename = request.GET['filename']
     uuid = request.GET['uuid']
     platform = request.GET['platform']
-    gh_run = GithubRun.objects.filter(Q(uuid=uuid)).first()
-    status = gh_run.status if gh_run else "waiting"
-    output_dir = Path("exe") / uuid
-    has_any = False
-    has_exe = False
-    has_msi = False
-    if output_dir.is_dir():
-        for item in output_dir.iterdir():
-            if not item.is_file():
-                continue
-            has_any = True
-            if item.name == f"{filename}.exe":
-                has_exe = True
-            if item.name == f"{filename}.msi":
-                has_msi = True
-    if has_any:
+    # the manifest only lists files that finished writing
+    names = artifacts.names(uuid)
+    if names:
         return render(request, 'generated.html', {
             'filename': filename,
             'uuid': uuid,
             'platform': platform,
-            'has_exe': has_exe,
-            'has_msi': has_msi,
+            'has_exe': f"{filename}.exe" in names,
+            'has_msi': f"{filename}.msi" in names,
         })
-    return render(request, 'waiting.html', {'filename':filename, 'uuid':uuid, 'status':status, 'platform':platform})
+    return render(request, 'waiting.html', _waiting_context(uuid, filename, platform))
+
+
+def _has_artifacts(myuuid):
+    return artifacts.exists(myuuid)
+
+
+def _artifact_names(myuuid):
+    return artifacts.names(myuuid)
+
+
+def _requester(request):
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    return (forwarded.split(',')[0].strip() or request.META.get('REMOTE_ADDR', ''))[:64]
+
+
+def _waiting_context(myuuid, filename, platform):
+    row = statuscache.get(myuuid)
+    return {
+        'filename': filename,
+        'uuid': myuuid,
+        'platform': platform,
+        'status': row['status'] if row else "waiting",
+        'status_version': row['status_version'] if row else 0,
+        'queue_position': dispatch.queue_position(myuuid),
+    }
+
+
+def build_status(request):
+    # long-poll: hold the request until updategh bumps status_version past
+    # `since`, artifacts land, or STATUS_LONGPOLL_TIMEOUT expires
+    myuuid = request.GET['uuid']
+    try:
+        since = int(request.GET.get('since', -1))
+    except ValueError:
+        since = -1
+    deadline = time.monotonic() + _settings.STATUS_LONGPOLL_TIMEOUT
+    while True:
+        row = statuscache.get(myuuid)
+        status = row['status'] if row else "waiting"
+        version = row['status_version'] if row else 0
+        has_artifacts = _has_artifacts(myuuid)
+        ready = has_artifacts and status in SUCCESS_STATUSES
+        timed_out = time.monotonic() >= deadline
+        if version != since or ready or timed_out:
+            break
+        time.sleep(_settings.STATUS_LONGPOLL_INTERVAL)
+    # uploads that went quiet for a whole poll window count as finished, in case
+    # the workflow never reports success
+    if timed_out and has_artifacts:
+        ready = True
+    return JsonResponse({
+        'uuid': myuuid,
+        'status': status,
+        'version': version,
+        'ready': ready,
+        'queue_position': dispatch.queue_position(myuuid),
+    })
 
 
 def download(request):
     filename = request.GET['filename']
     uuid = request.GET['uuid']
     #filename = filename+".exe"
-    file_path = os.path.join('exe',uuid,filename)
-    with open(file_path, 'rb') as file:
-        response = HttpResponse(file, headers={
-            'Content-Type': 'application/vnd.microsoft.portable-executable',
-            'Content-Disposition': f'attachment; filename="{filename}"'
-        })
-
-    return response
+    return serve_file(request, 'exe', uuid, filename)
 
 def get_png(request):
     filename = request.GET['filename']
     uuid = request.GET['uuid']
     #filename = filename+".exe"
-    file_path = os.path.join('png',uuid,filename)
-    with open(file_path, 'rb') as file:
-        response = HttpResponse(file, headers={
-            'Content-Type': 'application/vnd.microsoft.portable-executable',
-            'Content-Disposition': f'attachment; filename="{filename}"'
-        })
-
-    return response
+    return serve_file(request, 'png', uuid, filename)
 
-def create_github_run(myuuid):
+def create_github_run(myuuid, status="正在启动生成器……请稍候", fingerprint="", secrets_zip="", platform=""):
     new_github_run = GithubRun(
         uuid=myuuid,
-        status="正在启动生成器……请稍候"
+        status=status,
+        fingerprint=fingerprint,
+        secrets_zip=secrets_zip,
+        platform=platform,
+        completed=timezone.now() if is_terminal_status(status) else None
     )
     new_github_run.save()
+    statuscache.put(myuuid, {'status': status, 'status_version': 0})
+    phases.status_changed(myuuid, status)
 
 def update_github_run(request):
     data = json.loads(request.body)
     myuuid = data.get('uuid')
+    if 'phase' in data:
+        # a subprocess the local build script ran, the status stays as it is
+        try:
+            phases.record_command(myuuid, data['phase'])
+        except (KeyError, TypeError, ValueError) as e:
+            return JsonResponse({'error': f"invalid phase: {e}"}, status=400)
+        return HttpResponse('')
+    if GithubRun.objects.filter(uuid=myuuid, dispatch_state="cancelled").exists():
+        # a cancelled local build still reports its failure on the way down
+        return HttpResponse('')
     mystatus = data.get('status')
-    GithubRun.objects.filter(Q(uuid=myuuid)).update(status=mystatus)
+    set_run_status(myuuid, mystatus)
+    if is_terminal_status(mystatus):
+        dispatch.wake()
+    if mystatus in SUCCESS_STATUSES:
+        # local builds write exe/<uuid> themselves, pick their files up once
+        artifacts.record_dir(myuuid)
+        gh_run = GithubRun.objects.filter(Q(uuid=myuuid)).first()
+        if gh_run and gh_run.fingerprint:
+            buildcache.finalize(gh_run.fingerprint, myuuid)
     return HttpResponse('')
 
+def cache_stats(request):
+    return JsonResponse({**buildcache.stats(), 'status_cache': statuscache.stats()})
+
+def build_phases(request):
+    # ?uuid=... returns the run's timeline, otherwise duration percentiles per phase
+    myuuid = request.GET.get('uuid')
+    if myuuid:
+        return JsonResponse({'uuid': myuuid, 'phases': phases.timeline(myuuid)})
+    try:
+        days = float(request.GET.get('days', 7))
+    except ValueError:
+        return JsonResponse({'error': 'days must be a number'}, status=400)
+    return JsonResponse({'days': days, 'phases': phases.stats(days, request.GET.get('kind'))})
+
+def cancel_build(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST {"uuid": ...}'}, status=405)
+    myuuid = json.loads(request.body).get('uuid')
+    if not dispatch.cancel(myuuid):
+        return JsonResponse({'cancelled': False}, status=409)
+    dispatch.wake()
+    return JsonResponse({'cancelled': True})
+
 def resize_and_encode_icon(imagefile):
     maxWidth = 200
     try:
-        with io.BytesIO() as image_buffer:
-            for chunk in imagefile.chunks():
-                image_buffer.write(chunk)
-            image_buffer.seek(0)
-
-            img = Image.open(image_buffer)
-            imgcopy = img.copy()
-    except (IOError, OSError):
+        # reads the header only, pixels are decoded below at the reduced size
+        img = Image.open(imagefile)
+        img_format = img.format
+        if img.size[0] * img.size[1] > _settings.IMAGE_MAX_PIXELS:
+            raise ValueError("Uploaded image is too large.")
+        # JPEG can decode straight to a smaller scale, other formats ignore it
+        img.draft(img.mode, (maxWidth, maxWidth))
+        img.thumbnail((maxWidth, img.size[1]), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    except (IOError, OSError, Image.DecompressionBombError):
         raise ValueError("Uploaded file is not a valid image format.")
 
-    # Check if resizing is necessary
-    if img.size[0] <= maxWidth:
-        with io.BytesIO() as image_buffer:
-            imgcopy.save(image_buffer, format=imagefile.content_type.split('/')[1])
-            image_buffer.seek(0)
-            return_image = ContentFile(image_buffer.read(), name=imagefile.name)
-        return base64.b64encode(return_image.read())
-
-    # Calculate resized height based on aspect ratio
-    wpercent = (maxWidth / float(img.size[0]))
-    hsize = int((float(img.size[1]) * float(wpercent)))
-
-    # Resize the image while maintaining aspect ratio using LANCZOS resampling
-    imgcopy = imgcopy.resize((maxWidth, hsize), Image.Resampling.LANCZOS)
-
-    with io.BytesIO() as resized_image_buffer:
-        imgcopy.save(resized_image_buffer, format=imagefile.content_type.split('/')[1])
-        resized_image_buffer.seek(0)
-
-        resized_imagefile = ContentFile(resized_image_buffer.read(), name=imagefile.name)
-
-    # Return the Base64 encoded representation of the resized image
-    resized64 = base64.b64encode(resized_imagefile.read())
-    #print(resized64)
-    return resized64
+    with io.BytesIO() as image_buffer:
+        img.save(image_buffer, format=img_format)
+        # Return the Base64 encoded representation of the resized image
+        return base64.b64encode(image_buffer.getvalue())
  
 #the following is used when accessed from an external source, like the rustdesk api server
 def startgh(request):
     #print(request)
     data_ = json.loads(request.body)
     ####from here run the github action, we need user, repo, access token.
-    url = 'https://api.github.com/repos/'+_settings.GHUSER+'/'+_settings.REPONAME+'/actions/workflows/generator-'+data_.get('platform')+'.yml/dispatches'  
+    url = dispatch.workflow_url('generator-'+data_.get('platform')+'.yml')
     data = {
         "ref": _settings.GHBRANCH,
         "inputs":{
@@ -483,14 +675,10 @@ def startgh(request):
             "filename":data_.get('filename')
         }
     } 
-    headers = {
-        'Accept':  'application/vnd.github+json',
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer '+_settings.GHBEARER,
-        'X-GitHub-Api-Version': '2022-11-28'
-    }
-    response = requests.post(url, json=data, headers=headers)
-    print(response)
+    myuuid = data_.get('uuid')
+    if not GithubRun.objects.filter(Q(uuid=myuuid)).exists():
+        create_github_run(myuuid)
+    dispatch.enqueue(myuuid, url, data, backend="github", platform=data_.get('platform', ''), requester=_requester(request))
     return HttpResponse(status=204)
 
 def save_png(file, uuid, domain, name):
@@ -499,16 +687,15 @@ def save_png(file, uuid, domain, name):
 
     if isinstance(file, str):  # Check if it's a base64 string
         try:
-            header, encoded = file.split(';base64,')
-            decoded_img = base64.b64decode(encoded)
-            file = ContentFile(decoded_img, name=name) # Create a file-like object
-        except ValueError:
-            print("Invalid base64 data")
-            return None  # Or handle the error as you see fit
-        except Exception as e:  # Catch general exceptions during decoding
-            print(f"Error decoding base64: {e}")
+            # decoded to disk slice by slice instead of holding the image twice
+            icons.write_data_url(file, file_save_path)
+        except ValueError as e:
+            print(e)
+            if os.path.exists(file_save_path):
+                os.remove(file_save_path)
             return None
-        
+        return domain, uuid, name
+
     with open(file_save_path, "wb+") as f:
         for chunk in file.chunks():
             f.write(chunk)
@@ -522,14 +709,77 @@ def save_png(file, uuid, domain, name):
 def save_custom_client(request):
     file = request.FILES['file']
     myuuid = request.POST.get('uuid')
-    file_save_path = "exe/%s/%s" % (myuuid, file.name)
-    Path("exe/%s" % myuuid).mkdir(parents=True, exist_ok=True)
-    with open(file_save_path, "wb+") as f:
+    if not uploads.safe_name(myuuid) or not uploads.safe_name(file.name):
+        return HttpResponse("Invalid uuid or file name", status=400)
+    # written aside and renamed into exe/<uuid>, polls never see a partial file
+    tmp_path = uploads.temp_path()
+    digest = hashlib.sha256()
+    with open(tmp_path, "wb+") as f:
         for chunk in file.chunks():
             f.write(chunk)
+            digest.update(chunk)
+    file_save_path = uploads.publish(tmp_path, myuuid, file.name, digest.hexdigest())
+    _stage_artifact(myuuid, file_save_path)
 
     return HttpResponse("File saved successfully!")
 
+def _stage_artifact(myuuid, path):
+    gh_run = GithubRun.objects.filter(Q(uuid=myuuid)).first()
+    if gh_run and gh_run.fingerprint:
+        buildcache.add_artifact(gh_run.fingerprint, path)
+
+# resumable uploads used by the workflows (scripts/upload_artifact.sh):
+# upload_start -> upload_chunk (repeated, resumable from upload_status) -> upload_commit
+def upload_start(request):
+    data = json.loads(request.body)
+    try:
+        session = uploads.start(data.get('uuid'), data.get('name'), data.get('size'), data.get('sha256'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'upload_id': session.upload_id, 'offset': uploads.received(session)})
+
+def _upload_session(request):
+    session = UploadSession.objects.filter(upload_id=request.GET.get('upload_id', '')).first()
+    if session is None:
+        raise Http404("Unknown upload")
+    return session
+
+def upload_status(request):
+    session = _upload_session(request)
+    return JsonResponse({'upload_id': session.upload_id, 'offset': uploads.received(session), 'size': session.size})
+
+def upload_chunk(request):
+    if request.method != 'PUT':
+        return HttpResponse(status=405)
+    session = _upload_session(request)
+    try:
+        offset = int(request.GET['offset'])
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'offset and Content-Length are required'}, status=400)
+    if length > _settings.UPLOAD_CHUNK_MAX_BYTES:
+        return JsonResponse({'error': 'chunk too large'}, status=413)
+    try:
+        new_offset = uploads.write_chunk(session, offset, request, length)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if new_offset is None:
+        return JsonResponse({'error': 'offset mismatch', 'offset': uploads.received(session)}, status=409)
+    return JsonResponse({'upload_id': session.upload_id, 'offset': new_offset})
+
+def upload_commit(request):
+    data = json.loads(request.body)
+    session = UploadSession.objects.filter(upload_id=data.get('upload_id', '')).first()
+    if session is None:
+        raise Http404("Unknown upload")
+    myuuid = session.run_uuid
+    try:
+        path = uploads.commit(session)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=422)
+    _stage_artifact(myuuid, path)
+    return JsonResponse({'name': path.name, 'uuid': myuuid}, status=201)
+
 def cleanup_secrets(request):
     # Pass the UUID as a query param or in JSON body
     data = json.loads(request.body)
@@ -538,29 +788,18 @@ def cleanup_secrets(request):
     if not my_uuid:
         return HttpResponse("Missing UUID", status=400)
 
-    # 1. Find the files in your temp directory matching the UUID
-    temp_dir = os.path.join('temp_zips')
-    
-    # We look for any file starting with 'secrets_' and containing the uuid
-    for filename in os.listdir(temp_dir):
-        if my_uuid in filename and filename.endswith('.zip'):
-            file_path = os.path.join(temp_dir, filename)
-            try:
-                os.remove(file_path)
-                print(f"Successfully deleted {file_path}")
-            except OSError as e:
-                print(f"Error deleting file: {e}")
+    # runs of a matrix build share one zip, it goes once every run is done with it
+    secretszip.release(my_uuid)
 
     return HttpResponse("Cleanup successful", status=200)
 
+def icon_bundle(request):
+    icon_hash = request.GET['hash']
+    if icons.assets_dir(icon_hash) is None:
+        raise Http404("Bundle not found")
+    return serve_file(request, _settings.ICON_ASSETS_DIR, icon_hash, icons.BUNDLE_NAME)
+
 def get_zip(request):
     filename = request.GET['filename']
     #filename = filename+".exe"
-    file_path = os.path.join('temp_zips',filename)
-    with open(file_path, 'rb') as file:
-        response = HttpResponse(file, headers={
-            'Content-Type': 'application/vnd.microsoft.portable-executable',
-            'Content-Disposition': f'attachment; filename="{filename}"'
-        })
-
-    return response
+    return serve_file(request, 'temp_zips', filename)
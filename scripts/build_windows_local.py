@@ -1,46 +1,350 @@
+import atexit
+import hashlib
 import json
 import os
+import re
 import shutil
+import signal
+import socket
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pyzipper
 import requests
 
+try:
+    import psutil
+except ImportError:
+    # optional: without it there are no samples, and CPU/RSS figures only on POSIX
+    psutil = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
 
 def log(message):
     print(message, flush=True)
 
 
-def update_status(message):
+def _post_status(payload):
     status_url = os.environ.get("DCE_STATUS_URL", "")
     uuid = os.environ.get("DCE_UUID", "")
     if not status_url or not uuid:
         return
     try:
-        requests.post(status_url, json={"uuid": uuid, "status": message}, timeout=5)
+        requests.post(status_url, json={"uuid": uuid, **payload}, timeout=5)
     except Exception as exc:
         log(f"status update failed: {exc}")
 
 
+def update_status(message):
+    _post_status({"status": message})
+
+
+def fail(message):
+    # the "failed" prefix marks the run terminal so the scheduler frees its slot
+    update_status(f"failed: {message}")
+    sys.exit(1)
+
+
+SAMPLE_INTERVAL = float(os.environ.get("LOCAL_BUILD_SAMPLE_INTERVAL", "5"))
+MAX_SAMPLES = 500
+# every command run() finished, for the build report
+COMMANDS = []
+
+
+class Sampler:
+    """Samples host CPU and the RSS of a command's process tree while it runs (needs psutil)."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        self.max_rss = None
+        self._started = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        if psutil and SAMPLE_INTERVAL > 0:
+            psutil.cpu_percent(None)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            try:
+                root = psutil.Process(self.pid)
+                tree = [root, *root.children(recursive=True)]
+            except psutil.Error:
+                return
+            rss = 0
+            for proc in tree:
+                try:
+                    rss += proc.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.max_rss = max(self.max_rss or 0, rss)
+            if len(self.samples) < MAX_SAMPLES:
+                self.samples.append([round(time.monotonic() - self._started, 1), psutil.cpu_percent(None), rss])
+
+
+def _children_usage():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+def _phase_name(cmd):
+    parts = [str(part) for part in cmd]
+    name = Path(parts[0]).stem
+    rest = parts[1:]
+    if name == "git" and rest[:1] == ["-C"]:
+        rest = rest[2:]
+    if rest[:1] == ["-m"]:
+        return f"{name} -m {rest[1]}"
+    if rest and not rest[0].startswith("-"):
+        name += f" {Path(rest[0]).name}"
+    return name
+
+
 def run(cmd, cwd=None, check=True):
     log(f"run: {' '.join(str(part) for part in cmd)}")
-    return subprocess.run(cmd, cwd=cwd, check=check)
+    before = _children_usage()
+    started = time.time()
+    proc = subprocess.Popen(cmd, cwd=cwd)
+    sampler = Sampler(proc.pid)
+    sampler.start()
+    try:
+        exit_code = proc.wait()
+    finally:
+        sampler.stop()
+    after = _children_usage()
+    event = {
+        "name": _phase_name(cmd),
+        "started": started,
+        "finished": time.time(),
+        "exit_code": exit_code,
+        "host": socket.gethostname(),
+        "cpu_seconds": None,
+        "max_rss": sampler.max_rss,
+        "samples": sampler.samples,
+    }
+    if before and after:
+        # getrusage covers every descendant the command waited for
+        event["cpu_seconds"] = round(after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime, 2)
+        if event["max_rss"] is None and after.ru_maxrss > before.ru_maxrss:
+            # largest child so far, so only attributable when this command raised it
+            event["max_rss"] = after.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    COMMANDS.append(event)
+    _post_status({"phase": event})
+    if check and exit_code != 0:
+        raise subprocess.CalledProcessError(exit_code, cmd)
+    return subprocess.CompletedProcess(cmd, exit_code)
 
 
-def replace_in_file(path, old, new, required=False):
-    if not path.exists():
-        if required:
-            raise FileNotFoundError(path)
-        return False
-    data = path.read_text(encoding="utf-8", errors="surrogateescape")
-    if old not in data:
-        if required:
-            raise ValueError(f"missing '{old}' in {path}")
-        return False
-    path.write_text(data.replace(old, new), encoding="utf-8", errors="surrogateescape")
-    return True
+# a literal substitution, path may be a glob relative to the worktree
+Rule = namedtuple("Rule", "name path old new required", defaults=(False,))
+# a line-based edit: apply(lines) returns (lines, number of matches)
+LineEdit = namedtuple("LineEdit", "name path apply")
+
+REWRITE_WORKERS = 8
+
+
+def remove_key_block(lines):
+    # same edit as .github/patches/allowCustom.py: drop the hardcoded custom
+    # config key check (the const and the 8 lines after it)
+    start = 'const KEY: &str = "5Qbwsde3unUcJBtrx9ZkvUmwFNoExHzpryHuPUdqlWM=";'
+    output = []
+    skip = 0
+    matches = 0
+    for line in lines:
+        if skip:
+            skip -= 1
+            continue
+        if line.strip().startswith(start):
+            skip = 8
+            matches += 1
+            continue
+        output.append(line)
+    return output, matches
+
+
+def remove_update_block(lines):
+    output = []
+    in_block = False
+    matches = 0
+    for line in lines:
+        if "let (request, url) =" in line:
+            in_block = True
+            matches += 1
+            continue
+        if in_block:
+            if "Ok(())" in line:
+                output.append(line)
+                in_block = False
+            continue
+        output.append(line)
+    return output, matches
+
+
+def rewrite_file(path, rules, edits):
+    """Apply every edit and rule for one file in a single read and at most one write.
+
+    Substitutions run as one scan over the text with all patterns at once, so a
+    replacement is never matched again by a later rule; where patterns start at
+    the same offset the longest wins. Returns ({rule: matches}, written).
+    """
+    with open(path, encoding="utf-8", errors="surrogateescape", newline="") as handle:
+        original = handle.read()
+    text = original
+    counts = {}
+    for edit in edits:
+        lines, counts[edit] = edit.apply(text.splitlines(keepends=True))
+        text = "".join(lines)
+    if rules:
+        table = {}
+        for rule in rules:
+            if table.setdefault(rule.old, rule.new) != rule.new:
+                raise ValueError(f"conflicting replacements for '{rule.old}' in {path}")
+        pattern = re.compile("|".join(re.escape(old) for old in sorted(table, key=len, reverse=True)))
+        hits = Counter()
+
+        def substitute(match):
+            hits[match.group(0)] += 1
+            return table[match.group(0)]
+
+        text = pattern.sub(substitute, text)
+        for rule in rules:
+            counts[rule] = hits[rule.old]
+    written = text != original
+    if written:
+        with open(path, "w", encoding="utf-8", errors="surrogateescape", newline="") as handle:
+            handle.write(text)
+    return counts, written
+
+
+def apply_rewrites(worktree, plan):
+    """Group the plan's rules and edits by file and rewrite the files in parallel.
+
+    Returns a report with the matches of every rule; rules that matched nothing
+    are listed under "unmatched" and fail the build when required.
+    """
+    by_file = {}
+    totals = {}
+    for item in plan:
+        totals[item] = 0
+        files = sorted(worktree.glob(item.path)) if "*" in item.path else [worktree / item.path]
+        for path in files:
+            if path.is_file():
+                rules, edits = by_file.setdefault(path, ([], []))
+                (edits if isinstance(item, LineEdit) else rules).append(item)
+
+    written = 0
+    with ThreadPoolExecutor(max_workers=REWRITE_WORKERS) as pool:
+        jobs = [pool.submit(rewrite_file, path, rules, edits) for path, (rules, edits) in by_file.items()]
+        for job in jobs:
+            counts, changed = job.result()
+            written += changed
+            for item, matches in counts.items():
+                totals[item] += matches
+
+    report = {
+        "files": len(by_file),
+        "written": written,
+        "rules": [{"rule": item.name, "path": item.path, "matches": totals[item]} for item in plan],
+        "unmatched": [f"{item.name} ({item.path})" for item in plan if not totals[item]],
+    }
+    log(f"rewrote {written} of {len(by_file)} files")
+    for name in report["unmatched"]:
+        log(f"rewrite rule matched nothing: {name}")
+    missing = [f"{item.name} ({item.path})" for item in plan if getattr(item, "required", False) and not totals[item]]
+    if missing:
+        raise ValueError(f"required rewrite matched nothing: {', '.join(missing)}")
+    return report
+
+
+def rewrite_plan(secrets, filename):
+    """Every source edit a build needs for these secrets."""
+    server = secrets.get("server", "rs-ny.rustdesk.com")
+    key = secrets.get("key", "OeVuKk5nlHiXp+APNn0Y3pC1Iwpwn44JGqrQCsWqmBw=")
+    api_server = secrets.get("apiServer", "https://admin.rustdesk.com")
+    appname = secrets.get("appname", "rustdesk")
+    url_link = secrets.get("urlLink", "https://rustdesk.com")
+    download_link = secrets.get("downloadLink", "https://rustdesk.com/download")
+    compname = secrets.get("compname", "Purslane Ltd")
+
+    plan = [
+        LineEdit("custom config key", "src/common.rs", remove_key_block),
+        Rule("custom config file", "src/common.rs", "custom.txt", "custom_.txt"),
+        Rule("server", "libs/hbb_common/src/config.rs", "rs-ny.rustdesk.com", server, required=True),
+        Rule("key", "libs/hbb_common/src/config.rs", "OeVuKk5nlHiXp+APNn0Y3pC1Iwpwn44JGqrQCsWqmBw=", key, required=True),
+        Rule("api server", "src/common.rs", "https://admin.rustdesk.com", api_server),
+    ]
+
+    if secrets.get("delayFix", "false") == "true":
+        plan.append(Rule("delay fix", "src/client.rs", "!key.is_empty()", "false"))
+
+    if secrets.get("removeNewVersionNotif", "false") == "true":
+        plan += [
+            Rule("update notification", "flutter/lib/desktop/pages/desktop_home_page.dart", "updateUrl.isNotEmpty", "false"),
+            LineEdit("update check", "src/common.rs", remove_update_block),
+        ]
+
+    if url_link != "https://rustdesk.com":
+        plan += [
+            Rule("url link", "build.py", "Homepage: https://rustdesk.com", f"Homepage: {url_link}"),
+            Rule("url link", "flutter/lib/common.dart", "launchUrl(Uri.parse('https://rustdesk.com'));", f"launchUrl(Uri.parse('{url_link}'));"),
+            Rule("url link", "flutter/lib/desktop/pages/desktop_setting_page.dart", "launchUrlString('https://rustdesk.com');", f"launchUrlString('{url_link}');"),
+            Rule("privacy link", "flutter/lib/desktop/pages/desktop_setting_page.dart", "launchUrlString('https://rustdesk.com/privacy.html')", f"launchUrlString('{url_link}/privacy.html')"),
+            Rule("url link", "flutter/lib/mobile/pages/settings_page.dart", "const url = 'https://rustdesk.com/';", f"const url = '{url_link}';"),
+            Rule("privacy link", "flutter/lib/mobile/pages/settings_page.dart", "launchUrlString('https://rustdesk.com/privacy.html')", f"launchUrlString('{url_link}/privacy.html')"),
+            Rule("privacy link", "flutter/lib/desktop/pages/install_page.dart", "https://rustdesk.com/privacy.html", f"{url_link}/privacy.html"),
+        ]
+
+    if download_link != "https://rustdesk.com/download":
+        plan += [
+            Rule("download link", "flutter/lib/desktop/pages/desktop_home_page.dart", "https://rustdesk.com/download", download_link),
+            Rule("download link", "flutter/lib/mobile/pages/connection_page.dart", "https://rustdesk.com/download", download_link),
+            Rule("download link", "src/ui/index.tis", "https://rustdesk.com/download", download_link),
+        ]
+
+    if appname and appname.lower() != "rustdesk":
+        for cargo in ("Cargo.toml", "libs/portable/Cargo.toml"):
+            plan += [
+                Rule("app name", cargo, "description = \"RustDesk Remote Desktop\"", f"description = \"{appname}\""),
+                Rule("app name", cargo, "ProductName = \"RustDesk\"", f"ProductName = \"{appname}\""),
+                Rule("app name", cargo, "FileDescription = \"RustDesk Remote Desktop\"", f"FileDescription = \"{appname}\""),
+                Rule("exe name", cargo, "OriginalFilename = \"rustdesk.exe\"", f"OriginalFilename = \"{appname}.exe\""),
+            ]
+        plan += [
+            Rule("app name", "flutter/windows/runner/Runner.rc", "\"RustDesk Remote Desktop\"", f"\"{appname}\""),
+            Rule("exe name", "flutter/windows/runner/Runner.rc", "\"rustdesk.exe\"", f"\"{filename}.exe\""),
+            Rule("app name", "flutter/windows/runner/Runner.rc", "\"RustDesk\"", f"\"{appname}\""),
+            Rule("app name", "src/lang/**/*.rs", "RustDesk", appname),
+        ]
+
+    if compname and compname != "Purslane Ltd":
+        plan += [
+            Rule("company name", "flutter/lib/desktop/pages/desktop_setting_page.dart", "Purslane Ltd", compname),
+            Rule("company name", "res/msi/preprocess.py", "Purslane Ltd", compname),
+            Rule("company id", "res/msi/preprocess.py", "PURSLANE", compname),
+            Rule("company name", "flutter/windows/runner/Runner.rc", "Purslane Ltd", compname),
+            Rule("company name", "Cargo.toml", "Purslane Ltd", compname),
+            Rule("company name", "libs/portable/Cargo.toml", "Purslane Ltd", compname),
+        ]
+    return plan
 
 
 def apply_patch_if_needed(worktree, patch_path, required=False):
@@ -66,6 +370,130 @@ def apply_patch_if_needed(worktree, patch_path, required=False):
     return False
 
 
+# patches the local build applies, the last two only when the form asks for them
+LOCAL_PATCHES = ("removeSetupServerTip.diff", "cycle_monitor.diff", "xoffline.diff")
+
+
+def worktree_root_for(dce_root):
+    # Path("").resolve() is the cwd, so an unset variable has to be caught first
+    configured = os.environ.get("LOCAL_BUILD_WORKTREE_ROOT", "")
+    return Path(configured).resolve() if configured else dce_root / "local_builds"
+
+
+def _patch_cache_path(worktree_root):
+    return worktree_root / "cache" / "patches.json"
+
+
+def load_patch_cache(cache_path):
+    try:
+        return json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_patch_cache(cache_path, entries):
+    # merge with whatever other builds stored meanwhile, last writer wins per key
+    merged = {**load_patch_cache(cache_path), **entries}
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    staging = cache_path.with_name(f".{cache_path.name}.{os.getpid()}")
+    staging.write_text(json.dumps(merged, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(staging, cache_path)
+
+
+def check_patches(repo, commit, patch_paths):
+    """State of each patch against commit: "apply", "applied" or "conflict".
+
+    Checked against a throwaway index of the commit, so no worktree is needed.
+    Returns {patch name: (state, detail)}.
+    """
+    states = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "GIT_INDEX_FILE": str(Path(tmp) / "index")}
+        subprocess.run(["git", "-C", str(repo), "read-tree", commit], env=env, check=True, capture_output=True)
+        for patch_path in patch_paths:
+            forward = subprocess.run(
+                ["git", "-C", str(repo), "apply", "--cached", "--check", str(patch_path)],
+                env=env, capture_output=True, text=True,
+            )
+            if forward.returncode == 0:
+                states[patch_path.name] = ("apply", "")
+                continue
+            reverse = subprocess.run(
+                ["git", "-C", str(repo), "apply", "--cached", "--reverse", "--check", str(patch_path)],
+                env=env, capture_output=True, text=True,
+            )
+            if reverse.returncode == 0:
+                states[patch_path.name] = ("applied", "")
+            else:
+                states[patch_path.name] = ("conflict", forward.stderr.strip())
+    return states
+
+
+def patch_states(repo, commit, patch_paths, cache_path):
+    """Cached check_patches, keyed by commit and patch content."""
+    cache = load_patch_cache(cache_path)
+    keys = {patch_path: f"{commit}:{_digest_file(patch_path)}" for patch_path in patch_paths}
+    missing = [patch_path for patch_path, key in keys.items() if key not in cache]
+    if missing:
+        log(f"checking {len(missing)} patches against {commit[:12]}")
+        checked = check_patches(repo, commit, missing)
+        entries = {keys[patch_path]: list(checked[patch_path.name]) for patch_path in missing}
+        save_patch_cache(cache_path, entries)
+        cache.update(entries)
+    return {patch_path: tuple(cache[key]) for patch_path, key in keys.items()}
+
+
+def apply_patches(worktree, repo, commit, patch_paths, cache_path):
+    """Apply the patch set with one git apply, using the cached state of each patch."""
+    states = patch_states(repo, commit, patch_paths, cache_path)
+    pending = []
+    for patch_path, (state, detail) in states.items():
+        if state == "apply":
+            pending.append(patch_path)
+        elif state == "applied":
+            log(f"patch already applied: {patch_path.name}")
+        else:
+            log(f"patch skipped: {patch_path.name} doesn't apply to {commit[:12]}\n{detail}")
+    if not pending:
+        return
+    result = subprocess.run(
+        ["git", "-C", str(worktree), "apply", *[str(patch_path) for patch_path in pending]],
+        capture_output=True, text=True,
+    )
+    if result.returncode == 0:
+        log(f"applied {', '.join(patch_path.name for patch_path in pending)}")
+        return
+    # the worktree isn't the plain commit the cache describes, go one by one
+    log(f"batched git apply failed, applying patches one by one\n{result.stderr}")
+    for patch_path in pending:
+        apply_patch_if_needed(worktree, patch_path, required=False)
+
+
+def prime_patch_cache(dce_root, rustdesk_src, worktree_root, versions):
+    """Check every local patch against every version up front, returns the conflicts."""
+    patch_paths = [dce_root / ".github" / "patches" / name for name in LOCAL_PATCHES]
+    cache_path = _patch_cache_path(worktree_root)
+    conflicts = []
+    index = load_ref_index(worktree_root)
+    for version in versions:
+        repo, ref = resolve_source(rustdesk_src, worktree_root, version, index)
+        if ref is None:
+            log(f"{version}: not found in the mirror or RUSTDESK_SRC")
+            continue
+        commit = ref if _is_commit(ref) else subprocess.run(
+            ["git", "-C", str(repo), "rev-parse", f"{ref}^{{commit}}"],
+            capture_output=True, text=True,
+        ).stdout.strip()
+        if not commit:
+            log(f"{version}: no commit for {ref}")
+            continue
+        for patch_path, (state, detail) in patch_states(repo, commit, patch_paths, cache_path).items():
+            log(f"{version} ({commit[:12]}): {patch_path.name} {state}")
+            if state == "conflict":
+                conflicts.append(f"{version}: {patch_path.name}")
+    return conflicts
+
+
 def resolve_git_ref(repo, version):
     def has_ref(ref):
         return subprocess.run(
@@ -84,26 +512,332 @@ def resolve_git_ref(repo, version):
         subprocess.run(["git", "-C", str(repo), "fetch", "--tags"], check=False)
     if has_ref(tag_ref):
         return tag_ref
-    return "HEAD"
+    # building HEAD instead would ship a different version than the one asked for
+    return None
 
 
-def remove_update_block(path):
-    if not path.exists():
-        return
-    lines = path.read_text(encoding="utf-8", errors="surrogateescape").splitlines()
-    output = []
-    in_block = False
-    for line in lines:
-        if "let (request, url) =" in line:
-            in_block = True
-            continue
-        if in_block:
-            if "Ok(())" in line:
-                output.append(line)
-                in_block = False
-            continue
-        output.append(line)
-    path.write_text("\n".join(output) + "\n", encoding="utf-8", errors="surrogateescape")
+def mirror_enabled():
+    return os.environ.get("LOCAL_BUILD_MIRROR", "true").lower() in ("1", "true", "yes")
+
+
+def _mirror_path(worktree_root):
+    return worktree_root / "mirror.git"
+
+
+def _ref_index_path(worktree_root):
+    return worktree_root / "cache" / "refs.json"
+
+
+def _is_commit(ref):
+    return re.fullmatch(r"[0-9a-f]{40}", ref) is not None
+
+
+def load_ref_index(worktree_root):
+    try:
+        return json.loads(_ref_index_path(worktree_root).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def refresh_mirror(rustdesk_src, worktree_root):
+    """Clone or fetch the bare mirror of RUSTDESK_SRC's upstream and rewrite the ref index.
+
+    The index maps every tag and "master" to its commit, so builds resolve
+    versions without running git or fetching.
+    """
+    mirror = _mirror_path(worktree_root)
+    if not (mirror / "HEAD").exists():
+        upstream = subprocess.run(
+            ["git", "-C", str(rustdesk_src), "remote", "get-url", "origin"], capture_output=True, text=True
+        ).stdout.strip() or str(rustdesk_src)
+        staging = worktree_root / f".mirror.{os.getpid()}.git"
+        shutil.rmtree(staging, ignore_errors=True)
+        run(["git", "clone", "--bare", upstream, str(staging)])
+        run(["git", "-C", str(staging), "config", "remote.origin.fetch", "+refs/heads/*:refs/heads/*"])
+        try:
+            os.replace(staging, mirror)
+        except OSError:
+            # another refresh created the mirror first
+            shutil.rmtree(staging, ignore_errors=True)
+    # a failed fetch keeps the refs we already have, the index stays usable
+    run(["git", "-C", str(mirror), "fetch", "--prune", "--tags", "--force", "origin"], check=False)
+    listing = subprocess.run(
+        ["git", "-C", str(mirror), "for-each-ref", "--format=%(refname) %(objectname) %(*objectname)",
+         "refs/heads/master", "refs/tags"],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    refs = {}
+    for line in listing.splitlines():
+        name, objectname, peeled = (line.split(" ") + ["", ""])[:3]
+        # annotated tags peel to their commit
+        version = "master" if name == "refs/heads/master" else name[len("refs/tags/"):]
+        refs[version] = peeled or objectname
+    index_path = _ref_index_path(worktree_root)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    staging = index_path.with_name(f".{index_path.name}.{os.getpid()}")
+    staging.write_text(json.dumps({"refreshed": time.time(), "refs": refs}, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(staging, index_path)
+    return refs
+
+
+def resolve_source(rustdesk_src, worktree_root, version, index):
+    """(repo, ref) to check version out from: a pinned mirror commit when the index has one.
+
+    ref is None when neither the mirror nor RUSTDESK_SRC has the version. A build
+    never fetches: the daemon refreshes the mirror at start and every
+    LOCAL_BUILD_MIRROR_INTERVAL, a tag released since then is looked up in
+    RUSTDESK_SRC only.
+    """
+    if mirror_enabled() and (_mirror_path(worktree_root) / "HEAD").exists():
+        commit = index.get("refs", {}).get(version)
+        if commit:
+            return _mirror_path(worktree_root), commit
+        log(f"{version} not in the ref index, trying RUSTDESK_SRC")
+    return rustdesk_src, resolve_git_ref(rustdesk_src, version)
+
+
+# build outputs kept across builds in a warm worktree so cargo/flutter rebuild incrementally
+WARM_KEEP = ("/target", "/libs/portable/target", "/flutter/build", "/flutter/.dart_tool")
+
+
+def _claim_lock(lock_path, owner, stale_after):
+    try:
+        # a build killed without cleanup leaves its lock behind
+        if time.time() - lock_path.stat().st_mtime > stale_after:
+            lock_path.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as handle:
+        handle.write(owner)
+    return True
+
+
+def reset_worktree(worktree, ref):
+    run(["git", "-C", str(worktree), "checkout", "--force", "--detach", ref])
+    clean = ["git", "-C", str(worktree), "clean", "-ffdx"]
+    for keep in WARM_KEEP:
+        clean += ["-e", keep]
+    run(clean)
+    # patches also touch submodules such as libs/hbb_common
+    run(["git", "-C", str(worktree), "submodule", "foreach", "--quiet", "--recursive",
+         "git reset --hard --quiet && git clean -ffdq"], check=False)
+
+
+def _belongs_to(worktree_dir, repo):
+    # warm slots made from RUSTDESK_SRC can't check out commits only the mirror has
+    try:
+        gitdir = (worktree_dir / ".git").read_text(encoding="utf-8").partition("gitdir:")[2].strip()
+    except OSError:
+        return False
+    return bool(gitdir) and Path(repo).resolve() in Path(gitdir).resolve().parents
+
+
+def acquire_worktree(rustdesk_src, worktree_root, version, ref, uuid):
+    """Returns a worktree checked out at ref, reusing a warm one for the version when possible."""
+    if os.environ.get("LOCAL_BUILD_WARM", "true").lower() not in ("1", "true", "yes"):
+        worktree_dir = worktree_root / uuid
+        if worktree_dir.exists():
+            fail("worktree already exists")
+        run(["git", "-C", str(rustdesk_src), "worktree", "add", "--detach", str(worktree_dir), ref])
+        return worktree_dir
+
+    # pin the commit, "HEAD" inside a warm worktree would mean its previous build
+    commit = ref if _is_commit(ref) else subprocess.run(
+        ["git", "-C", str(rustdesk_src), "rev-parse", f"{ref}^{{commit}}"],
+        capture_output=True, text=True,
+    ).stdout.strip() or ref
+    warm_root = worktree_root / "warm"
+    warm_root.mkdir(parents=True, exist_ok=True)
+    slots = int(os.environ.get("LOCAL_BUILD_WARM_SLOTS", "2"))
+    stale_after = float(os.environ.get("LOCAL_BUILD_TIMEOUT", "7200"))
+    safe_version = re.sub(r"[^\w.-]", "_", version)
+    while True:
+        for slot in range(slots):
+            worktree_dir = warm_root / f"{safe_version}-{slot}"
+            lock_path = warm_root / f"{safe_version}-{slot}.lock"
+            if not _claim_lock(lock_path, uuid, stale_after):
+                continue
+            atexit.register(lambda: lock_path.unlink(missing_ok=True))
+            # the janitor removes slots that haven't been claimed for a while
+            if worktree_dir.exists():
+                os.utime(worktree_dir)
+            if _belongs_to(worktree_dir, rustdesk_src):
+                log(f"reusing warm worktree {worktree_dir}")
+                reset_worktree(worktree_dir, commit)
+            else:
+                shutil.rmtree(worktree_dir, ignore_errors=True)
+                run(["git", "-C", str(rustdesk_src), "worktree", "prune"], check=False)
+                run(["git", "-C", str(rustdesk_src), "worktree", "add", "--detach", str(worktree_dir), commit])
+            return worktree_dir
+        update_status("waiting for a free worktree")
+        time.sleep(30)
+
+
+def configure_compiler_cache(worktree_root):
+    cache_root = worktree_root / "cache"
+    sccache = shutil.which("sccache")
+    if sccache and not os.environ.get("RUSTC_WRAPPER"):
+        os.environ["RUSTC_WRAPPER"] = sccache
+        os.environ.setdefault("SCCACHE_DIR", str(cache_root / "sccache"))
+        log(f"using sccache at {os.environ['SCCACHE_DIR']}")
+    # incremental compilation state already lives in the warm worktree's target dir.
+    # No shared CARGO_TARGET_DIR: RustDesk's build.py and the portable packer read
+    # <worktree>/target/release by path, and versions would keep invalidating each
+    # other's state; crates compiled in another slot come from sccache instead
+    os.environ.setdefault("CARGO_INCREMENTAL", "1")
+
+
+def _prune_dep_caches(kind_root, keep_entry):
+    keep = int(os.environ.get("LOCAL_BUILD_DEP_CACHE_SIZE", "3"))
+    entries = sorted(
+        (entry for entry in kind_root.iterdir() if entry.is_dir() and not entry.name.startswith(".")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for stale in entries[keep:]:
+        if stale != keep_entry:
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def portable_python(worktree_root, portable_dir):
+    """Interpreter with libs/portable/requirements.txt installed, one venv per requirements hash.
+
+    The venv is built once, into a staging dir, and reused offline by every later
+    build until the requirements change.
+    """
+    requirements = portable_dir / "requirements.txt"
+    venvs = worktree_root / "cache" / "pip"
+    venv = venvs / _digest_file(requirements)[:16]
+    scripts = "Scripts" if os.name == "nt" else "bin"
+    python = venv / scripts / ("python.exe" if os.name == "nt" else "python")
+    if (venv / ".ready").exists():
+        os.utime(venv)
+        return python
+    venvs.mkdir(parents=True, exist_ok=True)
+    staging = venvs / f".{venv.name}.{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    log(f"creating portable packer venv for {requirements}")
+    run([sys.executable, "-m", "venv", str(staging)])
+    # requirements sit next to generate.py, relative includes resolve from there
+    run([str(staging / scripts / python.name), "-m", "pip", "install", "--disable-pip-version-check",
+         "-r", str(requirements)], cwd=portable_dir)
+    (staging / ".ready").touch()
+    try:
+        os.replace(staging, venv)
+    except OSError:
+        # another build created the same venv first
+        shutil.rmtree(staging, ignore_errors=True)
+    _prune_dep_caches(venvs, venv)
+    return python
+
+
+def flutter_pub_get(flutter, flutter_dir, worktree_root):
+    """flutter pub get against a pub cache shared by every build with the same pubspec.lock.
+
+    The first build for a lock file fills the cache, later ones resolve offline.
+    """
+    lock = flutter_dir / "pubspec.lock"
+    caches = worktree_root / "cache" / "pub"
+    pub_cache = caches / (_digest_file(lock)[:16] if lock.exists() else "unlocked")
+    pub_cache.mkdir(parents=True, exist_ok=True)
+    os.environ["PUB_CACHE"] = str(pub_cache)
+    if (pub_cache / ".ready").exists():
+        os.utime(pub_cache)
+        if run([flutter, "pub", "get", "--offline"], cwd=flutter_dir, check=False).returncode == 0:
+            return
+        log("offline pub get failed, refreshing the pub cache")
+    run([flutter, "pub", "get"], cwd=flutter_dir)
+    (pub_cache / ".ready").touch()
+    _prune_dep_caches(caches, pub_cache)
+
+
+# secrets that end up compiled into the binary; everything else (custom_.txt,
+# logo, output name) is applied to a cached base build as an overlay
+CODE_FIELDS = (
+    "server",
+    "key",
+    "apiServer",
+    "appname",
+    "urlLink",
+    "downloadLink",
+    "delayFix",
+    "cycleMonitor",
+    "xOffline",
+    "removeNewVersionNotif",
+    "compname",
+    "androidappid",
+)
+
+
+def _digest_file(path):
+    if not path or not Path(path).exists():
+        return "none"
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def compute_base_key(commit, secrets, filename, icon_path, patch_files):
+    inputs = {field: secrets.get(field, "") for field in CODE_FIELDS}
+    appname = secrets.get("appname", "rustdesk")
+    if appname and appname.lower() != "rustdesk":
+        # Runner.rc gets the exe name when the app is renamed
+        inputs["filename"] = filename
+    inputs["commit"] = commit
+    inputs["icon"] = _digest_file(icon_path)
+    # patch files and this script define how the sources get rewritten
+    inputs["patches"] = {Path(p).name: _digest_file(p) for p in patch_files}
+    inputs["script"] = _digest_file(__file__)
+    canonical = json.dumps(inputs, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def store_base(rustdesk_dir, base_root, base_key):
+    base_root.mkdir(parents=True, exist_ok=True)
+    staging = base_root / f".{base_key}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    shutil.copytree(rustdesk_dir, staging)
+    try:
+        os.replace(staging, base_root / base_key)
+    except OSError:
+        # another build stored the same base first
+        shutil.rmtree(staging, ignore_errors=True)
+    keep = int(os.environ.get("LOCAL_BUILD_BASE_CACHE_SIZE", "10"))
+    bases = sorted(
+        (entry for entry in base_root.iterdir() if entry.is_dir() and not entry.name.startswith(".")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for stale in bases[keep:]:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+def asset_path(dce_root, secrets, link, uuid):
+    # matrix builds keep the icon and logo in one folder shared by all platforms
+    asset_uuid = secrets.get(f"{link}_uuid", "false")
+    asset_file = secrets.get(f"{link}_file", "false")
+    if asset_uuid == "false" or asset_file == "false":
+        asset_uuid = uuid
+        asset_file = "icon.png" if link == "iconlink" else "logo.png"
+    return dce_root / "png" / asset_uuid / asset_file
+
+
+def icon_bundle_path(secrets):
+    icon_hash = secrets.get("iconlink_hash", "")
+    assets_root = os.environ.get("DCE_ICON_ASSETS_DIR", "")
+    if not icon_hash or not assets_root:
+        return None
+    bundle = Path(assets_root) / icon_hash / "bundle.zip"
+    return bundle if bundle.is_file() else None
+
+
+def write_report(report):
+    log(f"build report: {json.dumps(report)}")
+    report_path = os.environ.get("DCE_REPORT_PATH", "")
+    if report_path:
+        Path(report_path).write_text(json.dumps(report, indent=2), encoding="utf-8")
 
 
 def main():
@@ -119,24 +853,19 @@ def main():
     update_status("local build started")
 
     if platform != "windows":
-        update_status("local build supports windows only")
-        sys.exit(1)
+        fail("local build supports windows only")
 
     if not zip_path.exists():
-        update_status("zip not found")
-        sys.exit(1)
+        fail("zip not found")
 
     if not zip_password:
-        update_status("ZIP_PASSWORD missing")
-        sys.exit(1)
+        fail("ZIP_PASSWORD missing")
 
     if not rustdesk_src.exists():
-        update_status("RUSTDESK_SRC missing")
-        sys.exit(1)
+        fail("RUSTDESK_SRC missing")
 
     if not shutil.which("git"):
-        update_status("git not found")
-        sys.exit(1)
+        fail("git not found")
 
     update_status("decrypting config")
     try:
@@ -145,104 +874,49 @@ def main():
             with zf.open("secrets.json") as handle:
                 secrets = json.load(handle)
     except Exception as exc:
-        update_status(f"zip decrypt failed: {exc}")
-        sys.exit(1)
+        fail(f"zip decrypt failed: {exc}")
+    # matrix builds share one bundle, values that differ per platform sit under "platforms"
+    secrets.update(secrets.pop("platforms", {}).get(platform, {}))
 
-    version = secrets.get("version", "master")
-    server = secrets.get("server", "rs-ny.rustdesk.com")
-    key = secrets.get("key", "OeVuKk5nlHiXp+APNn0Y3pC1Iwpwn44JGqrQCsWqmBw=")
-    api_server = secrets.get("apiServer", "https://admin.rustdesk.com")
+    version = secrets.get("version", os.environ.get("DCE_VERSION", "master"))
     custom_b64 = secrets.get("custom", "")
     appname = secrets.get("appname", "rustdesk")
-    url_link = secrets.get("urlLink", "https://rustdesk.com")
-    download_link = secrets.get("downloadLink", "https://rustdesk.com/download")
-    delay_fix = secrets.get("delayFix", "false") == "true"
     cycle_monitor = secrets.get("cycleMonitor", "false") == "true"
     x_offline = secrets.get("xOffline", "false") == "true"
-    remove_new_version = secrets.get("removeNewVersionNotif", "false") == "true"
-    compname = secrets.get("compname", "Purslane Ltd")
 
     update_status("preparing source")
-    worktree_root = Path(os.environ.get("LOCAL_BUILD_WORKTREE_ROOT", "")).resolve()
-    if not str(worktree_root) or str(worktree_root) == ".":
-        worktree_root = dce_root / "local_builds"
+    worktree_root = worktree_root_for(dce_root)
     worktree_root.mkdir(parents=True, exist_ok=True)
-    worktree_dir = worktree_root / uuid
 
-    if worktree_dir.exists():
-        update_status("worktree already exists")
-        sys.exit(1)
+    source_repo, ref = resolve_source(rustdesk_src, worktree_root, version, load_ref_index(worktree_root))
+    if ref is None:
+        fail(f"RustDesk version {version} not found")
+    worktree_dir = acquire_worktree(source_repo, worktree_root, version, ref, uuid)
+    configure_compiler_cache(worktree_root)
 
-    ref = resolve_git_ref(rustdesk_src, version)
-    run(["git", "-C", str(rustdesk_src), "worktree", "add", "--detach", str(worktree_dir), ref])
+    # pin the commit, the patch cache and the base key are keyed by it
+    commit = subprocess.run(
+        ["git", "-C", str(worktree_dir), "rev-parse", "HEAD"], capture_output=True, text=True
+    ).stdout.strip()
 
     update_status("applying patches")
-    allow_custom = dce_root / ".github" / "patches" / "allowCustom.py"
-    if not allow_custom.exists():
-        update_status("allowCustom.py missing")
-        sys.exit(1)
-    run([sys.executable, str(allow_custom)], cwd=worktree_dir)
-
-    remove_setup = dce_root / ".github" / "patches" / "removeSetupServerTip.diff"
-    apply_patch_if_needed(worktree_dir, remove_setup, required=False)
-
+    patches_dir = dce_root / ".github" / "patches"
+    patch_files = [patches_dir / "removeSetupServerTip.diff"]
     if cycle_monitor:
-        apply_patch_if_needed(worktree_dir, dce_root / ".github" / "patches" / "cycle_monitor.diff", required=False)
+        patch_files.append(patches_dir / "cycle_monitor.diff")
     if x_offline:
-        apply_patch_if_needed(worktree_dir, dce_root / ".github" / "patches" / "xoffline.diff", required=False)
+        patch_files.append(patches_dir / "xoffline.diff")
+    apply_patches(worktree_dir, source_repo, commit, patch_files, _patch_cache_path(worktree_root))
 
-    replace_in_file(worktree_dir / "libs" / "hbb_common" / "src" / "config.rs", "rs-ny.rustdesk.com", server, required=True)
-    replace_in_file(worktree_dir / "libs" / "hbb_common" / "src" / "config.rs", "OeVuKk5nlHiXp+APNn0Y3pC1Iwpwn44JGqrQCsWqmBw=", key, required=True)
-    replace_in_file(worktree_dir / "src" / "common.rs", "https://admin.rustdesk.com", api_server, required=False)
+    rewrites = apply_rewrites(worktree_dir, rewrite_plan(secrets, filename))
 
-    if delay_fix:
-        replace_in_file(worktree_dir / "src" / "client.rs", "!key.is_empty()", "false", required=False)
-
-    if remove_new_version:
-        replace_in_file(worktree_dir / "flutter" / "lib" / "desktop" / "pages" / "desktop_home_page.dart", "updateUrl.isNotEmpty", "false", required=False)
-        remove_update_block(worktree_dir / "src" / "common.rs")
-
-    if url_link != "https://rustdesk.com":
-        replace_in_file(worktree_dir / "build.py", "Homepage: https://rustdesk.com", f"Homepage: {url_link}", required=False)
-        replace_in_file(worktree_dir / "flutter" / "lib" / "common.dart", "launchUrl(Uri.parse('https://rustdesk.com'));", f"launchUrl(Uri.parse('{url_link}'));", required=False)
-        replace_in_file(worktree_dir / "flutter" / "lib" / "desktop" / "pages" / "desktop_setting_page.dart", "launchUrlString('https://rustdesk.com');", f"launchUrlString('{url_link}');", required=False)
-        replace_in_file(worktree_dir / "flutter" / "lib" / "desktop" / "pages" / "desktop_setting_page.dart", "launchUrlString('https://rustdesk.com/privacy.html')", f"launchUrlString('{url_link}/privacy.html')", required=False)
-        replace_in_file(worktree_dir / "flutter" / "lib" / "mobile" / "pages" / "settings_page.dart", "const url = 'https://rustdesk.com/';", f"const url = '{url_link}';", required=False)
-        replace_in_file(worktree_dir / "flutter" / "lib" / "mobile" / "pages" / "settings_page.dart", "launchUrlString('https://rustdesk.com/privacy.html')", f"launchUrlString('{url_link}/privacy.html')", required=False)
-        replace_in_file(worktree_dir / "flutter" / "lib" / "desktop" / "pages" / "install_page.dart", "https://rustdesk.com/privacy.html", f"{url_link}/privacy.html", required=False)
-
-    if download_link != "https://rustdesk.com/download":
-        replace_in_file(worktree_dir / "flutter" / "lib" / "desktop" / "pages" / "desktop_home_page.dart", "https://rustdesk.com/download", download_link, required=False)
-        replace_in_file(worktree_dir / "flutter" / "lib" / "mobile" / "pages" / "connection_page.dart", "https://rustdesk.com/download", download_link, required=False)
-        replace_in_file(worktree_dir / "src" / "ui" / "index.tis", "https://rustdesk.com/download", download_link, required=False)
-
-    if appname and appname.lower() != "rustdesk":
-        replace_in_file(worktree_dir / "Cargo.toml", "description = \"RustDesk Remote Desktop\"", f"description = \"{appname}\"", required=False)
-        replace_in_file(worktree_dir / "Cargo.toml", "ProductName = \"RustDesk\"", f"ProductName = \"{appname}\"", required=False)
-        replace_in_file(worktree_dir / "Cargo.toml", "FileDescription = \"RustDesk Remote Desktop\"", f"FileDescription = \"{appname}\"", required=False)
-        replace_in_file(worktree_dir / "Cargo.toml", "OriginalFilename = \"rustdesk.exe\"", f"OriginalFilename = \"{appname}.exe\"", required=False)
-        replace_in_file(worktree_dir / "libs" / "portable" / "Cargo.toml", "description = \"RustDesk Remote Desktop\"", f"description = \"{appname}\"", required=False)
-        replace_in_file(worktree_dir / "libs" / "portable" / "Cargo.toml", "ProductName = \"RustDesk\"", f"ProductName = \"{appname}\"", required=False)
-        replace_in_file(worktree_dir / "libs" / "portable" / "Cargo.toml", "FileDescription = \"RustDesk Remote Desktop\"", f"FileDescription = \"{appname}\"", required=False)
-        replace_in_file(worktree_dir / "libs" / "portable" / "Cargo.toml", "OriginalFilename = \"rustdesk.exe\"", f"OriginalFilename = \"{appname}.exe\"", required=False)
-        replace_in_file(worktree_dir / "flutter" / "windows" / "runner" / "Runner.rc", "\"RustDesk Remote Desktop\"", f"\"{appname}\"", required=False)
-        replace_in_file(worktree_dir / "flutter" / "windows" / "runner" / "Runner.rc", "\"rustdesk.exe\"", f"\"{filename}.exe\"", required=False)
-        replace_in_file(worktree_dir / "flutter" / "windows" / "runner" / "Runner.rc", "\"RustDesk\"", f"\"{appname}\"", required=False)
-        lang_dir = worktree_dir / "src" / "lang"
-        if lang_dir.exists():
-            for lang_file in lang_dir.rglob("*.rs"):
-                replace_in_file(lang_file, "RustDesk", appname, required=False)
-
-    if compname and compname != "Purslane Ltd":
-        replace_in_file(worktree_dir / "flutter" / "lib" / "desktop" / "pages" / "desktop_setting_page.dart", "Purslane Ltd", compname, required=False)
-        replace_in_file(worktree_dir / "res" / "msi" / "preprocess.py", "Purslane Ltd", compname, required=False)
-        replace_in_file(worktree_dir / "res" / "msi" / "preprocess.py", "PURSLANE", compname, required=False)
-        replace_in_file(worktree_dir / "flutter" / "windows" / "runner" / "Runner.rc", "Purslane Ltd", compname, required=False)
-        replace_in_file(worktree_dir / "Cargo.toml", "Purslane Ltd", compname, required=False)
-        replace_in_file(worktree_dir / "libs" / "portable" / "Cargo.toml", "Purslane Ltd", compname, required=False)
-
-    icon_path = dce_root / "png" / uuid / "icon.png"
-    if icon_path.exists():
+    icon_path = asset_path(dce_root, secrets, "iconlink", uuid)
+    icon_bundle = icon_bundle_path(secrets)
+    if icon_path.exists() and icon_bundle:
+        # ico, tray icon, png ladder, app_icon.ico and icon.svg rendered by the generator
+        with zipfile.ZipFile(icon_bundle) as bundle:
+            bundle.extractall(worktree_dir)
+    elif icon_path.exists():
         res_dir = worktree_dir / "res"
         res_dir.mkdir(parents=True, exist_ok=True)
         shutil.copyfile(icon_path, res_dir / "icon.png")
@@ -254,31 +928,57 @@ def main():
             run([magick, str(res_dir / "icon.png"), "-resize", "64x64", str(res_dir / "64x64.png")])
             run([magick, str(res_dir / "icon.png"), "-resize", "128x128", str(res_dir / "128x128.png")])
             run([magick, str(res_dir / "128x128.png"), "-resize", "200%", str(res_dir / "128x128@2x.png")])
+
+    rustdesk_dir = worktree_dir / "rustdesk"
+    if rustdesk_dir.exists():
+        fail("rustdesk output already exists")
+
+    base_key = compute_base_key(commit, secrets, filename, icon_path, patch_files)
+    base_root = worktree_root / "base"
+    report = {
+        "uuid": uuid,
+        "version": version,
+        "commit": commit,
+        "base_key": base_key,
+        "overlay": ["custom_.txt", "logo.png", "exe name"],
+        "rewrites": rewrites,
+        "commands": COMMANDS,
+    }
+
+    if (base_root / base_key).is_dir():
+        # same version and compiled-in options as an earlier build, only the
+        # overlay and packaging below are specific to this client
+        report["path"] = "overlay"
+        update_status("reusing cached base build")
+        shutil.copytree(base_root / base_key, rustdesk_dir)
+    else:
+        report["path"] = "full"
         flutter = shutil.which("flutter")
         if flutter:
-            run([flutter, "pub", "get"], cwd=worktree_dir / "flutter")
+            # build.py's own pub get then resolves from the same cache
+            flutter_pub_get(flutter, worktree_dir / "flutter", worktree_root)
+        if icon_path.exists() and flutter and not icon_bundle:
             run([flutter, "pub", "run", "flutter_launcher_icons"], cwd=worktree_dir / "flutter")
 
-    update_status("building rustdesk")
-    run([sys.executable, "build.py", "--portable", "--hwcodec", "--flutter", "--vram", "--skip-portable-pack"], cwd=worktree_dir)
-
-    release_dir = worktree_dir / "flutter" / "build" / "windows" / "x64" / "runner" / "Release"
-    if not release_dir.exists():
-        update_status("build output missing")
-        sys.exit(1)
+        update_status("building rustdesk")
+        run([sys.executable, "build.py", "--portable", "--hwcodec", "--flutter", "--vram", "--skip-portable-pack"], cwd=worktree_dir)
 
-    rustdesk_dir = worktree_dir / "rustdesk"
-    if rustdesk_dir.exists():
-        update_status("rustdesk output already exists")
-        sys.exit(1)
-    shutil.move(str(release_dir), str(rustdesk_dir))
+        release_dir = worktree_dir / "flutter" / "build" / "windows" / "x64" / "runner" / "Release"
+        if not release_dir.exists():
+            fail("build output missing")
+        shutil.move(str(release_dir), str(rustdesk_dir))
 
-    if icon_path.exists() and shutil.which("magick"):
         assets_dir = rustdesk_dir / "data" / "flutter_assets" / "assets"
-        assets_dir.mkdir(parents=True, exist_ok=True)
-        run(["magick", str(icon_path), str(assets_dir / "icon.svg")])
+        if icon_path.exists() and icon_bundle:
+            assets_dir.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(worktree_dir / "dce_assets" / "icon.svg", assets_dir / "icon.svg")
+        elif icon_path.exists() and shutil.which("magick"):
+            assets_dir.mkdir(parents=True, exist_ok=True)
+            run(["magick", str(icon_path), str(assets_dir / "icon.svg")])
 
-    logo_path = dce_root / "png" / uuid / "logo.png"
+        store_base(rustdesk_dir, base_root, base_key)
+
+    logo_path = asset_path(dce_root, secrets, "logolink", uuid)
     if logo_path.exists():
         assets_dir = rustdesk_dir / "data" / "flutter_assets" / "assets"
         assets_dir.mkdir(parents=True, exist_ok=True)
@@ -293,24 +993,54 @@ def main():
 
     update_status("packaging exe")
     portable_dir = worktree_dir / "libs" / "portable"
-    run([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"], cwd=portable_dir)
-    run([sys.executable, "generate.py", "-f", str(rustdesk_dir), "-o", ".", "-e", str(rustdesk_dir / f"{appname}.exe")], cwd=portable_dir)
+    python = portable_python(worktree_root, portable_dir)
+    run([str(python), "generate.py", "-f", str(rustdesk_dir), "-o", ".", "-e", str(rustdesk_dir / f"{appname}.exe")], cwd=portable_dir)
 
     packer_exe = portable_dir / "target" / "release" / "rustdesk-portable-packer.exe"
     if not packer_exe.exists():
-        update_status("portable packer missing")
-        sys.exit(1)
+        fail("portable packer missing")
 
     output_dir.mkdir(parents=True, exist_ok=True)
     shutil.copyfile(packer_exe, output_dir / f"{filename}.exe")
 
-    if zip_path.exists():
-        zip_path.unlink()
-
+    write_report(report)
     update_status("success")
 
 
+def prime_main(versions):
+    dce_root = Path(os.environ.get("DCE_ROOT", ".")).resolve()
+    rustdesk_src = Path(os.environ.get("RUSTDESK_SRC", "")).resolve()
+    worktree_root = worktree_root_for(dce_root)
+    conflicts = prime_patch_cache(dce_root, rustdesk_src, worktree_root, versions)
+    for conflict in conflicts:
+        log(f"patch conflict: {conflict}")
+    return 1 if conflicts else 0
+
+
+def mirror_main(versions):
+    dce_root = Path(os.environ.get("DCE_ROOT", ".")).resolve()
+    rustdesk_src = Path(os.environ.get("RUSTDESK_SRC", "")).resolve()
+    worktree_root = worktree_root_for(dce_root)
+    worktree_root.mkdir(parents=True, exist_ok=True)
+    refs = refresh_mirror(rustdesk_src, worktree_root)
+    log(f"ref index: {len(refs)} refs, master at {refs.get('master', 'none')[:12]}")
+    missing = [version for version in versions if version not in refs]
+    for version in missing:
+        log(f"version not in the mirror: {version}")
+    return 1 if missing else 0
+
+
 if __name__ == "__main__":
+    # "--prime-patches <version>...": fill the patch cache and report patches
+    # that no longer apply, before any build needs them
+    if sys.argv[1:2] == ["--prime-patches"]:
+        sys.exit(prime_main(sys.argv[2:]))
+    # "--refresh-mirror <version>...": fetch the mirror, rewrite the ref index
+    # and report form versions it doesn't have
+    if sys.argv[1:2] == ["--refresh-mirror"]:
+        sys.exit(mirror_main(sys.argv[2:]))
+    # a cancel sends SIGTERM, exit through atexit so the warm slot lock is released
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
     try:
         main()
     except Exception as exc:
@@ -91,6 +91,11 @@ $pythonExe = Join-Path $venv "Scripts\\python.exe"
 & $pythonExe -m pip install -r (Join-Path $repoRoot "requirements.txt")
 & $pythonExe (Join-Path $repoRoot "manage.py") migrate
 
+$builderLog = Join-Path $repoRoot "localbuildd.log"
+$builderErr = Join-Path $repoRoot "localbuildd.err.log"
+Write-Host "Starting local build pool..."
+Start-Process $pythonExe -ArgumentList "`"$(Join-Path $repoRoot 'manage.py')`" localbuildd" -WorkingDirectory $repoRoot -RedirectStandardOutput $builderLog -RedirectStandardError $builderErr | Out-Null
+
 Write-Host "Public URL: $publicUrl"
 Write-Host "Starting server..."
 & $pythonExe (Join-Path $repoRoot "manage.py") runserver 0.0.0.0:8000
@@ -0,0 +1,68 @@
+#!/usr/bin/env bash
+# Resumable upload of a build artifact to the dce server.
+#
+#   upload_artifact.sh <file> <uuid> <server url> [token]
+#
+# Opens (or resumes) an upload session, PUTs the missing bytes in chunks and
+# commits with the file's sha256, which the server verifies before publishing
+# the file. A failed chunk is retried from the offset the server reports, so a
+# flaky runner link doesn't restart a few hundred MB from zero.
+set -euo pipefail
+
+file="$1"
+uuid="$2"
+url="$3"
+token="${4:-}"
+chunk=$((8 * 1024 * 1024))
+max_failures=10
+
+name=$(basename "$file")
+size=$(wc -c < "$file" | tr -d ' ')
+if command -v sha256sum > /dev/null; then
+  sha=$(sha256sum "$file" | cut -d' ' -f1)
+else
+  sha=$(shasum -a 256 "$file" | cut -d' ' -f1)
+fi
+auth=(-H "Authorization: Bearer $token")
+
+json_field() {
+  sed -n "s/.*\"$1\": *\"\{0,1\}\([^,\"}]*\).*/\1/p"
+}
+
+reply=$(curl -sSf --retry 5 "${auth[@]}" -H "Content-Type: application/json" \
+  -d "{\"uuid\": \"$uuid\", \"name\": \"$name\", \"size\": $size, \"sha256\": \"$sha\"}" \
+  "$url/upload_start")
+upload_id=$(echo "$reply" | json_field upload_id)
+offset=$(echo "$reply" | json_field offset)
+echo "uploading $name ($size bytes) as $upload_id from offset $offset"
+
+tmp=$(mktemp)
+trap 'rm -f "$tmp"' EXIT
+
+failures=0
+while [ "$offset" -lt "$size" ]; do
+  # head stops reading after one chunk and tail dies of SIGPIPE, which pipefail
+  # would report as a failed upload; curl's own status is what counts
+  { tail -c +$((offset + 1)) "$file" || true; } | head -c "$chunk" > "$tmp"
+  if reply=$(curl -sSf "${auth[@]}" -X PUT \
+      -H "Content-Type: application/octet-stream" --data-binary @"$tmp" \
+      "$url/upload_chunk?upload_id=$upload_id&offset=$offset"); then
+    offset=$(echo "$reply" | json_field offset)
+    failures=0
+  else
+    failures=$((failures + 1))
+    if [ "$failures" -ge "$max_failures" ]; then
+      echo "giving up on $name at offset $offset" >&2
+      exit 1
+    fi
+    sleep $((failures * 5))
+    # carry on from whatever the server actually has
+    if reply=$(curl -sSf "${auth[@]}" "$url/upload_status?upload_id=$upload_id"); then
+      offset=$(echo "$reply" | json_field offset)
+    fi
+  fi
+done
+
+curl -sSf --retry 5 "${auth[@]}" -H "Content-Type: application/json" \
+  -d "{\"upload_id\": \"$upload_id\"}" "$url/upload_commit"
+echo